@@ -0,0 +1,160 @@
+"""
+Search condensation trade-off report. For each query, searches once and answers
+twice with the main model: once from the raw fetched pages and once from the
+fact lists the search model condensed them into (condense_search_results).
+Reports main-model prompt tokens, end-to-end latency including the condense
+step, and how many sources survive condensation and get cited in the answer.
+
+Needs a running Ollama server with the configured models and network access.
+
+Usage (from the project root):
+    python benchmarks/bench_condense.py ["query" ...]
+"""
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from config import get_config  # noqa: E402
+from engine import AIEngine  # noqa: E402
+from memory import Memory  # noqa: E402
+from search import (  # noqa: E402
+    SearchEngine,
+    format_condensed_context,
+    format_search_context,
+)
+
+QUERIES = [
+    "latest stable Python release and its headline features",
+    "current population of Tokyo metropolitan area",
+    "what changed in SQLite 3.45",
+]
+
+URL_PATTERN = re.compile(r"https?://[^\s)\]>]+")
+
+
+def answer(
+    ai: AIEngine, system: str, query: str, context: str
+) -> tuple[str, int | None, float, float]:
+    """
+    Answers a query from a search context with the main model
+
+    Returns:
+        Response text, prompt tokens, seconds to first token and seconds in total
+    """
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": query},
+        {"role": "user", "content": Memory.format_search_message(context)},
+    ]
+
+    content: list[str] = []
+    prompt_tokens = None
+    first_token = 0.0
+
+    start = time.perf_counter()
+    for chunk in ai.get_response_stream(messages):
+        msg = chunk.get("message", {})
+        if msg.get("content"):
+            if not content:
+                first_token = time.perf_counter() - start
+            content.append(msg["content"])
+        if chunk.get("done"):
+            prompt_tokens = chunk.get("prompt_eval_count")
+
+    return "".join(content), prompt_tokens, first_token, time.perf_counter() - start
+
+
+def cited(text: str, urls: set[str]) -> int:
+    """Number of source URLs that appear in a text"""
+    found = {url.rstrip(".,;") for url in URL_PATTERN.findall(text)}
+    return len(urls & found)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Raw vs condensed search context")
+    parser.add_argument("queries", nargs="*", default=QUERIES)
+    args = parser.parse_args()
+
+    model_config, search_config, user_data, *_ = get_config()
+    ai = AIEngine(
+        model_config.main_model,
+        model_config.search_model,
+        keep_alive=model_config.keep_alive,
+        main_thinking=model_config.main_thinking,
+        search_thinking=model_config.search_thinking,
+        max_parallel_requests=model_config.max_parallel_requests,
+    )
+    search = SearchEngine(
+        search_config.search_engine,
+        user_agent=search_config.search_headers,
+        use_tor=search_config.use_tor,
+        tor_port=search_config.tor_port,
+    )
+    system = Memory.format_system_message(
+        model_config.initial_context,
+        model_config.system_instructions,
+        user_data.user_data,
+    )
+
+    totals = {"raw": [0, 0.0, 0], "condensed": [0, 0.0, 0]}
+    kept_total = sources_total = 0
+
+    print(
+        f"{'query':<40} {'mode':<10} {'prompt tok':>10} {'condense s':>10}"
+        f" {'first tok s':>11} {'total s':>8} {'sources kept':>12} {'cited':>6}"
+    )
+    for query in args.queries:
+        search_data = search.text_query(query)
+        pages = search_data["pages"]
+        urls = {page["url"] for page in pages if page["url"]}
+
+        raw_context = format_search_context(search_data["context"])
+
+        start = time.perf_counter()
+        facts = ai.condense_pages(pages, query)
+        condense_seconds = time.perf_counter() - start
+        condensed_context = format_search_context(
+            format_condensed_context(pages, facts)
+        )
+
+        kept = cited(condensed_context, urls)
+        kept_total += kept
+        sources_total += len(urls)
+
+        for mode, context, extra in (
+            ("raw", raw_context, 0.0),
+            ("condensed", condensed_context, condense_seconds),
+        ):
+            response, prompt_tokens, first_token, total = answer(
+                ai, system, query, context
+            )
+            citations = cited(response, urls)
+
+            totals[mode][0] += prompt_tokens or 0
+            totals[mode][1] += extra + total
+            totals[mode][2] += citations
+
+            print(
+                f"{query[:40]:<40} {mode:<10} {prompt_tokens or 0:>10} {extra:>10.2f}"
+                f" {extra + first_token:>11.2f} {extra + total:>8.2f}"
+                f" {(kept if mode == 'condensed' else len(urls)):>6}/{len(urls):<5} {citations:>6}"
+            )
+
+    raw, condensed = totals["raw"], totals["condensed"]
+    print()
+    print(
+        f"prompt tokens   raw {raw[0]:>8}  condensed {condensed[0]:>8}"
+        f"  ({condensed[0] / max(raw[0], 1):.0%} of raw)"
+    )
+    print(f"end-to-end s    raw {raw[1]:>8.2f}  condensed {condensed[1]:>8.2f}")
+    print(f"sources cited   raw {raw[2]:>8}  condensed {condensed[2]:>8}")
+    print(f"sources kept in condensed context: {kept_total}/{sources_total}")
+
+
+if __name__ == "__main__":
+    main()
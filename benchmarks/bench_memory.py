@@ -0,0 +1,126 @@
+"""
+Memory write benchmark. Compares message inserts per second under the original
+storage profile (rollback journal, a commit for the INSERT and another for the
+chat date UPDATE) with the current Memory profile (WAL, tuned pragmas, one
+commit per message and one per grouped turn). The write-behind row is the time
+the caller spends handing messages over; the writer thread commits them in
+batches with synchronous=FULL.
+
+Usage (from the project root):
+    python benchmarks/bench_memory.py [--turns 200]
+"""
+
+import argparse
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from memory import Memory  # noqa: E402
+
+CONTENT = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 20
+
+
+def bench_legacy(db_path: Path, turns: int) -> float:
+    """Original profile: default journal, two commits per message"""
+    db = sqlite3.connect(db_path)
+    cursor = db.cursor()
+    cursor.execute(
+        "CREATE TABLE chats(id INTEGER PRIMARY KEY, created, updated, title)"
+    )
+    cursor.execute("CREATE TABLE chat_history(id, created, role, content, visible)")
+    cursor.execute("INSERT INTO chats (created, title) VALUES (?, ?)", ("now", "bench"))
+    db.commit()
+
+    start = time.perf_counter()
+    for _ in range(turns):
+        for role, visible in (("user", 1), ("user", 0), ("assistant", 1)):
+            cursor.execute(
+                "INSERT INTO chat_history VALUES (?,?,?,?,?)",
+                (1, datetime.now(), role, CONTENT, visible),
+            )
+            db.commit()
+            cursor.execute("UPDATE chats SET updated = ? WHERE id=?", ("now", 1))
+            db.commit()
+    elapsed = time.perf_counter() - start
+
+    db.close()
+    return elapsed
+
+
+def bench_memory(db_path: Path, turns: int, grouped: bool) -> float:
+    """Current profile, optionally grouping each turn into one transaction"""
+    memory = Memory(db_path)
+    memory.create_conversation("bench")
+
+    start = time.perf_counter()
+    for _ in range(turns):
+        if grouped:
+            with memory.transaction():
+                memory.add_user_message(CONTENT)
+                memory.add_search_message(CONTENT)
+                memory.add_assistant_message(CONTENT)
+        else:
+            memory.add_user_message(CONTENT)
+            memory.add_search_message(CONTENT)
+            memory.add_assistant_message(CONTENT)
+    elapsed = time.perf_counter() - start
+
+    memory.db.close()
+    return elapsed
+
+
+def bench_write_behind(db_path: Path, turns: int) -> float:
+    """Write-behind queue, timing the caller only"""
+    memory = Memory(db_path, write_behind=True)
+    memory.create_conversation("bench")
+
+    start = time.perf_counter()
+    for _ in range(turns):
+        memory.add_user_message(CONTENT)
+        memory.add_search_message(CONTENT)
+        memory.add_assistant_message(CONTENT)
+    elapsed = time.perf_counter() - start
+
+    memory.close()
+    memory.db.close()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark Memory inserts")
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+
+    messages = args.turns * 3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            "legacy (rollback journal, 2 commits/message)": bench_legacy(
+                Path(tmp) / "legacy.db", args.turns
+            ),
+            "WAL, 1 commit/message": bench_memory(
+                Path(tmp) / "wal.db", args.turns, grouped=False
+            ),
+            "WAL, 1 commit/turn": bench_memory(
+                Path(tmp) / "grouped.db", args.turns, grouped=True
+            ),
+            "write-behind, caller side": bench_write_behind(
+                Path(tmp) / "behind.db", args.turns
+            ),
+        }
+
+    baseline = next(iter(results.values()))
+    for name, elapsed in results.items():
+        print(
+            f"{name:<46} {messages / elapsed:>10.0f} inserts/s"
+            f"  ({baseline / elapsed:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
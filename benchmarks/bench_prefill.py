@@ -0,0 +1,139 @@
+"""
+Prefill benchmark. Measures time to first token of the first reply after a
+chat is loaded, with and without the background prefill that /load and /new
+start (prefill_cache). Before each run an unrelated request replaces Ollama's
+KV cache, as the previous chat would.
+
+Needs a running Ollama server with the configured main model. Prefill only
+helps if the search decision does not evict the cache first, so configure a
+separate search_model or set max_parallel_requests to match OLLAMA_NUM_PARALLEL.
+
+Usage (from the project root):
+    python benchmarks/bench_prefill.py [--chat-id ID | --turns 20] [--runs 3]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from config import get_config  # noqa: E402
+from engine import AIEngine  # noqa: E402
+from memory import Memory  # noqa: E402
+
+FILLER = (
+    "Write-ahead logging lets readers continue while a writer appends to the log. " * 12
+)
+
+QUESTION = {"role": "user", "content": "Summarize our discussion in one sentence."}
+
+
+def synthetic_history(system: str, turns: int) -> list[dict[str, str]]:
+    """A chat of the given number of turns with about 200 tokens per message"""
+    history = [{"role": "system", "content": system}]
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Question {i}: {FILLER}"})
+        history.append({"role": "assistant", "content": f"Answer {i}: {FILLER}"})
+    return history
+
+
+def evict(ai: AIEngine) -> None:
+    """Replaces the cached prompt with an unrelated one"""
+    ai.client.chat(
+        model=ai.model,
+        messages=[{"role": "user", "content": f"Say {time.time()}"}],
+        options={**ai.engine_options, "num_predict": 1},
+        keep_alive=ai.keep_alive,
+    )
+
+
+def first_token(ai: AIEngine, messages: list) -> tuple[float, int | None]:
+    """
+    Sends messages for a one-token reply
+
+    Returns:
+        Seconds to the first token and prompt tokens Ollama evaluated
+    """
+    start = time.perf_counter()
+    stream = ai.client.chat(
+        model=ai.model,
+        messages=messages,
+        options={**ai.engine_options, "num_predict": 1},
+        stream=True,
+        keep_alive=ai.keep_alive,
+        think=False,
+    )
+
+    ttft = 0.0
+    evaluated = None
+    for chunk in stream:
+        if not ttft and chunk["message"].get("content"):
+            ttft = time.perf_counter() - start
+        if chunk.get("done"):
+            evaluated = chunk.get("prompt_eval_count")
+
+    return ttft or time.perf_counter() - start, evaluated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="TTFT with and without prefill")
+    parser.add_argument("--chat-id", type=int, help="Stored chat to load")
+    parser.add_argument("--turns", type=int, default=20, help="Synthetic chat length")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    model_config, _, user_data, *_ = get_config()
+    ai = AIEngine(
+        model_config.main_model,
+        model_config.search_model,
+        keep_alive=model_config.keep_alive,
+        main_thinking=False,
+        search_thinking=model_config.search_thinking,
+        max_parallel_requests=model_config.max_parallel_requests,
+    )
+
+    if args.chat_id is not None:
+        memory = Memory()
+        memory.set_current_id(args.chat_id)
+        history = list(memory.get_llm_formatted_chat_history())
+        memory.close()
+    else:
+        system = Memory.format_system_message(
+            model_config.initial_context,
+            model_config.system_instructions,
+            user_data.user_data,
+        )
+        history = synthetic_history(system, args.turns)
+
+    # Loads the model so neither mode pays for it
+    evict(ai)
+
+    results: dict[str, list[tuple[float, int | None]]] = {"cold": [], "prefilled": []}
+    prefill_seconds: list[float] = []
+
+    for _ in range(args.runs):
+        evict(ai)
+        results["cold"].append(first_token(ai, history + [QUESTION]))
+
+        evict(ai)
+        start = time.perf_counter()
+        # Bypasses the same-model check in AIEngine.prefill; this run has no search decision
+        ai._prefill(history, "bench")
+        prefill_seconds.append(time.perf_counter() - start)
+        results["prefilled"].append(first_token(ai, history + [QUESTION]))
+
+    print(f"{len(history)} messages, median of {args.runs} runs")
+    for mode, runs in results.items():
+        ttft = statistics.median(seconds for seconds, _ in runs)
+        evaluated = statistics.median(tokens or 0 for _, tokens in runs)
+        print(
+            f"{mode:<10} TTFT {ttft:>7.2f} s   prompt tokens evaluated {evaluated:>7.0f}"
+        )
+    print(f"prefill    {statistics.median(prefill_seconds):>12.2f} s in the background")
+
+
+if __name__ == "__main__":
+    main()
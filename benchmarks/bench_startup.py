@@ -0,0 +1,82 @@
+"""
+Startup benchmark. Guards against heavy search/extraction libraries creeping
+back into the import path of the interactive client.
+
+Usage (from the project root):
+    python benchmarks/bench_startup.py [--max-import-ms 1500]
+
+Exits with a non-zero status if a deferred module is imported at startup or the
+import time budget is exceeded.
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+# Only needed once the first search runs, or when long-term memory is enabled
+DEFERRED_MODULES = ["trafilatura", "lxml", "bs4", "ddgs", "tavily", "requests", "numpy"]
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import main
+import_ms = (time.perf_counter() - start) * 1000
+
+loaded = [m for m in {deferred!r} if m in sys.modules]
+print(f"{{import_ms:.1f}} {{','.join(loaded)}}")
+"""
+
+
+def run_probe() -> tuple[float, list[str]]:
+    """Imports the client in a fresh interpreter and reports what it loaded"""
+    with tempfile.TemporaryDirectory() as tmp:
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(deferred=DEFERRED_MODULES)],
+            cwd=SRC_DIR,
+            env={"PYTHONPATH": str(SRC_DIR), "HOME": tmp},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+
+    loaded = output[1].split(",") if len(output) > 1 else []
+    return float(output[0]), loaded
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-import-ms", type=float, default=1500.0)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    import_times = []
+    loaded: list[str] = []
+
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        import_ms, loaded = run_probe()
+        import_times.append(import_ms)
+    wall = time.perf_counter() - start
+
+    best_import = min(import_times)
+    print(f"import main: best {best_import:.1f} ms, worst {max(import_times):.1f} ms")
+    print(f"{args.runs} cold interpreter starts in {wall:.2f} s")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: deferred modules imported at startup: {', '.join(loaded)}")
+        failed = True
+    if best_import > args.max_import_ms:
+        print(f"FAIL: import time exceeds {args.max_import_ms:.0f} ms budget")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
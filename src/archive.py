@@ -0,0 +1,186 @@
+"""
+Streaming export and import of conversation history as JSONL, one chat per line.
+Paths ending in .gz are gzip-compressed. Memory use stays flat however large the
+history is: export reads chats in keyset batches and import inserts them in
+batched transactions while reading the file line by line.
+
+Usage (from src/):
+    python archive.py export history.jsonl.gz
+    python archive.py import history.jsonl.gz --batch-size 500
+    python archive.py export - | gzip > history.jsonl.gz
+"""
+
+import argparse
+import gzip
+import io
+import json
+import sqlite3
+import sys
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Iterator, TextIO
+
+from exceptions import ArchiveFormatError
+from memory import Memory
+
+ARCHIVE_FIELDS = ("created", "title", "messages")
+MESSAGE_FIELDS = ("created", "role", "content", "visible")
+
+
+def open_archive(path: str | Path, mode: str) -> ContextManager[TextIO]:
+    """
+    Opens an archive for text reading or writing
+
+    Args:
+        path: File path. '.gz' selects gzip, '-' selects stdin or stdout
+        mode: 'r' or 'w'
+
+    Returns:
+        Context manager for a text stream. Standard streams are left open on exit
+    """
+    if str(path) == "-":
+        return nullcontext(sys.stdin if mode == "r" else sys.stdout)
+
+    if str(path).endswith(".gz"):
+        return gzip.open(path, f"{mode}t", encoding="utf-8", compresslevel=6)
+
+    return open(path, mode, encoding="utf-8", buffering=io.DEFAULT_BUFFER_SIZE * 16)
+
+
+def export_history(
+    memory: Memory,
+    path: str | Path,
+    batch_size: int = 100,
+    progress: Callable[[int], None] | None = None,
+) -> int:
+    """
+    Writes every chat to an archive
+
+    Args:
+        memory: Memory object to export from
+        path: Destination, see open_archive
+        batch_size: Chats read per query
+        progress: Called with the running total after each batch
+
+    Returns:
+        Number of chats exported
+    """
+    exported = 0
+
+    with open_archive(path, "w") as archive:
+        for chat in memory.iter_export(batch_size):
+            archive.write(json.dumps(chat, ensure_ascii=False))
+            archive.write("\n")
+
+            exported += 1
+            if progress and not exported % batch_size:
+                progress(exported)
+
+    if progress and exported % batch_size:
+        progress(exported)
+
+    return exported
+
+
+def read_archive(archive: TextIO) -> Iterator[dict[str, Any]]:
+    """
+    Parses an archive lazily, one chat per line
+
+    Args:
+        archive: Open text stream
+
+    Returns:
+        Iterator of chat records
+
+    Raises:
+        ArchiveFormatError: A line is not a valid chat record
+    """
+    for line_number, line in enumerate(archive, 1):
+        if not line.strip():
+            continue
+
+        try:
+            chat = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ArchiveFormatError(f"Line {line_number}: invalid JSON ({e.msg})")
+
+        if not isinstance(chat, dict) or any(
+            field not in chat for field in ARCHIVE_FIELDS
+        ):
+            raise ArchiveFormatError(f"Line {line_number}: not a chat record")
+
+        if not isinstance(chat["messages"], list) or not all(
+            _valid_message(message) for message in chat["messages"]
+        ):
+            raise ArchiveFormatError(f"Line {line_number}: malformed message")
+
+        yield chat
+
+
+def _valid_message(message: Any) -> bool:
+    """Whether a message has every field with the type import_chats stores"""
+    return (
+        isinstance(message, dict)
+        and all(field in message for field in MESSAGE_FIELDS)
+        and isinstance(message["content"], str)
+        and isinstance(message["role"], str)
+        and isinstance(message["visible"], (bool, int))
+    )
+
+
+def import_history(
+    memory: Memory,
+    path: str | Path,
+    batch_size: int = 100,
+    progress: Callable[[int], None] | None = None,
+) -> int:
+    """
+    Appends every chat in an archive as a new conversation
+
+    Args:
+        memory: Memory object to import into
+        path: Source, see open_archive
+        batch_size: Chats per transaction
+        progress: Called with the running total after each batch
+
+    Returns:
+        Number of chats imported
+
+    Raises:
+        ArchiveFormatError: A line is not a valid chat record. Batches before
+            it stay imported
+    """
+    with open_archive(path, "r") as archive:
+        return memory.import_chats(read_archive(archive), batch_size, progress)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Export or import conversation history as JSONL"
+    )
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("path", help="Archive path, '.gz' to compress, '-' for stdio")
+    parser.add_argument(
+        "--batch-size", type=int, default=500, help="Chats per query or transaction"
+    )
+    args = parser.parse_args()
+
+    def report(count: int) -> None:
+        print(f"\r{args.action.capitalize()}ed {count} chats", end="", file=sys.stderr)
+
+    memory = Memory()
+    action = export_history if args.action == "export" else import_history
+
+    try:
+        action(memory, args.path, args.batch_size, report)
+    except (ArchiveFormatError, OSError, UnicodeDecodeError, sqlite3.Error) as e:
+        print(f"\n{e}", file=sys.stderr)
+        return 1
+
+    print(file=sys.stderr)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""
+Headless batch mode. Runs prompts through the same classify -> search -> generate
+pipeline as the chat client, without the terminal UI, and streams one JSON result
+per prompt to stdout as each one completes.
+
+Input is JSONL ({"id": ..., "prompt": ...} or a JSON string per line) or plain
+text with one prompt per line, read from a file or stdin.
+
+Usage (from src/):
+    python batch.py prompts.jsonl --jobs 8 --ollama-concurrency 2 > results.jsonl
+    cat prompts.txt | python batch.py --save
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Iterator, NamedTuple, TextIO
+
+
+from config import get_config
+from engine import AIEngine
+from exceptions import SearchUnavailableError
+from memory import Memory
+from models import ModelConfig, UserData
+from search import SearchEngine, format_condensed_context, format_search_context
+
+
+class BatchJob(NamedTuple):
+    index: int
+    id: str
+    prompt: str
+
+
+def read_jobs(source: TextIO) -> Iterator[BatchJob]:
+    """
+    Reads prompts lazily so large inputs are never held in memory
+
+    Args:
+        source: Open file or stdin with one prompt per line
+
+    Returns:
+        Iterator of BatchJob
+    """
+    index = 0
+    for line in source:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            data = line
+
+        if isinstance(data, dict):
+            prompt = data["prompt"]
+            job_id = str(data.get("id", index))
+        else:
+            prompt = str(data)
+            job_id = str(index)
+
+        yield BatchJob(index, job_id, prompt)
+        index += 1
+
+
+class BatchRunner:
+    """Runs batch jobs with separate concurrency limits for Ollama and search"""
+
+    def __init__(
+        self,
+        ai: AIEngine,
+        search: SearchEngine,
+        model_config: ModelConfig,
+        user_data: UserData,
+        ollama_concurrency: int,
+        search_concurrency: int,
+    ) -> None:
+        self.ai = ai
+        self.search = search
+        self.model_config = model_config
+        self.user_data = user_data
+
+        self.ollama_slots = threading.BoundedSemaphore(ollama_concurrency)
+        self.search_slots = threading.BoundedSemaphore(search_concurrency)
+
+    def run(self, job: BatchJob) -> dict[str, Any]:
+        """
+        Runs a single prompt through the pipeline
+
+        Args:
+            job: Prompt to process
+
+        Returns:
+            Result record with the response, search details and per-stage timings
+        """
+        timings: dict[str, float] = {}
+        result: dict[str, Any] = {
+            "index": job.index,
+            "id": job.id,
+            "prompt": job.prompt,
+            "needs_search": False,
+            "search_term": None,
+            "search_queries": [],
+            "search_context": None,
+            "sources": [],
+            "thoughts": "",
+            "response": "",
+            "tokens": {},
+            "timings": timings,
+            "error": None,
+        }
+        started = time.perf_counter()
+
+        messages = [
+            {
+                "role": "system",
+                "content": Memory.format_system_message(
+                    self.model_config.initial_context,
+                    self.model_config.system_instructions,
+                    self.user_data.user_data,
+                ),
+            },
+            {"role": "user", "content": job.prompt},
+        ]
+
+        try:
+            stage = time.perf_counter()
+            with self.ollama_slots:
+                search_decision = self.ai.determine_search(
+                    messages, self.user_data, max_queries=self.search.max_queries
+                )
+            timings["classify"] = time.perf_counter() - stage
+
+            if search_decision["needs_search"]:
+                result["needs_search"] = True
+                result["search_term"] = search_decision["search_term"]
+                result["search_queries"] = search_decision["search_queries"]
+
+                stage = time.perf_counter()
+                with self.search_slots:
+                    search_data = self.search.text_query(
+                        search_decision["search_queries"]
+                    )
+                timings["search"] = time.perf_counter() - stage
+
+                result["sources"] = search_data["notifications"]
+                search_result = search_data["context"]
+
+                if self.model_config.condense_search_results and search_data["pages"]:
+                    stage = time.perf_counter()
+                    with self.ollama_slots:
+                        facts = self.ai.condense_pages(
+                            search_data["pages"],
+                            "; ".join(search_decision["search_queries"]),
+                        )
+                    search_result = format_condensed_context(
+                        search_data["pages"], facts
+                    )
+                    timings["condense"] = time.perf_counter() - stage
+
+                result["search_context"] = format_search_context(search_result)
+                messages.append(
+                    {
+                        "role": "user",
+                        "content": Memory.format_search_message(
+                            result["search_context"]
+                        ),
+                    }
+                )
+
+            stage = time.perf_counter()
+            thoughts: list[str] = []
+            content: list[str] = []
+            with self.ollama_slots:
+                for chunk in self.ai.get_response_stream(messages):
+                    msg = chunk.get("message", {})
+                    if msg.get("thinking"):
+                        thoughts.append(msg["thinking"])
+                    if msg.get("content"):
+                        if not content:
+                            timings["first_token"] = time.perf_counter() - stage
+                        content.append(msg["content"])
+                    if chunk.get("done"):
+                        result["tokens"] = {
+                            "prompt": chunk.get("prompt_eval_count"),
+                            "completion": chunk.get("eval_count"),
+                        }
+            timings["generate"] = time.perf_counter() - stage
+
+            result["thoughts"] = "".join(thoughts)
+            result["response"] = "".join(content)
+
+        except SearchUnavailableError as e:
+            result["error"] = f"Search failed: {e}"
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+
+        timings["total"] = time.perf_counter() - started
+
+        return result
+
+
+def save_result(
+    memory: Memory,
+    model_config: ModelConfig,
+    user_data: UserData,
+    result: dict[str, Any],
+) -> None:
+    """
+    Stores a completed result as a conversation so it can be loaded in the chat client
+
+    Args:
+        memory: Memory object owned by the calling thread
+        model_config: Model configuration
+        user_data: User data from config.toml
+        result: Result returned by BatchRunner.run
+    """
+    with memory.transaction():
+        memory.create_conversation(" ".join(result["prompt"].split()[:10]))
+        memory.add_system_message(
+            model_config.initial_context,
+            model_config.system_instructions,
+            user_data.user_data,
+        )
+        memory.add_user_message(result["prompt"])
+
+        if result["search_context"]:
+            memory.add_search_message(result["search_context"])
+
+        memory.add_assistant_message(result["response"])
+
+    result["chat_id"] = memory.current_id
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Run prompts through the chat pipeline without the terminal UI"
+    )
+    parser.add_argument(
+        "input", nargs="?", default="-", help="JSONL or text file, '-' for stdin"
+    )
+    parser.add_argument("--jobs", type=int, default=4, help="Prompts in flight at once")
+    parser.add_argument(
+        "--ollama-concurrency",
+        type=int,
+        default=2,
+        help="Concurrent requests to Ollama. Match OLLAMA_NUM_PARALLEL",
+    )
+    parser.add_argument(
+        "--search-concurrency", type=int, default=4, help="Concurrent web searches"
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="Store each result in memory.db"
+    )
+    args = parser.parse_args()
+
+    model_config, search_config, user_data, *_ = get_config()
+
+    ai = AIEngine(
+        model_config.main_model,
+        model_config.search_model,
+        keep_alive=model_config.keep_alive,
+        main_thinking=model_config.main_thinking,
+        search_thinking=model_config.search_thinking,
+        max_parallel_requests=model_config.max_parallel_requests,
+    )
+    for notice in ai.notices:
+        print(notice, file=sys.stderr)
+
+    search = SearchEngine(
+        search_config.search_engine,
+        user_agent=search_config.search_headers,
+        use_tor=search_config.use_tor,
+        tor_port=search_config.tor_port,
+        max_queries=search_config.max_search_queries,
+    )
+
+    runner = BatchRunner(
+        ai,
+        search,
+        model_config,
+        user_data,
+        ollama_concurrency=args.ollama_concurrency,
+        search_concurrency=args.search_concurrency,
+    )
+
+    # Results are written from this thread only, so the sqlite connection stays on it
+    memory = Memory() if args.save else None
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    failures = 0
+
+    with source, ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        jobs = read_jobs(source)
+        pending: set[Future] = set()
+        exhausted = False
+
+        while pending or not exhausted:
+            # Keep a bounded window of work queued instead of reading all input up front
+            while not exhausted and len(pending) < args.jobs * 2:
+                job = next(jobs, None)
+                if job is None:
+                    exhausted = True
+                else:
+                    pending.add(executor.submit(runner.run, job))
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                result = future.result()
+
+                if result["error"]:
+                    failures += 1
+                elif memory:
+                    save_result(memory, model_config, user_data, result)
+
+                print(json.dumps(result), flush=True)
+
+    ai.remove_from_memory()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import json
+import os
+from pathlib import Path
+
+import ollama
+
+from models import ModelCapabilities
+
+# Token budget of the structured output probe, enough for '{"ok": true}'
+FORMAT_PROBE_TOKENS = 16
+
+
+class CapabilityProbe:
+    """Detects model capabilities from Ollama metadata, cached on disk by model digest"""
+
+    def __init__(self, client: ollama.Client, cache_path: Path | None = None) -> None:
+        """
+        Args:
+            client: Ollama client used for 'show' requests
+            cache_path: Location of the cache file. Defaults to the project root
+        """
+        self.client = client
+        self.cache_path: Path = (
+            cache_path or Path(__file__).resolve().parent.parent / "capabilities.json"
+        )
+        self._cache: dict[str, dict] = self._load_cache()
+
+    def _load_cache(self) -> dict[str, dict]:
+        """Reads the cache file, ignoring it if it is missing or unreadable"""
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_cache(self) -> None:
+        """Writes the cache atomically so an interrupted write cannot corrupt it"""
+        tmp_path = self.cache_path.with_suffix(".tmp")
+
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self._cache, file, indent=2)
+
+        os.replace(tmp_path, self.cache_path)
+
+    def get(self, model: str, digest: str) -> ModelCapabilities:
+        """
+        Retrieves the capabilities of a model, probing Ollama only on a cache miss
+
+        Args:
+            model: Model name, e.g. 'qwen3:8b'
+            digest: Digest of the installed model from 'ollama list'
+
+        Returns:
+            ModelCapabilities for the model
+        """
+        cached = self._cache.get(digest)
+        # Entries written before a capability was added are probed again
+        if cached and set(cached) == set(ModelCapabilities._fields):
+            return ModelCapabilities(**cached)
+
+        capabilities = self._probe(model, digest)
+
+        self._cache[digest] = capabilities._asdict()
+        self._save_cache()
+
+        return capabilities
+
+    def _probe(self, model: str, digest: str) -> ModelCapabilities:
+        """
+        Reads capabilities from 'ollama show'
+
+        Older Ollama servers do not report capabilities, in which case thinking
+        support is inferred from the chat template. Ollama does not report
+        structured output support at all, so it is tested with a short request.
+        """
+        info = self.client.show(model)
+        model_info = info.modelinfo or {}
+
+        context_length = next(
+            (
+                int(value)
+                for key, value in model_info.items()
+                if key.endswith(".context_length")
+            ),
+            0,
+        )
+
+        if info.capabilities is not None:
+            thinking = "thinking" in info.capabilities
+            completion = "completion" in info.capabilities
+        else:
+            thinking = ".Think" in (info.template or "")
+            completion = True
+
+        return ModelCapabilities(
+            model=model,
+            digest=digest,
+            thinking=thinking,
+            completion=completion,
+            context_length=context_length,
+            structured_output=completion and self._supports_format(model, thinking),
+        )
+
+    def _supports_format(self, model: str, thinking: bool) -> bool:
+        """
+        Sends a few-token request with format='json' and checks that the reply
+        parses as a JSON object
+
+        Args:
+            model: Model name
+            thinking: Whether the model thinks by default, which is switched off
+                so the token budget goes to the reply
+        """
+        try:
+            response = self.client.chat(
+                model=model,
+                messages=[{"role": "user", "content": 'Reply with {"ok": true}'}],
+                format="json",
+                options={"num_predict": FORMAT_PROBE_TOKENS},
+                stream=False,
+                think=False if thinking else None,
+            )
+        except ollama.ResponseError:
+            return False
+
+        try:
+            return isinstance(json.loads(response.message.content), dict)
+        except json.JSONDecodeError:
+            return False
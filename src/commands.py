@@ -1,11 +1,23 @@
-import httpx
+from datetime import datetime
+from pathlib import Path
+import sqlite3
+import time
 
+from rich.markup import escape
+
+from archive import export_history, import_history
 from view import View
-from memory import Memory
+from memory import Memory, SNIPPET_END, SNIPPET_START
 from engine import AIEngine
+from maintenance import MaintenanceWorker
 from search import SearchEngine
-from models import ChatHeader
-from exceptions import ChatNotFoundError, CommandNotFoundError
+from exceptions import (
+    ArchiveFormatError,
+    ChatNotFoundError,
+    CommandNotFoundError,
+    TorConnectionError,
+)
+import tracing
 
 
 def parse_command(input_str: str) -> tuple[str, list[str]]:
@@ -30,7 +42,8 @@ def handle_command(
     engine: AIEngine,
     search: SearchEngine,
     style: str,
-) -> None:
+    maintenance: MaintenanceWorker | None = None,
+) -> bool:
     """
     Handles command request
 
@@ -41,6 +54,10 @@ def handle_command(
         engine: Active engine object
         search: Active search engine object
         style: Color of text
+        maintenance: Background database maintenance, if running
+
+    Returns:
+        True if the command switched the current chat
     """
     try:
         command, args = parse_command(input_str)
@@ -56,13 +73,31 @@ def handle_command(
                 handle_list(args, view, memory, style)
 
             case "load":
-                handle_load(args, view, memory, style)
+                return handle_load(args, view, memory, style)
 
             case "delete":
                 handle_delete(args, view, memory, style)
 
+            case "more":
+                handle_more(view, memory, style)
+
             case "new":
-                handle_new(view, memory, style)
+                return handle_new(view, memory, style)
+
+            case "search":
+                handle_search(args, view, memory, style)
+
+            case "export":
+                handle_export(args, view, memory, style)
+
+            case "import":
+                handle_import(args, view, memory, style)
+
+            case "db-stats":
+                handle_db_stats(view, memory, maintenance, style)
+
+            case "profile":
+                handle_profile(args, view, style)
 
             case "tor-status":
                 handle_tor_status(view, search, style)
@@ -75,10 +110,21 @@ def handle_command(
     except ChatNotFoundError as e:
         view.print_system_message(e.args[0], style=style, line_break=True)
         handle_help(view, style=style, commands_only=True)
+    except (ArchiveFormatError, OSError, UnicodeDecodeError) as e:
+        view.print_system_message(
+            f"Archive error: {escape(str(e))}", style=style, line_break=True
+        )
+    except sqlite3.Error as e:
+        # A failed import batch is rolled back; earlier batches stay
+        view.print_system_message(
+            f"Database error: {escape(str(e))}", style=style, line_break=True
+        )
     except (IndexError, ValueError):
         view.print_system_message("Entry invalid", style=style, line_break=True)
         handle_help(view, style=style, commands_only=True)
 
+    return False
+
 
 def handle_help(view: View, style: str, commands_only: bool = False) -> None:
     """
@@ -100,9 +146,16 @@ def handle_help(view: View, style: str, commands_only: bool = False) -> None:
     view.print_unordered_list(
         [
             "/info  #Show info about this session",
-            "/list \\[qty | None]  #List chat history",
-            "/load \\[chat_number]  #Load chat by id",
+            "/list \\[qty | next | prev | all]  #List chat history, paging older or newer",
+            "/list before \\[YYYY-MM-DD] \\[qty]  #List chats last updated before a date",
+            "/load \\[chat_number] \\[qty]  #Load chat by id, showing its last qty messages",
+            "/more  #Show earlier messages of the loaded chat (or Page Up)",
             "/delete \\[chat_number | '*']  #Delete chat by id",
+            "/search \\[terms]  #Search all chats for messages or titles",
+            "/export \\[path]  #Export all chats to JSONL, gzip if path ends in .gz",
+            "/import \\[path]  #Import chats from a JSONL export",
+            "/db-stats  #Show database size, fragmentation and row counts",
+            "/profile \\[on \\[memory] | off | dump \\[path]]  #Trace where each turn's time goes",
             "/exit  #Exit the program",
         ],
         style=style,
@@ -129,11 +182,129 @@ def handle_info(
             f"Search Engine: {search.selected_engine}",
             f"Tor Routing: {tor_status}",
             f"Current Chat ID: {memory.current_id}",
-        ],
+            f"Speculative Generation: {engine.speculation_stats}",
+        ]
+        + [
+            f"Queue ({priority.name.lower()}): {stats}"
+            for priority, stats in engine.scheduler.stats.items()
+        ]
+        + _render_stats_lines(view),
         style=style,
     )
 
 
+def _render_stats_lines(view: View) -> list[str]:
+    """Describes how the last streamed response was drawn, if there was one"""
+    stats = view.last_render_stats
+    if stats is None:
+        return []
+
+    return [
+        f"Last Response Rendering: {stats.frames} frames for {stats.chunks} chunks in {stats.seconds:.1f}s, "
+        f"{stats.dropped_frames} dropped, {stats.mean_render_ms:.1f} ms avg / {stats.max_render_ms:.1f} ms max per frame, "
+        f"final interval {stats.frame_interval_ms:.0f} ms"
+    ]
+
+
+def handle_db_stats(
+    view: View,
+    memory: Memory,
+    maintenance: MaintenanceWorker | None,
+    style: str,
+) -> None:
+    """
+    Shows database size, fragmentation, row counts and the last maintenance run
+
+    Args:
+        view: Active view object
+        memory: Active memory object
+        maintenance: Background database maintenance, if running
+        style: Color of text
+    """
+    stats = memory.get_db_stats()
+    megabyte = 1_048_576
+    fragmentation = stats.free_pages / stats.page_count if stats.page_count else 0
+    compression = stats.blob_bytes / stats.blob_raw_bytes if stats.blob_raw_bytes else 1
+
+    lines = [
+        f"File: {stats.file_bytes / megabyte:.1f} MB (WAL {stats.wal_bytes / megabyte:.1f} MB)",
+        f"Pages: {stats.page_count} x {stats.page_size} B, {stats.free_pages} free ({fragmentation:.1%} fragmentation)",
+        f"Auto-vacuum: {stats.auto_vacuum}",
+        f"Chats: {stats.chats}",
+        f"Messages: {stats.messages} ({stats.hidden_messages} hidden)",
+        f"Blobs: {stats.blobs}, {stats.blob_bytes / megabyte:.1f} MB stored ({compression:.0%} of original)",
+    ]
+
+    report = maintenance.last_report if maintenance else None
+    if report:
+        lines.append(
+            f"Last maintenance: {report.finished}, deleted {report.chats_deleted} chats, "
+            f"dropped {report.payloads_dropped} search payloads, freed {report.pages_freed} pages "
+            f"in {report.seconds:.1f} s"
+        )
+    else:
+        lines.append("Last maintenance: not run yet")
+
+    view.print_system_message("Database:", style=style, line_break=True)
+    view.print_unordered_list(lines, style=style)
+
+
+def handle_profile(args, view: View, style: str) -> None:
+    """
+    Handles profile command requests: starts and stops span tracing and writes
+    the spans as Chrome trace JSON
+
+    Args:
+        args: Arguments passed to profile: [on, memory] | [off] | [dump, path]
+        view: Active view object
+        style: Color of text
+    """
+    match args[0]:
+        case "on":
+            track_memory = args[1:] == ["memory"]
+            tracing.start(track_memory=track_memory)
+            view.print_system_message(
+                f"Profiling on{' with memory tracking' if track_memory else ''}. "
+                "Use /profile dump to save the trace",
+                style=style,
+                line_break=True,
+            )
+
+        case "off":
+            tracing.stop()
+            view.print_system_message(
+                "Profiling off. Recorded spans are kept for /profile dump",
+                style=style,
+                line_break=True,
+            )
+
+        case "dump":
+            path = Path(
+                args[1]
+                if len(args) > 1
+                else f"trace-{datetime.now():%Y%m%d-%H%M%S}.json"
+            ).expanduser()
+
+            try:
+                count = tracing.dump(path)
+            except OSError as e:
+                view.print_system_message(
+                    f"Unable to write trace: {escape(str(e))}",
+                    style=style,
+                    line_break=True,
+                )
+                return
+
+            view.print_system_message(
+                f"Wrote {count} spans to {escape(str(path))}. Open it in https://ui.perfetto.dev",
+                style=style,
+                line_break=True,
+            )
+
+        case _:
+            raise ValueError
+
+
 def handle_tor_status(view: View, search: SearchEngine, style: str):
     """
     Checks and displays Tor connection status
@@ -160,7 +331,7 @@ def handle_tor_status(view: View, search: SearchEngine, style: str):
                     "Hints: Ensure Tor is running (systemctl status tor) and configured correctly",
                     style=style,
                 )
-        except httpx.ConnectError:
+        except TorConnectionError:
             view.print_system_message("❌ Not connected to Tor", style=style)
             view.print_system_message(
                 "Hints: Ensure Tor is running (systemctl status tor) and configured correctly",
@@ -175,52 +346,248 @@ def handle_list(args, view: View, memory: Memory, style: str) -> None:
     Handles list command requests
 
     Args:
-        args: Arguments passed to list: [qty]
+        args: Arguments passed to list:
+            [qty] most recent chats,
+            ['next' | 'prev'] older or newer page than the last listing,
+            ['before', 'YYYY-MM-DD', qty] chats last updated before a date,
+            ['all'] every chat
         view: Active view object
         memory: Active memory object
         style: Color of text
     """
+    page_size = memory.list_page_size
+    last_page = memory.last_listed_page
+
+    match args:
+        case []:
+            chat_list = memory.get_chat_page(page_size)
+        case ["all"]:
+            chat_list = memory.get_chat_list()
+        case ["next"]:
+            if not last_page:
+                raise IndexError
+            first = last_page[0]
+            chat_list = memory.get_chat_page(
+                page_size, before=(first.updated, first.id)
+            )
+        case ["prev"]:
+            if not last_page:
+                raise IndexError
+            last = last_page[-1]
+            chat_list = memory.get_chat_page(page_size, after=(last.updated, last.id))
+        case ["before", date, *qty]:
+            datetime.strptime(date, "%Y-%m-%d")
+            page_size = int(qty[0]) if qty else page_size
+            chat_list = memory.get_chat_page(page_size, before=(date, 0))
+        case [qty]:
+            page_size = int(qty)
+            if page_size < 1:
+                raise ValueError
+            chat_list = memory.get_chat_page(page_size)
+        case _:
+            raise IndexError
+
+    if chat_list:
+        memory.last_listed_page = chat_list
+    memory.list_page_size = page_size
+
+    view.print_table(
+        "Chat History",
+        ["ID", "Created", "Last Updated", "Title"],
+        chat_list,
+        col_alignment=["center", "center", "center", "left"],
+        expand=True,
+        style=style,
+    )
+
+    view.print_system_message(
+        f"Retrieved {len(chat_list)} of {memory.count_chats()} records. Use /list next or /list prev to page",
+        style=style,
+    )
 
-    def list_hist(qty: int | None = None):
-        chat_list: list[ChatHeader] = memory.get_chat_list()
 
-        if qty:
-            requested_list: list[ChatHeader] = chat_list[-int(qty) :]
-        else:
-            requested_list: list[ChatHeader] = chat_list
+def handle_search(args, view: View, memory: Memory, style: str) -> None:
+    """
+    Handles search command requests
+
+    Args:
+        args: Search terms
+        view: Active view object
+        memory: Active memory object
+        style: Color of text
+    """
+    if not args:
+        raise IndexError
 
-        view.print_table(
-            "Chat History",
-            ["ID", "Created", "Last Updated", "Title"],
-            requested_list,
-            col_alignment=["center", "center", "center", "left"],
-            expand=True,
+    start = time.perf_counter()
+    hits = memory.search_history(args)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    def format_snippet(snippet: str) -> str:
+        snippet = escape(" ".join(snippet.split()))
+        return snippet.replace(SNIPPET_START, "[bold]").replace(SNIPPET_END, "[/bold]")
+
+    view.print_table(
+        "Search Results",
+        ["ID", "Date", "Title", "Match"],
+        [
+            (
+                hit.chat_id,
+                hit.created[:19],
+                escape(hit.title),
+                format_snippet(hit.snippet),
+            )
+            for hit in hits
+        ],
+        col_alignment=["center", "center", "left", "left"],
+        expand=True,
+        style=style,
+    )
+
+    view.print_system_message(
+        f"Found {len(hits)} chats in {elapsed_ms:.1f} ms. Use /load \\[chat_number] to open one",
+        style=style,
+    )
+
+
+def handle_export(args, view: View, memory: Memory, style: str) -> None:
+    """
+    Handles export command requests
+
+    Args:
+        args: Arguments passed to export: [path]. Defaults to a timestamped
+            .jsonl.gz file next to memory.db
+        view: Active view object
+        memory: Active memory object
+        style: Color of text
+    """
+    path = (
+        Path(args[0]).expanduser()
+        if args
+        else memory.db_path.parent
+        / f"chat-history-{datetime.now():%Y%m%d-%H%M%S}.jsonl.gz"
+    )
+
+    with view.status("Exporting chats...", style) as status:
+        exported = export_history(
+            memory,
+            path,
+            progress=lambda count: status.update(
+                f"[{style}]Exported {count} chats...[/{style}]"
+            ),
+        )
+
+    view.print_system_message(
+        f"Exported {exported} chats to {escape(str(path))}",
+        style=style,
+        line_break=True,
+    )
+
+
+def handle_import(args, view: View, memory: Memory, style: str) -> None:
+    """
+    Handles import command requests
+
+    Args:
+        args: Arguments passed to import: [path]
+        view: Active view object
+        memory: Active memory object
+        style: Color of text
+    """
+    path = Path(args[0]).expanduser()
+    imported = 0
+
+    def report(count: int) -> None:
+        nonlocal imported
+        imported = count
+        status.update(f"[{style}]Imported {count} chats...[/{style}]")
+
+    try:
+        with view.status("Importing chats...", style) as status:
+            import_history(memory, path, progress=report)
+    finally:
+        view.print_system_message(
+            f"Imported {imported} chats from {escape(str(path))}",
             style=style,
+            line_break=True,
         )
 
+
+def handle_load(args, view: View, memory: Memory, style: str) -> bool:
+    """
+    Handles load command requests. Only the latest page of messages is shown;
+    /more shows earlier ones
+
+    Args:
+        args: Arguments passed to load: [id, qty]
+        view: Active view object
+        memory: Active memory object
+        style: Color of text
+
+    Returns:
+        True once the chat is loaded
+    """
+    if len(args) > 1:
+        page_size = int(args[1])
+        if page_size < 1:
+            raise ValueError
+        memory.history_page_size = page_size
+
+    memory.set_current_id(int(args[0]))
+    memory.earliest_shown = None
+    _show_history_page(view, memory, style, "Reconstructing History...")
+
+    return True
+
+
+def handle_more(view: View, memory: Memory, style: str) -> None:
+    """
+    Handles more command requests: shows the page of messages before the
+    earliest one shown of the loaded chat
+
+    Args:
+        view: Active view object
+        memory: Active memory object
+        style: Color of text
+    """
+    earliest = memory.earliest_shown
+    if earliest is None or earliest.id != memory.current_id:
         view.print_system_message(
-            f"Retrieved {len(requested_list)} of {len(chat_list)} records", style=style
+            "No earlier messages to show", style=style, line_break=True
         )
+        return
 
-    if args:
-        list_hist(args[0])
-    else:
-        list_hist()
+    _show_history_page(view, memory, style, "Earlier messages...")
 
 
-def handle_load(args, view: View, memory: Memory, style: str) -> None:
+def _show_history_page(view: View, memory: Memory, style: str, heading: str) -> None:
     """
-    Handles load command requests
+    Prints the page of visible messages before memory.earliest_shown, or the
+    latest page when it is None, and moves earliest_shown back past it
 
     Args:
-        args: Arguments passed to load: [id]
         view: Active view object
         memory: Active memory object
         style: Color of text
+        heading: Message printed above the page
     """
+    page_size = memory.history_page_size
+    # One extra message tells whether there is anything before this page
+    page = memory.get_visible_page(page_size + 1, before=memory.earliest_shown)
+    has_earlier = len(page) > page_size
+    page = page[-page_size:]
 
-    memory.set_current_id(int(args[0]))
-    view.reconstruct_history(memory.get_visible_chat_history(), style=style)
+    view.reconstruct_history(page, style=style, heading=heading)
+
+    if page:
+        memory.earliest_shown = page[0]
+
+    if has_earlier:
+        view.print_system_message(
+            "Use /more or Page Up to show earlier messages", style=style
+        )
+    else:
+        memory.earliest_shown = None
 
 
 def handle_delete(args, view: View, memory: Memory, style: str) -> None:
@@ -241,13 +608,18 @@ def handle_delete(args, view: View, memory: Memory, style: str) -> None:
     )
 
 
-def handle_new(view: View, memory: Memory, style: str):
+def handle_new(view: View, memory: Memory, style: str) -> bool:
     """
     Start new chat
 
     Args:
         view: Active view object
         style: Color of text
+
+    Returns:
+        True, the chat is always switched
     """
     view.print_system_message("Starting new chat...", line_break=True, style=style)
     memory.current_id = None
+
+    return True
@@ -0,0 +1,48 @@
+from pathlib import Path
+from typing import Any
+import sys
+
+if sys.version_info.major >= 3 and sys.version_info.minor >= 11:
+    import tomllib
+else:
+    import tomli as tomllib
+
+from models import MemoryConfig, ModelConfig, SearchConfig, StyleConfig, UserData
+
+
+def get_config():
+    """Retrieves the config.toml from the root directory"""
+
+    config_path = Path(__file__).resolve().parent.parent / "config.toml"
+
+    try:
+        with open(f"{config_path}", "rb") as file:
+            return parse_config(tomllib.load(file))
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Config file not found at: {config_path}\n"
+            "Have you created 'config.toml' in the project root?"
+        )
+
+
+def parse_config(
+    config_data: dict[str, Any],
+) -> tuple[ModelConfig, SearchConfig, UserData, StyleConfig, MemoryConfig]:
+    """Parses the config and sorts into descriptive objects"""
+
+    if (
+        config_data["model_settings"]["search_model"] == ""
+        or config_data["model_settings"]["main_model"] is None
+    ):
+        config_data["model_settings"]["search_model"] = config_data["model_settings"][
+            "main_model"
+        ]
+
+    model_config: ModelConfig = ModelConfig(**config_data["model_settings"])
+    search_config: SearchConfig = SearchConfig(**config_data["search_settings"])
+    user_data: UserData = UserData(**config_data["user_data"])
+    style_config: StyleConfig = StyleConfig(**config_data["style_settings"])
+    # Optional section; configs from before it existed keep every chat
+    memory_config: MemoryConfig = MemoryConfig(**config_data.get("memory_settings", {}))
+
+    return (model_config, search_config, user_data, style_config, memory_config)
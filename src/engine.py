@@ -1,11 +1,365 @@
-from typing import Iterator
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from enum import IntEnum
+import itertools
+from typing import Callable, Iterator, Mapping, Sequence
 import ollama
+import socket
 import threading
+import time
 from datetime import date
-import copy
 import json
 
-from models import UserData
+from capabilities import CapabilityProbe
+from models import ModelCapabilities, UserData
+import tracing
+
+# Pages shorter than this are passed through instead of condensed
+CONDENSE_MIN_CHARS = 400
+# Token cap for a condensed page's fact list
+CONDENSE_MAX_TOKENS = 256
+# Seconds a cancelled speculative response may take to give up its slot
+SPECULATION_CANCEL_TIMEOUT = 1.0
+
+
+def _traced_chat_stream(stream: Iterator, model: str) -> Iterator:
+    """
+    Spans a streamed chat request while tracing is on. Ollama's prompt evaluation
+    and generation times from the final chunk are added as child spans, placed
+    around the arrival of the first chunk
+
+    Args:
+        stream: Chunks from ollama chat with stream=True
+        model: Model name shown with the span
+
+    Returns:
+        The same chunks
+    """
+    if not tracing.enabled():
+        return stream
+
+    def traced() -> Iterator:
+        with tracing.span("chat stream", "engine", model=model) as stream_span:
+            first_chunk = None
+            for chunk in stream:
+                first_chunk = first_chunk or time.perf_counter_ns()
+                if chunk.get("done"):
+                    prompt_eval = chunk.get("prompt_eval_duration") or 0
+                    generation = chunk.get("eval_duration") or 0
+                    end = time.perf_counter_ns()
+
+                    tracing.add_span(
+                        "prompt eval",
+                        "engine",
+                        first_chunk - prompt_eval,
+                        prompt_eval,
+                        tokens=chunk.get("prompt_eval_count"),
+                    )
+                    tracing.add_span(
+                        "generation",
+                        "engine",
+                        first_chunk,
+                        min(generation, end - first_chunk),
+                        tokens=chunk.get("eval_count"),
+                    )
+                    stream_span.annotate(
+                        load_ms=(chunk.get("load_duration") or 0) / 1_000_000
+                    )
+                yield chunk
+
+    return traced()
+
+
+def _parse_json_object(text: str) -> dict:
+    """
+    Reads the JSON object in a model reply. Without format='json' the object
+    may be wrapped in a code fence or prose, so the outermost braces are used
+
+    Returns:
+        The parsed object, or an empty dict if there is none
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        return {}
+
+    try:
+        result = json.loads(text[start : end + 1])
+    except json.JSONDecodeError:
+        return {}
+
+    return result if isinstance(result, dict) else {}
+
+
+class SpeculativeStream:
+    """
+    Runs a main-model response stream in the background and buffers its chunks
+    until the search decision settles whether they can be used.
+    """
+
+    def __init__(self, stream_factory: Callable[[ollama.Client], Iterator]) -> None:
+        """
+        Args:
+            stream_factory: Callable that opens the response stream on the client
+                it is given
+        """
+        self.started: float = time.perf_counter()
+        self._chunks: list = []
+        self._done: bool = False
+        self._error: BaseException | None = None
+        self._cancelled = threading.Event()
+        self._condition = threading.Condition()
+        self._socket: socket.socket | None = None
+
+        # A client of its own, so cancel() can cut this request's connection
+        client = ollama.Client(event_hooks={"request": [self._watch_request]})
+
+        self._thread = threading.Thread(
+            target=self._consume, args=(stream_factory, client), daemon=True
+        )
+        self._thread.start()
+
+    def _watch_request(self, request) -> None:
+        """httpx request hook that traces the connection to capture its socket"""
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event: str, info: dict) -> None:
+        """httpcore trace callback. Keeps the socket of the new connection"""
+        if event != "connection.connect_tcp.complete":
+            return
+
+        with self._condition:
+            self._socket = info["return_value"].get_extra_info("socket")
+            if self._cancelled.is_set():
+                self._shutdown()
+
+    def _shutdown(self) -> None:
+        """Unblocks a pending read. Ollama stops evaluating once the connection drops"""
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _consume(
+        self, stream_factory: Callable[[ollama.Client], Iterator], client: ollama.Client
+    ) -> None:
+        """Drains the stream into the buffer until it ends or is cancelled"""
+        stream = None
+        try:
+            if self._cancelled.is_set():
+                return
+
+            stream = stream_factory(client)
+            for chunk in stream:
+                if self._cancelled.is_set():
+                    break
+
+                with self._condition:
+                    self._chunks.append(chunk)
+                    self._condition.notify_all()
+        except BaseException as e:
+            self._error = e
+        finally:
+            # Closing the stream releases its scheduler slot
+            if hasattr(stream, "close"):
+                stream.close()
+
+            with self._condition:
+                self._done = True
+                self._condition.notify_all()
+
+    def cancel(self, timeout: float = SPECULATION_CANCEL_TIMEOUT) -> None:
+        """
+        Discards the buffered output, drops the connection to Ollama and waits
+        for the stream to release its scheduler slot
+
+        Args:
+            timeout: Seconds to wait for the slot, in case the request is still
+                queued for one
+        """
+        with self._condition:
+            self._cancelled.set()
+            self._chunks.clear()
+            if self._socket:
+                self._shutdown()
+
+        self._thread.join(timeout)
+
+    def __iter__(self) -> Iterator:
+        """Replays the buffered chunks, then follows the live stream"""
+        index = 0
+
+        while True:
+            with self._condition:
+                while index >= len(self._chunks) and not self._done:
+                    self._condition.wait()
+
+                if index < len(self._chunks):
+                    chunk = self._chunks[index]
+                    index += 1
+                elif self._error:
+                    raise self._error
+                else:
+                    return
+
+            yield chunk
+
+
+class SpeculationStats:
+    """Tracks how often speculative responses are used and what they save or cost"""
+
+    def __init__(self) -> None:
+        self.hits: int = 0
+        self.misses: int = 0
+        self.seconds_saved: float = 0.0
+        self.seconds_lost: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.hits}/{self.hits + self.misses} hits ({self.hit_rate:.0%}), "
+            f"{self.seconds_saved:.1f}s saved, {self.seconds_lost:.1f}s lost"
+        )
+
+
+class Priority(IntEnum):
+    """Request classes for the Ollama scheduler. Lower values are served first"""
+
+    INTERACTIVE_CLASSIFY = 0
+    INTERACTIVE_GENERATE = 1
+    BACKGROUND = 2
+
+
+class QueueStats:
+    """Tracks how long requests of one priority waited for an Ollama slot"""
+
+    def __init__(self) -> None:
+        self.requests: int = 0
+        self.total_wait: float = 0.0
+        self.max_wait: float = 0.0
+
+    def record(self, wait: float) -> None:
+        self.requests += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def __str__(self) -> str:
+        average = self.total_wait / self.requests if self.requests else 0.0
+        return f"{self.requests} requests, avg wait {average:.2f}s, max {self.max_wait:.2f}s"
+
+
+class _Ticket:
+    def __init__(self, model: str, priority: Priority, session: str, seq: int):
+        self.model = model
+        self.priority = priority
+        self.session = session
+        self.seq = seq
+        self.enqueued = time.perf_counter()
+
+
+class OllamaScheduler:
+    """
+    Orders inference requests to Ollama by priority, limits concurrent requests
+    per model and shares the queue fairly between sessions.
+
+    Within a priority class the session that has been served least goes first.
+    When a model allows more than one concurrent request, background work may not
+    take the last free slot, so interactive requests never queue behind it.
+    """
+
+    def __init__(self, max_parallel_requests: int = 1) -> None:
+        """
+        Args:
+            max_parallel_requests: Concurrent requests allowed per model.
+                Should match OLLAMA_NUM_PARALLEL
+        """
+        self.max_parallel_requests = max(1, max_parallel_requests)
+        self.stats: dict[Priority, QueueStats] = {p: QueueStats() for p in Priority}
+
+        self._condition = threading.Condition()
+        self._active: dict[str, int] = defaultdict(int)
+        self._served: dict[str, int] = defaultdict(int)
+        self._waiting: list[_Ticket] = []
+        self._sequence = itertools.count()
+
+    def _has_capacity(self, ticket: _Ticket) -> bool:
+        limit = self.max_parallel_requests
+        if ticket.priority == Priority.BACKGROUND and limit > 1:
+            limit -= 1
+
+        return self._active[ticket.model] < limit
+
+    def _next_ticket(self) -> _Ticket | None:
+        eligible = [t for t in self._waiting if self._has_capacity(t)]
+        if not eligible:
+            return None
+
+        return min(eligible, key=lambda t: (t.priority, self._served[t.session], t.seq))
+
+    @property
+    def queue_depth(self) -> int:
+        with self._condition:
+            return len(self._waiting)
+
+    @contextmanager
+    def slot(self, model: str, priority: Priority, session: str = "local"):
+        """
+        Holds a request slot for a model until the block exits
+
+        Args:
+            model: Model the request runs on
+            priority: Request class
+            session: Session the request belongs to, used for fair queuing
+        """
+        with tracing.span(
+            "wait for slot", "engine", model=model, priority=priority.name
+        ), self._condition:
+            ticket = _Ticket(model, priority, session, next(self._sequence))
+            self._waiting.append(ticket)
+
+            while self._next_ticket() is not ticket:
+                self._condition.wait()
+
+            self._waiting.remove(ticket)
+            self._active[model] += 1
+            self._served[session] += 1
+            self.stats[priority].record(time.perf_counter() - ticket.enqueued)
+
+            # Another waiter for a different model may now be next in line
+            self._condition.notify_all()
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active[model] -= 1
+                self._condition.notify_all()
+
+    def stream(
+        self,
+        model: str,
+        priority: Priority,
+        stream_factory: Callable[[], Iterator],
+        session: str = "local",
+    ) -> Iterator:
+        """
+        Wraps a streaming request so its slot is held until the stream is drained or closed
+
+        Args:
+            model: Model the request runs on
+            priority: Request class
+            stream_factory: Callable that opens the stream
+            session: Session the request belongs to, used for fair queuing
+
+        Returns:
+            Iterator over the stream's chunks
+        """
+        with self.slot(model, priority, session):
+            yield from stream_factory()
 
 
 class AIEngine:
@@ -16,49 +370,180 @@ class AIEngine:
         keep_alive: int,
         main_thinking: bool,
         search_thinking: bool,
+        max_parallel_requests: int = 1,
+        embedding_model: str = "",
     ) -> None:
         self.model = model
         self.search_model = search_model
+        self.embedding_model = embedding_model
 
         self.keep_alive = keep_alive
         self.main_thinking = main_thinking
         self.search_thinking = search_thinking
 
         self.engine_options = {"num_ctx": 16384}
+        # Dropped for search models without structured output, which then rely on the prompt
+        self.search_format: str | None = "json"
+        self.speculation_stats = SpeculationStats()
+        self.scheduler = OllamaScheduler(max_parallel_requests)
         self.models = self.get_models()
         self.client = ollama.Client()
 
+        # Bumped by every prefill request, so only the latest one runs
+        self._prefill_generation = 0
+        self._prefill_lock = threading.Lock()
+
+        self.notices: list[str] = []
+        self.apply_capabilities(CapabilityProbe(self.client))
+
+        # Long-term memory is optional, so a missing embedding model disables it
+        if self.embedding_model and self.embedding_model not in {
+            m.model for m in self.models.models
+        }:
+            self.notices.append(
+                f"Embedding model '{self.embedding_model}' not installed. Long-term memory is disabled."
+            )
+            self.embedding_model = ""
+
         self.load_into_memory()
 
     def load_into_memory(self) -> None:
+        models = [self.model]
+        if self.model != self.search_model:
+            models.append(self.search_model)
+
+        for model in models:
+            thread = threading.Thread(target=self._warm_up, args=(model,), daemon=True)
+            thread.start()
+
+    def _warm_up(self, model: str) -> None:
+        """Loads a model into memory as a background request"""
+        with self.scheduler.slot(model, Priority.BACKGROUND):
+            self.client.generate(
+                model=model,
+                options=self.engine_options,
+                keep_alive=self.keep_alive,
+            )
+
+    def prefill(
+        self,
+        messages: Sequence[Mapping[str, str]],
+        is_current: Callable[[], bool] = lambda: True,
+        session: str = "local",
+    ) -> threading.Thread | None:
+        """
+        Evaluates a chat's prompt in the background so that Ollama has it in its
+        KV cache when the next message is sent, and only the new turn is evaluated.
+        Only the latest prefill runs: one that has not started by the time a newer
+        one is requested, cancel_prefill is called or is_current turns false is
+        skipped, so it cannot evict the cache of the chat in use
+
+        Args:
+            messages: Chat history in ollama format
+            is_current: Whether the chat is still the one loaded
+            session: Session the request belongs to
+
+        Returns:
+            The background thread, or None if the search decision would evict the
+            cache first because it runs on the same model with a single slot
+        """
+        if self.model == self.search_model and self.scheduler.max_parallel_requests < 2:
+            return None
+
+        with self._prefill_lock:
+            self._prefill_generation += 1
+            generation = self._prefill_generation
+
         thread = threading.Thread(
-            target=self.client.generate,
-            kwargs={
-                "model": self.model,
-                "options": self.engine_options,
-                "keep_alive": self.keep_alive,
-            },
+            target=self._prefill,
+            args=(
+                list(messages),
+                session,
+                lambda: generation == self._prefill_generation and is_current(),
+            ),
             daemon=True,
+            name="prefill",
         )
-
         thread.start()
+        return thread
 
-        if self.model != self.search_model:
-            search_thread = threading.Thread(
-                target=self.client.generate,
-                kwargs={
-                    "model": self.search_model,
-                    "options": self.engine_options,
-                    "keep_alive": self.keep_alive,
-                },
-                daemon=True,
+    def cancel_prefill(self) -> None:
+        """Skips a requested prefill that has not started, e.g. when a turn starts"""
+        with self._prefill_lock:
+            self._prefill_generation += 1
+
+    def _prefill(
+        self,
+        messages: list[Mapping[str, str]],
+        session: str,
+        still_wanted: Callable[[], bool] = lambda: True,
+    ) -> None:
+        with self.scheduler.slot(
+            self.model, Priority.BACKGROUND, session
+        ), tracing.span("prefill", "engine", messages=len(messages)) as span:
+            if not still_wanted():
+                span.annotate(skipped=True)
+                return
+
+            try:
+                response = self.client.chat(
+                    model=self.model,
+                    messages=messages,
+                    # Ollama treats num_predict 0 as unlimited, so generate one token
+                    options={**self.engine_options, "num_predict": 1},
+                    stream=False,
+                    keep_alive=self.keep_alive,
+                    think=self.main_thinking,
+                )
+            except (ollama.ResponseError, ConnectionError):
+                return
+
+            span.annotate(prompt_tokens=response.get("prompt_eval_count"))
+
+    def apply_capabilities(self, probe: CapabilityProbe) -> None:
+        """
+        Reconciles the configured settings with what the installed models support,
+        so no request has to be retried because of a capability mismatch
+
+        Args:
+            probe: Capability probe used to look up each model
+        """
+        digests = {m.model: m.digest for m in self.models.models}
+
+        main_capabilities: ModelCapabilities = probe.get(
+            self.model, digests[self.model]
+        )
+        search_capabilities: ModelCapabilities = probe.get(
+            self.search_model, digests[self.search_model]
+        )
+
+        for capabilities in (main_capabilities, search_capabilities):
+            if not capabilities.completion:
+                raise Exception(
+                    f"Model '{capabilities.model}' does not support chat completion."
+                )
+
+        if self.main_thinking and not main_capabilities.thinking:
+            self.main_thinking = False
+            self.notices.append(
+                f"Thinking is unavailable for '{self.model}' and has been disabled. Do the settings in config.toml match your model capability?"
             )
 
-            search_thread.start()
+        if self.search_thinking and not search_capabilities.thinking:
+            self.search_thinking = False
 
-    def no_thinking_main_fallback(self) -> None:
-        self.main_thinking = False
-        self.load_into_memory()
+        if not search_capabilities.structured_output:
+            self.search_format = None
+
+        context_lengths = [
+            c.context_length
+            for c in (main_capabilities, search_capabilities)
+            if c.context_length
+        ]
+        if context_lengths:
+            self.engine_options["num_ctx"] = min(
+                self.engine_options["num_ctx"], *context_lengths
+            )
 
     def get_models(self) -> ollama.ListResponse:
         try:
@@ -93,25 +578,139 @@ class AIEngine:
             return models
 
     def remove_from_memory(self) -> None:
+        # Bypasses the scheduler: it runs during shutdown, possibly while a slot is held
         ollama.generate(model=self.model, keep_alive=0)
         ollama.generate(model=self.search_model, keep_alive=0)
+        if self.embedding_model:
+            ollama.embed(model=self.embedding_model, input=[], keep_alive=0)
+
+    def embed(
+        self,
+        texts: Sequence[str],
+        priority: Priority = Priority.BACKGROUND,
+        session: str = "local",
+    ) -> Sequence[Sequence[float]]:
+        """
+        Embeds texts with the embedding model
+
+        Args:
+            texts: Texts to embed in one request
+            priority: Scheduling class. Indexing runs in the background,
+                per-turn queries ahead of it
+            session: Session the request belongs to
+
+        Returns:
+            One embedding per text
+        """
+        with self.scheduler.slot(self.embedding_model, priority, session), tracing.span(
+            "embed", "engine", texts=len(texts)
+        ):
+            return self.client.embed(
+                model=self.embedding_model,
+                input=list(texts),
+                keep_alive=self.keep_alive,
+            ).embeddings
+
+    def get_response_stream(
+        self,
+        messages: Sequence[Mapping[str, str]],
+        priority: Priority = Priority.INTERACTIVE_GENERATE,
+        session: str = "local",
+        client: ollama.Client | None = None,
+    ) -> Iterator:
+        client = client or self.client
+
+        return self.scheduler.stream(
+            self.model,
+            priority,
+            lambda: _traced_chat_stream(
+                client.chat(
+                    model=self.model,
+                    messages=messages,
+                    options=self.engine_options,
+                    stream=True,
+                    keep_alive=self.keep_alive,
+                    think=self.main_thinking,
+                ),
+                self.model,
+            ),
+            session=session,
+        )
 
-    def get_response_stream(self, messages: list[dict[str, str]]) -> Iterator:
-        stream = self.client.chat(
-            model=self.model,
-            messages=messages,
-            options=self.engine_options,
-            stream=True,
-            keep_alive=self.keep_alive,
-            think=self.main_thinking,
+    def speculate_response(
+        self, messages: Sequence[Mapping[str, str]], session: str = "local"
+    ) -> SpeculativeStream | None:
+        """
+        Starts the no-search response while the search decision is still pending
+
+        Args:
+            messages: Chat history in ollama format, without search results
+            session: Session the request belongs to
+
+        Returns:
+            SpeculativeStream buffering the response until it is settled, or None
+            if the classifier would have to queue behind it on the same model
+        """
+        if self.model == self.search_model and self.scheduler.max_parallel_requests < 2:
+            return None
+
+        return SpeculativeStream(
+            lambda client: self.get_response_stream(
+                messages, session=session, client=client
+            )
         )
 
-        return stream
+    def settle_speculation(
+        self, speculation: SpeculativeStream, needs_search: bool
+    ) -> SpeculativeStream | None:
+        """
+        Commits or cancels a speculative response once the search decision is known
+
+        Args:
+            speculation: Stream started by speculate_response
+            needs_search: Outcome of determine_search
+
+        Returns:
+            The speculative stream if it can be used, otherwise None
+        """
+        if needs_search:
+            # The search-backed response waits for this before it can start
+            start = time.perf_counter()
+            speculation.cancel()
+            self.speculation_stats.misses += 1
+            self.speculation_stats.seconds_lost += time.perf_counter() - start
+            return None
+
+        self.speculation_stats.hits += 1
+        self.speculation_stats.seconds_saved += (
+            time.perf_counter() - speculation.started
+        )
+        return speculation
 
     def determine_search(
-        self, messages: list[dict[str, str]], user_data: UserData
-    ) -> dict[str, str]:
-        copy_of_messages = copy.deepcopy(messages)
+        self,
+        messages: Sequence[Mapping[str, str]],
+        user_data: UserData,
+        priority: Priority = Priority.INTERACTIVE_CLASSIFY,
+        session: str = "local",
+        max_queries: int = 1,
+    ) -> dict:
+        """
+        Decides whether the latest message needs a web search and what to search for
+
+        Args:
+            messages: Chat history in ollama format
+            user_data: User data from config.toml
+            priority: Scheduling class
+            session: Session the request belongs to
+            max_queries: Sub-queries the classifier may split the search into
+
+        Returns:
+            Dictionary with 'needs_search', 'search_queries' and 'search_term',
+            the first query
+        """
+        # Only the first and last messages are replaced, so a shallow copy is enough
+        copy_of_messages = list(messages)
 
         copy_of_messages[0] = {
             "role": "system",
@@ -131,39 +730,153 @@ class AIEngine:
 
             Optimization Rules:
             1. Context: Include the full date if the query is time-sensitive. Include other information as necessary.
+            2. Queries: Usually one. Only when the query covers separate subjects, such as a comparison, write up to {max_queries} queries, one per subject.
 
             Output Format (JSON ONLY):
-            {{"needs_search": bool, "search_term": "string"}}
+            {{"needs_search": bool, "search_queries": ["string"]}}
 
             LATEST_QUERY:
-            {messages[-1]}
+            {dict(messages[-1])}
             """,
         }
 
-        try:
+        with self.scheduler.slot(self.search_model, priority, session), tracing.span(
+            "classify search", "engine", model=self.search_model
+        ):
             response = self.client.chat(
                 model=self.search_model,
                 messages=copy_of_messages,
-                format="json",
+                format=self.search_format,
                 options=self.engine_options,
                 stream=False,
                 think=self.search_thinking,
             )
-        except ollama.ResponseError:
-            self.search_thinking = False
 
-            response = self.client.chat(
-                model=self.search_model,
-                messages=copy_of_messages,
-                format="json",
-                options=self.engine_options,
-                stream=False,
-                think=self.search_thinking,
-            )
+        result = _parse_json_object(response["message"]["content"])
 
-        result = json.loads(response["message"]["content"])
+        queries = result.get("search_queries") or result.get("search_term") or []
+        if isinstance(queries, str):
+            queries = [queries]
+        # Models occasionally repeat a query or exceed the limit
+        queries = list(
+            dict.fromkeys(
+                q.strip() for q in queries if isinstance(q, str) and q.strip()
+            )
+        )[: max(max_queries, 1)]
 
         return {
-            "needs_search": result.get("needs_search"),
-            "search_term": result.get("search_term"),
+            # Nothing to search for without a usable query
+            "needs_search": bool(result.get("needs_search") and queries),
+            "search_term": queries[0] if queries else None,
+            "search_queries": queries,
         }
+
+    def condense_page(
+        self,
+        page: Mapping[str, str],
+        search_term: str,
+        priority: Priority = Priority.INTERACTIVE_CLASSIFY,
+        session: str = "local",
+    ) -> str | None:
+        """
+        Reduces a fetched page to a short list of facts relevant to the search,
+        each cited with the page's reference number
+
+        Args:
+            page: PageText from a SearchResult
+            search_term: Term the page was found for
+            priority: Scheduling class
+            session: Session the request belongs to
+
+        Returns:
+            Fact list, the page text if it is already short or condensing fails,
+            or None if the page has nothing relevant
+        """
+        reference = page["reference_num"]
+        if len(page["text"]) < CONDENSE_MIN_CHARS:
+            return page["text"]
+
+        messages = [
+            {
+                "role": "system",
+                "content": "You condense web pages into short cited fact lists. Output only the list.",
+            },
+            {
+                "role": "user",
+                "content": f"""
+                SEARCH TERM: {search_term}
+
+                PAGE {reference}: {page["title"]}
+                {page["text"]}
+
+                List the facts from the page that help answer the search term as at most 8 short bullet points.
+                End every bullet with {reference}. Copy names, numbers and dates exactly.
+                If nothing on the page is relevant, output only: NONE
+                """,
+            },
+        ]
+
+        try:
+            with self.scheduler.slot(
+                self.search_model, priority, session
+            ), tracing.span("condense page", "engine", reference=reference) as span:
+                response = self.client.chat(
+                    model=self.search_model,
+                    messages=messages,
+                    options={
+                        **self.engine_options,
+                        "num_predict": CONDENSE_MAX_TOKENS,
+                    },
+                    stream=False,
+                    think=self.search_thinking,
+                    keep_alive=self.keep_alive,
+                )
+                span.annotate(
+                    prompt_tokens=response.get("prompt_eval_count"),
+                    completion_tokens=response.get("eval_count"),
+                )
+        except (ollama.ResponseError, ConnectionError):
+            return page["text"]
+
+        facts = response["message"]["content"].strip()
+        if not facts or facts.strip(" .").upper() == "NONE":
+            return None
+
+        return facts
+
+    def condense_pages(
+        self,
+        pages: Sequence[Mapping[str, str]],
+        search_term: str,
+        priority: Priority = Priority.INTERACTIVE_CLASSIFY,
+        session: str = "local",
+    ) -> list[str | None]:
+        """
+        Condenses fetched pages in parallel. The scheduler still caps how many
+        run on Ollama at once, so with one slot they queue and the gain is only
+        the shorter main prompt
+
+        Args:
+            pages: Pages from a SearchResult
+            search_term: Term the pages were found for
+            priority: Scheduling class
+            session: Session the requests belong to
+
+        Returns:
+            One condense_page result per page, in order
+        """
+        if not pages:
+            return []
+
+        with tracing.span("condense pages", "engine", pages=len(pages)):
+            with ThreadPoolExecutor(
+                max_workers=len(pages), thread_name_prefix="condense"
+            ) as pool:
+                return list(
+                    pool.map(
+                        lambda page: self.condense_page(
+                            page, search_term, priority, session
+                        ),
+                        pages,
+                    )
+                )
@@ -4,3 +4,15 @@ class ChatNotFoundError(Exception):
 
 class CommandNotFoundError(Exception):
     pass
+
+
+class SearchUnavailableError(Exception):
+    pass
+
+
+class TorConnectionError(SearchUnavailableError):
+    pass
+
+
+class ArchiveFormatError(Exception):
+    pass
@@ -1,102 +1,86 @@
-from pathlib import Path
-from typing import Any
-import sys
+import argparse
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-import httpx
-from ddgs.exceptions import DDGSException
 
 import ollama
 
-if sys.version_info.major >= 3 and sys.version_info.minor >= 11:
-    import tomllib
-else:
-    import tomli as tomllib
-
-from commands import handle_command
-from models import ModelResponse, UserData
-from view import View
+from commands import handle_command, handle_list
+from config import get_config
+from models import ModelResponse
+from view import create_view
 from memory import Memory
 from engine import AIEngine
-from search import SearchEngine
+from search import SearchEngine, format_condensed_context, format_search_context
 from cleanup_handler import register_cleanup
-from models import ModelConfig, SearchConfig, StyleConfig
-
-
-def get_config():
-    """Retrieves the config.toml from the root directory"""
-
-    config_path = Path(__file__).resolve().parent.parent / "config.toml"
-
-    try:
-        with open(f"{config_path}", "rb") as file:
-            return parse_config(tomllib.load(file))
-    except FileNotFoundError:
-        raise FileNotFoundError(
-            f"Config file not found at: {config_path}\n"
-            "Have you created 'config.toml' in the project root?"
-        )
-
-
-def parse_config(
-    config_data: dict[str, Any],
-) -> tuple[ModelConfig, SearchConfig, UserData, StyleConfig]:
-    """Parses the config and sorts into descriptive objects"""
-
-    if (
-        config_data["model_settings"]["search_model"] == ""
-        or config_data["model_settings"]["main_model"] is None
-    ):
-        config_data["model_settings"]["search_model"] = config_data["model_settings"][
-            "main_model"
-        ]
-
-    model_config: ModelConfig = ModelConfig(**config_data["model_settings"])
-    search_config: SearchConfig = SearchConfig(**config_data["search_settings"])
-    user_data: UserData = UserData(**config_data["user_data"])
-    style_config: StyleConfig = StyleConfig(**config_data["style_settings"])
-
-    return (model_config, search_config, user_data, style_config)
+from maintenance import MaintenanceWorker
+from exceptions import SearchUnavailableError, TorConnectionError
+import tracing
 
 
 def main():
-    model_config, search_config, user_data, style_config = get_config()
+    parser = argparse.ArgumentParser(description="Chat with a local LLM")
+    parser.add_argument(
+        "--plain",
+        action="store_true",
+        help="Plain text output without layout; the default when stdout is not a terminal",
+    )
+    args = parser.parse_args()
 
-    memory = Memory()
+    model_config, search_config, user_data, style_config, memory_config = get_config()
 
-    ai = AIEngine(
+    # Model validation, capability probing and warm-up run while the UI starts up
+    startup = ThreadPoolExecutor(max_workers=1, thread_name_prefix="startup")
+    engine_future: Future[AIEngine] = startup.submit(
+        AIEngine,
         model_config.main_model,
         model_config.search_model,
         keep_alive=model_config.keep_alive,
         main_thinking=model_config.main_thinking,
         search_thinking=model_config.search_thinking,
+        max_parallel_requests=model_config.max_parallel_requests,
+        embedding_model=model_config.embedding_model,
     )
-    ai.load_into_memory()
+    startup.shutdown(wait=False)
+
+    # Turn writes are committed by a background thread, off the response path
+    memory = Memory(write_behind=True)
+    maintenance = MaintenanceWorker(memory, memory_config).start()
 
     search = SearchEngine(
         search_config.search_engine,
         user_agent=search_config.search_headers,
         use_tor=search_config.use_tor,
         tor_port=search_config.tor_port,
+        max_queries=search_config.max_search_queries,
     )
 
-    view = View()
+    view = create_view(plain=args.plain, frame_rate=style_config.frame_rate)
     view.print_panel(
         f"[bold {style_config.header}]Chat Session Started[/bold {style_config.header}]\n[{style_config.header}]Type '/help' for help.[/{style_config.header}]",
         style=style_config.header,
     )
 
+    for notice in memory.notices:
+        view.print_system_message(notice, style=style_config.system)
+
     # Print history
-    handle_command("/list 3", view, memory, ai, search, style=style_config.system)
+    handle_list(["3"], view, memory, style=style_config.system)
 
     def end_session():
         """Notifies the user the session is ending and unloads the llm from memory"""
         view.print_system_message(
             "Ending session...", style=style_config.warning, line_break=True
         )
-        ai.remove_from_memory()
+        maintenance.stop()
+        memory.close()
+        if engine_future.done() and not engine_future.exception():
+            engine_future.result().remove_from_memory()
 
     register_cleanup(end_session)
 
+    ai: AIEngine | None = None
+    long_term_memory = None
+
     try:
         while True:
             user_input: str = view.get_user_input(style_config.text)
@@ -104,113 +88,206 @@ def main():
                 continue
 
             if user_input.lower() == "/exit":
+                memory.flush()
                 break
 
-            if user_input.lower().startswith("/"):
-                handle_command(
-                    user_input, view, memory, ai, search, style=style_config.system
-                )
-                continue
+            if ai is None:
+                # Blocks only if the user submits before the engine has started
+                ai = engine_future.result()
 
-            if not memory.current_id:
-                words = user_input.split()
-                truncated_message = " ".join(words[:10])
-                memory.create_conversation(truncated_message)
-                memory.add_system_message(
-                    model_config.initial_context,
-                    model_config.system_instructions,
-                    user_data.user_data,
-                )
+                for notice in ai.notices:
+                    view.print_system_message(notice, style=style_config.warning)
 
-            memory.add_user_message(user_input)
+                if ai.embedding_model:
+                    # Imported here so numpy is only loaded when long-term memory is on
+                    from recall import LongTermMemory
 
-            notifications = []
+                    long_term_memory = LongTermMemory(
+                        memory,
+                        ai,
+                        top_k=model_config.recall_top_k,
+                        token_budget=model_config.recall_token_budget,
+                    )
 
-            # Search the web
-            view.print_system_message(
-                "Reviewing query...", style=style_config.system, line_break=True
-            )
-            search_decision = ai.determine_search(
-                memory.get_llm_formatted_chat_history(), user_data
-            )
-            if search_decision["needs_search"]:
-                view.print_system_message(
-                    f"Searching the web for: [italic]{search_decision['search_term']}[/italic]...",
+            if user_input.lower().startswith("/"):
+                switched = handle_command(
+                    user_input,
+                    view,
+                    memory,
+                    ai,
+                    search,
                     style=style_config.system,
+                    maintenance=maintenance,
                 )
 
-                try:
-                    search_data = search.text_query(search_decision["search_term"])
-                except httpx.ConnectError:
-                    view.print_system_message(
-                        "Unable to route through the tor network.",
-                        style=style_config.warning,
-                    )
-                except DDGSException:
-                    view.print_system_message(
-                        "Unable to get search results",
-                        style=style_config.warning,
+                # Evaluate the loaded history, or a new chat's system message, while
+                # the user types, so the first reply only evaluates the new turn
+                if switched and model_config.prefill_cache:
+                    ai.prefill(
+                        memory.get_llm_formatted_chat_history()
+                        or [
+                            {
+                                "role": "system",
+                                "content": Memory.format_system_message(
+                                    model_config.initial_context,
+                                    model_config.system_instructions,
+                                    user_data.user_data,
+                                ),
+                            }
+                        ],
+                        is_current=lambda chat_id=memory.current_id: (
+                            memory.current_id == chat_id
+                        ),
                     )
+                continue
 
-                    memory.add_search_message(
-                        "Search unsuccessful. Unable to get search results."
-                    )
-                else:
-                    if search_data["message"]:
-                        view.print_system_message(
-                            search_data["message"], style=style_config.system
+            # A prefill that has not started would now only evict this turn's cache
+            ai.cancel_prefill()
+
+            with tracing.span("turn", "app", chat_id=memory.current_id):
+                recalled: list[str] = []
+                if long_term_memory:
+                    recalled = long_term_memory.recall(user_input, memory.current_id)
+
+                # The messages that open a turn are committed together. The reply is
+                # written on its own, and truncate_history removes the turn if it fails
+                with memory.transaction():
+                    if not memory.current_id:
+                        words = user_input.split()
+                        truncated_message = " ".join(words[:10])
+                        memory.create_conversation(truncated_message)
+                        memory.add_system_message(
+                            model_config.initial_context,
+                            model_config.system_instructions,
+                            user_data.user_data,
                         )
 
-                    notifications: list[str] = search_data["notifications"]
-                    search_result: str = search_data["context"]
+                    # Messages of this turn are removed again if the response fails
+                    turn_start = len(memory.get_llm_formatted_chat_history())
+
+                    # Ahead of the user message, which the search decision reads last
+                    if recalled:
+                        memory.add_recall_message("\n".join(recalled))
+
+                    memory.add_user_message(user_input)
 
-                    memory.add_search_message(
-                        f"Citations: Every claim derived from the below search results must be attributed using in-line Markdown hyperlinks: [Source [NUMBER](URL)]\n\n{search_result}"
+                if recalled:
+                    view.print_system_message(
+                        f"Recalled {len(recalled)} excerpts from past chats.",
+                        style=style_config.system,
+                        line_break=True,
                     )
-            else:
-                view.print_system_message(
-                    "Decided not to search.", style=style_config.system
-                )
 
-            # Get and print the response
-            now = datetime.now()
-            formatted_now = now.strftime("%Y-%m-%d %H:%M:%S")
-            try:
-                response_stream = ai.get_response_stream(
-                    memory.get_llm_formatted_chat_history()
-                )
+                notifications = []
 
-                ai_response = view.live_response(
-                    model_config.main_model,
-                    formatted_now,
-                    response_stream,
-                    style=style_config.assistant,
-                    text_style=style_config.assistant_text,
-                )
-            except ollama.ResponseError:
+                # Search the web
                 view.print_system_message(
-                    "Thinking is unavailable. Do the settings in config.toml match your model capability?",
-                    style=style_config.system,
+                    "Reviewing query...", style=style_config.system, line_break=True
                 )
-                ai.no_thinking_main_fallback()
+                chat_history = memory.get_llm_formatted_chat_history()
 
-                response_stream = ai.get_response_stream(
-                    memory.get_llm_formatted_chat_history()
-                )
+                speculation = None
+                if model_config.speculative_generation:
+                    speculation = ai.speculate_response(chat_history)
 
-                ai_response: ModelResponse = view.live_response(
-                    model_config.main_model,
-                    formatted_now,
-                    response_stream,
-                    style=style_config.assistant,
-                    text_style=style_config.assistant_text,
+                search_decision = ai.determine_search(
+                    chat_history, user_data, max_queries=search.max_queries
                 )
 
-            memory.add_assistant_message(ai_response.content)
+                if speculation:
+                    speculation = ai.settle_speculation(
+                        speculation, search_decision["needs_search"]
+                    )
 
-            if notifications:
-                view.print_system_message("Search sources:", style=style_config.system)
-                view.print_ordered_list(notifications, style=style_config.system)
+                if search_decision["needs_search"]:
+                    view.print_system_message(
+                        "Searching the web for: "
+                        + ", ".join(
+                            f"[italic]{query}[/italic]"
+                            for query in search_decision["search_queries"]
+                        )
+                        + "...",
+                        style=style_config.system,
+                    )
+
+                    try:
+                        search_data = search.text_query(
+                            search_decision["search_queries"]
+                        )
+                    except TorConnectionError:
+                        view.print_system_message(
+                            "Unable to route through the tor network.",
+                            style=style_config.warning,
+                        )
+                    except SearchUnavailableError:
+                        view.print_system_message(
+                            "Unable to get search results",
+                            style=style_config.warning,
+                        )
+
+                        memory.add_search_message(
+                            "Search unsuccessful. Unable to get search results."
+                        )
+                    else:
+                        if search_data["message"]:
+                            view.print_system_message(
+                                search_data["message"], style=style_config.system
+                            )
+
+                        notifications: list[str] = search_data["notifications"]
+                        search_result: str = search_data["context"]
+
+                        if (
+                            model_config.condense_search_results
+                            and search_data["pages"]
+                        ):
+                            with view.status(
+                                f"Condensing {len(search_data['pages'])} pages...",
+                                style_config.system,
+                            ):
+                                facts = ai.condense_pages(
+                                    search_data["pages"],
+                                    "; ".join(search_decision["search_queries"]),
+                                )
+                            search_result = format_condensed_context(
+                                search_data["pages"], facts
+                            )
+
+                        memory.add_search_message(format_search_context(search_result))
+                else:
+                    view.print_system_message(
+                        "Decided not to search.", style=style_config.system
+                    )
+
+                # Get and print the response
+                now = datetime.now()
+                formatted_now = now.strftime("%Y-%m-%d %H:%M:%S")
+                try:
+                    response_stream = speculation or ai.get_response_stream(
+                        memory.get_llm_formatted_chat_history()
+                    )
+
+                    ai_response: ModelResponse = view.live_response(
+                        model_config.main_model,
+                        formatted_now,
+                        response_stream,
+                        style=style_config.assistant,
+                        text_style=style_config.assistant_text,
+                    )
+                except ollama.ResponseError as e:
+                    view.print_system_message(
+                        f"Model error: {e.error}", style=style_config.warning
+                    )
+                    memory.truncate_history(turn_start)
+                    continue
+
+                memory.add_assistant_message(ai_response.content)
+
+                if notifications:
+                    view.print_system_message(
+                        "Search sources:", style=style_config.system
+                    )
+                    view.print_ordered_list(notifications, style=style_config.system)
 
     except KeyboardInterrupt:
         pass
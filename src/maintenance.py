@@ -0,0 +1,98 @@
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Iterable
+
+from memory import Memory
+from models import MaintenanceReport, MemoryConfig
+
+# Pages released per incremental vacuum step; the database lock is freed between steps
+VACUUM_STEP_PAGES = 256
+
+
+class MaintenanceWorker:
+    """
+    Applies the retention policy and compacts memory.db on a background thread:
+    retention, incremental vacuum, then ANALYZE and a WAL checkpoint
+    """
+
+    def __init__(
+        self,
+        memory: Memory,
+        config: MemoryConfig,
+        initial_delay: float = 60,
+        active_chat_ids: Callable[[], Iterable[int]] | None = None,
+    ) -> None:
+        """
+        Args:
+            memory: Memory object to maintain
+            config: Retention policy and schedule
+            initial_delay: Seconds to wait before the first run, so startup and
+                the first turn are not competing with it
+            active_chat_ids: Returns chats loaded by other sessions on the same
+                database, which retention must not delete
+        """
+        self.memory = memory
+        self.config = config
+        self.initial_delay = initial_delay
+        self.active_chat_ids = active_chat_ids
+        self.last_report: MaintenanceReport | None = None
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, daemon=True, name="db-maintenance"
+        )
+
+    def start(self) -> "MaintenanceWorker":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        if self._stop.wait(self.initial_delay):
+            return
+
+        interval = self.config.maintenance_interval_hours * 3600
+        while True:
+            self.run_once()
+            if interval <= 0 or self._stop.wait(interval):
+                return
+
+    def run_once(self) -> MaintenanceReport:
+        """
+        Runs one maintenance pass
+
+        Returns:
+            MaintenanceReport, also kept in last_report
+        """
+        started = time.perf_counter()
+
+        chats_deleted, payloads_dropped = self.memory.apply_retention(
+            max_age_days=self.config.max_chat_age_days,
+            max_chats=self.config.max_chats,
+            search_payload_turns=self.config.search_payload_turns,
+            active_chat_ids=self.active_chat_ids,
+        )
+
+        free_pages = self.memory.get_db_stats().free_pages
+        remaining = free_pages
+        while remaining and not self._stop.is_set():
+            previous, remaining = remaining, self.memory.incremental_vacuum(
+                VACUUM_STEP_PAGES
+            )
+            if remaining >= previous:
+                break
+
+        self.memory.optimize()
+
+        self.last_report = MaintenanceReport(
+            finished=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            chats_deleted=chats_deleted,
+            payloads_dropped=payloads_dropped,
+            pages_freed=free_pages - remaining,
+            seconds=time.perf_counter() - started,
+        )
+
+        return self.last_report
@@ -0,0 +1,184 @@
+"""
+Incremental Markdown rendering for streamed responses. Text is split into
+top-level blocks at blank lines outside code fences. Completed blocks are parsed
+and laid out once per width and then reused, so each update only re-renders the
+open block at the end instead of the whole response.
+"""
+
+from rich.console import Console, ConsoleOptions, RenderResult
+from rich.markdown import Markdown
+from rich.segment import Segment
+
+FENCE_MARKERS = ("```", "~~~")
+
+
+class StreamingMarkdown:
+    """
+    Rich renderable for Markdown that arrives in chunks
+
+    Example:
+        markdown = StreamingMarkdown()
+        for chunk in stream:
+            markdown.append(chunk)
+            live.refresh()
+    """
+
+    def __init__(self) -> None:
+        # Every chunk, joined only when the full text is requested
+        self._chunks: list[str] = []
+
+        # Source of each completed block, parsed on first render
+        self._frozen: list[str] = []
+        # Rendered lines of the completed blocks per width, and how many blocks they cover
+        self._frozen_lines: dict[int, tuple[int, list[list[Segment]]]] = {}
+
+        # Complete lines of the open block and the unterminated line after them
+        self._open_lines: list[str] = []
+        self._partial: list[str] = []
+        self._blank_seen = False
+        self._fence: str | None = None
+
+        # Rendered lines of the open block, cleared whenever it changes
+        self._open_render: tuple[int, list[list[Segment]]] | None = None
+
+    def __bool__(self) -> bool:
+        return bool(self._chunks)
+
+    @property
+    def text(self) -> str:
+        """Everything appended so far"""
+        if len(self._chunks) > 1:
+            self._chunks[:] = ["".join(self._chunks)]
+
+        return self._chunks[0] if self._chunks else ""
+
+    def append(self, text: str) -> None:
+        """
+        Adds streamed text, freezing any blocks it completes
+
+        Args:
+            text: Next chunk of the response
+        """
+        if not text:
+            return
+
+        self._chunks.append(text)
+        self._open_render = None
+
+        *complete, rest = text.split("\n")
+        if complete:
+            complete[0] = "".join(self._partial) + complete[0]
+            self._partial.clear()
+            for line in complete:
+                self._add_line(line)
+
+        if rest:
+            self._partial.append(rest)
+
+    def _add_line(self, line: str) -> None:
+        """Adds a complete line to the open block or starts a new block with it"""
+        stripped = line.strip()
+
+        if self._fence:
+            if stripped.startswith(self._fence) and not stripped.strip(self._fence[0]):
+                self._fence = None
+            self._open_lines.append(line)
+            return
+
+        if not stripped:
+            self._blank_seen = True
+            self._open_lines.append(line)
+            return
+
+        # An indented line after a blank one continues the block (list items, code)
+        if self._blank_seen and not line[0].isspace():
+            self._freeze()
+
+        self._blank_seen = False
+        self._open_lines.append(line)
+
+        if stripped.startswith(FENCE_MARKERS) and len(line) - len(line.lstrip()) < 4:
+            marker = stripped[0]
+            self._fence = marker * (len(stripped) - len(stripped.lstrip(marker)))
+
+    def _freeze(self) -> None:
+        """Moves the open block, minus trailing blank lines, to the completed blocks"""
+        while self._open_lines and not self._open_lines[-1].strip():
+            self._open_lines.pop()
+
+        if self._open_lines:
+            self._frozen.append("\n".join(self._open_lines))
+            self._open_lines = []
+
+    def _render_frozen(
+        self, console: Console, options: ConsoleOptions
+    ) -> list[list[Segment]]:
+        """Lines of the completed blocks, rendering only blocks new since last time"""
+        rendered, lines = self._frozen_lines.get(options.max_width, (0, []))
+
+        for source in self._frozen[rendered:]:
+            lines.extend(_separated(lines, _render_block(console, options, source)))
+
+        self._frozen_lines[options.max_width] = (len(self._frozen), lines)
+
+        return lines
+
+    def _render_open(
+        self, console: Console, options: ConsoleOptions
+    ) -> list[list[Segment]]:
+        """Lines of the open block, cached until the next append or resize"""
+        if self._open_render is None or self._open_render[0] != options.max_width:
+            source = "\n".join(
+                [*self._open_lines, "".join(self._partial)]
+                if self._partial
+                else self._open_lines
+            )
+
+            lines = _render_block(console, options, source) if source.strip() else []
+            self._open_render = (options.max_width, lines)
+
+        return self._open_render[1]
+
+    def __rich_console__(
+        self, console: Console, options: ConsoleOptions
+    ) -> RenderResult:
+        options = options.update(height=None)
+        frozen = self._render_frozen(console, options)
+        open_block = self._render_open(console, options)
+
+        if frozen:
+            open_block = _separated(frozen, open_block)
+
+        for line in frozen:
+            yield from line
+            yield Segment.line()
+
+        for line in open_block:
+            yield from line
+            yield Segment.line()
+
+
+def _render_block(
+    console: Console, options: ConsoleOptions, source: str
+) -> list[list[Segment]]:
+    """
+    Lays out Markdown source as lines, merging runs of equally styled segments
+    so that containers such as Panel have fewer segments to crop every frame
+    """
+    return [
+        list(Segment.simplify(line))
+        for line in console.render_lines(Markdown(source), options, pad=False)
+    ]
+
+
+def _separated(
+    previous: list[list[Segment]], lines: list[list[Segment]]
+) -> list[list[Segment]]:
+    """
+    Prefixes a block's lines with the blank line that separates top-level blocks
+    in a whole document. Lists, quotes and tables render their own
+    """
+    if previous and lines and Segment.get_line_length(lines[0]):
+        return [[], *lines]
+
+    return lines
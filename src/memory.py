@@ -1,71 +1,441 @@
-import os
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+import copy
+import functools
+import hashlib
+import itertools
 from pathlib import Path
+import queue
 import sqlite3
-from datetime import datetime
-from models import ChatHeader, ChatItem
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Iterable, Iterator, Mapping, Sequence
+import zlib
+from datetime import datetime, timedelta
+from models import ChatHeader, ChatItem, DatabaseStats, SearchHit, StoredMessage
 from exceptions import ChatNotFoundError
+import tracing
 from datetime import date
 
+# Hidden messages at least this large are stored compressed in the blobs table
+BLOB_THRESHOLD = 1024
+
+# PRAGMA auto_vacuum value for incremental mode
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Match markers placed around search terms in SearchHit snippets
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+
+# Damping constant for fusing message and title matches by reciprocal rank
+SEARCH_RANK_K = 60
+
+# Writes waiting for the write-behind thread before callers block
+WRITE_QUEUE_SIZE = 1024
+
+# Writes committed together by the write-behind thread at most
+WRITE_BATCH_SIZE = 256
+
+# Seconds the write-behind thread waits for more writes before committing a batch
+WRITE_LINGER = 0.005
+
 
 class Memory:
     """Provides connection to the chat history database"""
 
-    def __init__(self):
-        self.current_id: int | None = None
-        self.db_path: Path = Path(__file__).resolve().parent.parent / "memory.db"
+    def __init__(self, db_path: Path | None = None, write_behind: bool = False):
+        """
+        Args:
+            db_path: Location of the database. Defaults to memory.db in the project root
+            write_behind: Queue message writes for a background thread that commits
+                them in batches, so callers never wait on disk. See flush
+        """
+        self._current_id: int | None = None
+        # Append-only mirror of the current chat in llm format, so turns do no history reads
+        self._history: list[Mapping[str, str]] = []
+        # Paging state for /list
+        self.list_page_size: int = 10
+        self.last_listed_page: list[ChatHeader] = []
+        # Windowing state for /load and /more: messages per page and the oldest shown
+        self.history_page_size: int = 10
+        self.earliest_shown: ChatItem | None = None
+        self.db_path: Path = (
+            db_path or Path(__file__).resolve().parent.parent / "memory.db"
+        )
+        self._lock = threading.RLock()
+        self._transaction_depth: int = 0
+        # Per-thread read-only connections and write-transaction flags, shared by sessions
+        self._local = threading.local()
+        # Called with the message_id of every committed message, shared by all sessions
+        self._listeners: list[Callable[[int], None]] = []
+        self._uncommitted_ids: list[int] = []
+        self.write_behind = write_behind
+        self._write_queue: (
+            queue.Queue[tuple[Callable[[], None], Future[None]] | None] | None
+        ) = None
+        self._writer: threading.Thread | None = None
         self._initialize_db()
 
+        if write_behind:
+            self._write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+            self._writer = threading.Thread(
+                target=self._write_loop, daemon=True, name="memory-writer"
+            )
+            self._writer.start()
+
     def _initialize_db(self):
-        """Checks if database exists and initializes the database by creating tables if it does not"""
-        if os.path.exists(self.db_path):
-            self.db = sqlite3.connect(self.db_path)
-            self.cursor = self.db.cursor()
-        else:
-            self.db = sqlite3.connect(self.db_path)
-            self.cursor = self.db.cursor()
-            self.cursor.execute("PRAGMA foreign_keys = ON")
-
-            self.cursor.execute("""
-                CREATE TABLE chats(
-                    id INTEGER PRIMARY KEY, 
-                    created TEXT,
-                    updated TEXT,
-                    title TEXT 
-                )
-            """)
-
-            self.cursor.execute("""
-                CREATE TABLE chat_history(
-                    id INTEGER, 
-                    created TEXT,
-                    role TEXT,
-                    content TEXT,
-                    visible INTEGER,
-                    FOREIGN KEY (id) REFERENCES chats(id)
-                )
-            """)
+        """Opens the database and upgrades its schema to the latest version"""
+        # The single writer connection is shared across threads behind self._lock.
+        # Reads use per-thread connections from _read_cursor instead
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.cursor = self.db.cursor()
+        self._configure_connection()
+
+        # Messages for the user about one-off work done while opening the database
+        self.notices: list[str] = []
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """
+        Applies pending schema migrations in order. The schema version is tracked in
+        PRAGMA user_version and each migration runs in its own transaction.
+        Space freed by a migration is reclaimed with VACUUM afterwards
+        """
+        version = self.cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version >= len(MIGRATIONS):
+            return
 
-            self.db.commit()
+        # Databases from before versioning are at version 0 but already have a schema
+        existed = bool(
+            self.cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chats'"
+            ).fetchone()
+        )
+        size_before = self._database_size()
+
+        for target_version, migration in enumerate(MIGRATIONS[version:], version + 1):
+            try:
+                self.cursor.execute("BEGIN")
+                migration(self.cursor)
+                self.cursor.execute(f"PRAGMA user_version = {target_version}")
+                self.db.commit()
+            except sqlite3.Error:
+                self.db.rollback()
+                raise
+
+        # VACUUM also applies a changed auto_vacuum mode to an existing database
+        if (
+            self.cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            or self.cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+            != AUTO_VACUUM_INCREMENTAL
+        ):
+            self.cursor.execute("VACUUM")
+
+        if existed:
+            reclaimed = max(size_before - self._database_size(), 0)
+            self.notices.append(
+                f"Upgraded memory.db to schema version {len(MIGRATIONS)}, reclaimed {reclaimed / 1_048_576:.1f} MB"
+            )
 
-    @staticmethod
-    def _update_chat_date(func):
+    def _database_size(self) -> int:
+        """Size of the database in bytes, excluding the WAL"""
+        page_count = self.cursor.execute("PRAGMA page_count").fetchone()[0]
+        page_size = self.cursor.execute("PRAGMA page_size").fetchone()[0]
+
+        return page_count * page_size
+
+    def _configure_connection(self) -> None:
         """
-        Updates the created field of the current chat to the current datetime
+        Applies the performance profile: WAL journaling so commits append to the log
+        instead of rewriting pages, synchronous=NORMAL so only checkpoints fsync,
+        a 16 MiB page cache and memory-mapped reads. With write-behind, commits
+        happen off the caller's thread, so synchronous=FULL makes each batch durable
+        against power loss at no cost to the caller
         """
+        self.cursor.execute("PRAGMA journal_mode = WAL")
+        self.cursor.execute(
+            f"PRAGMA synchronous = {'FULL' if self.write_behind else 'NORMAL'}"
+        )
+        self.cursor.execute("PRAGMA cache_size = -16384")
+        self.cursor.execute("PRAGMA mmap_size = 268435456")
+        self.cursor.execute("PRAGMA temp_store = MEMORY")
+        self.cursor.execute("PRAGMA foreign_keys = ON")
 
-        def wrapper(self, *args):
-            func(self, *args)
+    def _read_cursor(self) -> sqlite3.Cursor:
+        """
+        Cursor for reads on the calling thread. Each thread gets its own read-only
+        connection, so reads run in parallel with each other and with the writer
+        under WAL. Inside a write transaction the writer's cursor is returned so
+        the thread sees its own uncommitted writes
 
-            now = datetime.now()
-            updated_now = now.strftime("%Y-%m-%d %H:%M:%S")
-            self.cursor.execute(
-                "UPDATE chats SET updated = ? WHERE id=?",
-                (updated_now, self.current_id),
+        Returns:
+            Cursor that must not be shared with other threads
+        """
+        if getattr(self._local, "writing", 0):
+            return self.cursor
+
+        # Read-your-writes: queued writes are committed before the read
+        self.flush()
+
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            reader = sqlite3.connect(
+                f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True
             )
+            reader.execute("PRAGMA query_only = ON")
+            reader.execute("PRAGMA cache_size = -16384")
+            reader.execute("PRAGMA mmap_size = 268435456")
+            reader.execute("PRAGMA temp_store = MEMORY")
+
+            # Closed with the thread-local when the thread exits
+            cursor = self._local.cursor = reader.cursor()
+
+        return cursor
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups writes into a single commit. Nested blocks join the outer transaction
+
+        Example:
+            with memory.transaction():
+                memory.create_conversation(title)
+                memory.add_user_message(content)
+        """
+        # Queued writes go first so the block's writes land after them
+        self.flush()
+
+        with self._locked():
+            self._transaction_depth += 1
+            self._local.writing = getattr(self._local, "writing", 0) + 1
+            try:
+                yield
+            except BaseException:
+                self._transaction_depth -= 1
+                self._local.writing -= 1
+                if not self._transaction_depth:
+                    self.db.rollback()
+                    self._uncommitted_ids.clear()
+                    self._resync()
+                raise
+            else:
+                self._transaction_depth -= 1
+                self._local.writing -= 1
+                self._commit()
+
+    @property
+    def current_id(self) -> int | None:
+        return self._current_id
+
+    @current_id.setter
+    def current_id(self, id: int | None) -> None:
+        """Switches the current chat and rebuilds the history mirror for it"""
+        self._current_id = id
+        self._history = self._load_history(id) if id is not None else []
+
+    def _resync(self) -> None:
+        """Realigns the current chat and mirror with the database after a rollback"""
+        if self._current_id is not None and not self._chat_exists(self._current_id):
+            self.current_id = None
+        else:
+            self.current_id = self._current_id
+
+    def _commit(self) -> None:
+        """
+        Commits unless a transaction block will commit on exit, then tells
+        listeners about the messages that became visible to readers
+        """
+        if self._transaction_depth:
+            return
+
+        with tracing.span("commit", "memory"):
             self.db.commit()
+        self._notify_committed()
+
+    def _notify_committed(self) -> None:
+        """Runs the listeners for messages committed since the last call"""
+        committed_ids = self._uncommitted_ids[:]
+        self._uncommitted_ids.clear()
+        for message_id in committed_ids:
+            for listener in self._listeners:
+                listener(message_id)
+
+    @contextmanager
+    def _locked(self):
+        """
+        Holds the writer lock, counting it per thread so flush can tell that
+        waiting for the write-behind thread would deadlock
+        """
+        with self._lock:
+            self._local.lock_depth = getattr(self._local, "lock_depth", 0) + 1
+            try:
+                yield
+            finally:
+                self._local.lock_depth -= 1
+
+    @staticmethod
+    def _synchronized(func):
+        """
+        Serializes access to the shared writer connection and cursor across threads.
+        Queued writes are committed first, so direct writes stay in order with them
+        """
+
+        def wrapper(self, *args, **kwargs):
+            self.flush()
+            with self._locked():
+                return func(self, *args, **kwargs)
 
         return wrapper
 
+    def _write(self, job: Callable[[], None]) -> None:
+        """
+        Runs a write. With write-behind it is queued for the writer thread, unless
+        the calling thread is inside a transaction block, which writes directly
+
+        Args:
+            job: Executes statements on self.cursor without committing
+        """
+        if self._writer_running() and not getattr(self._local, "writing", 0):
+            done: Future[None] = Future()
+            pending = self._pending_writes()
+            # Writes commit in queue order, so committed ones are dropped from the
+            # front. A failed one stays until this thread's flush reports it
+            while pending and pending[0][0].done() and not pending[0][0].exception():
+                pending.popleft()
+            pending.append((done, self))
+            self._write_queue.put((job, done))
+            return
+
+        with self._locked():
+            job()
+            self._commit()
+
+    def _pending_writes(self) -> deque[tuple[Future[None], "Memory"]]:
+        """
+        Writes the calling thread queued that are not known to be committed,
+        with the session that queued each
+        """
+        pending = getattr(self._local, "pending", None)
+        if pending is None:
+            pending = self._local.pending = deque()
+        return pending
+
+    def _write_loop(self) -> None:
+        """
+        Write-behind thread. Takes a write, gathers whatever else arrives within
+        WRITE_LINGER and commits the batch in one transaction
+        """
+        while True:
+            batch = [self._write_queue.get()]
+            try:
+                while batch[-1] is not None and len(batch) < WRITE_BATCH_SIZE:
+                    batch.append(self._write_queue.get(timeout=WRITE_LINGER))
+            except queue.Empty:
+                pass
+
+            writes = [write for write in batch if write is not None]
+            with (
+                self._locked(),
+                tracing.span("commit batch", "memory", writes=len(writes)),
+            ):
+                try:
+                    for job, _ in writes:
+                        job()
+                    self.db.commit()
+                except Exception as e:
+                    self.db.rollback()
+                    self._uncommitted_ids.clear()
+                    # Every write of the batch was rolled back, not only the failing one
+                    for _, done in writes:
+                        done.set_exception(e)
+                else:
+                    self._notify_committed()
+                    for _, done in writes:
+                        done.set_result(None)
+
+            for _ in batch:
+                self._write_queue.task_done()
+
+            if batch[-1] is None:
+                return
+
+    def flush(self) -> None:
+        """
+        Waits until every queued write is committed. Does nothing without
+        write-behind, and on threads where waiting would deadlock: the writer
+        thread itself and threads holding the writer lock
+
+        Raises:
+            sqlite3.Error: A write this thread queued failed since its last flush.
+                Its whole batch was rolled back, so the current chat and history
+                mirror of the sessions that queued the writes are reloaded first
+        """
+        if (
+            self._writer_running()
+            and threading.current_thread() is not self._writer
+            and not getattr(self._local, "lock_depth", 0)
+        ):
+            with tracing.span("flush", "memory"):
+                self._write_queue.join()
+
+        pending = getattr(self._local, "pending", None)
+        if not pending:
+            return
+
+        failed = [
+            (future, memory)
+            for future, memory in pending
+            if future.done() and future.exception()
+        ]
+        # Writes finish in queue order, so the ones still queued are at the back
+        while pending and pending[0][0].done():
+            pending.popleft()
+
+        if failed:
+            # Removed from pending first: _resync reads, and reads flush
+            for memory in {id(memory): memory for _, memory in failed}.values():
+                memory._resync()
+            raise failed[0][0].exception()
+
+    def _writer_running(self) -> bool:
+        return self._writer is not None and self._writer.is_alive()
+
+    def close(self) -> None:
+        """
+        Commits queued writes and stops the write-behind thread. Later writes
+        from any session are committed directly
+        """
+        if not self._writer_running():
+            return
+
+        self._write_queue.put(None)
+        self._writer.join()
+
+    def new_session(self) -> "Memory":
+        """
+        Creates a Memory for another session that shares this database connection
+        but tracks its own current chat
+
+        Returns:
+            Memory with no chat loaded
+        """
+        session = copy.copy(self)
+        session._current_id = None
+        session._history = []
+
+        return session
+
+    def add_listener(self, listener: Callable[[int], None]) -> None:
+        """
+        Registers a callback run after each message is committed, in every session
+
+        Args:
+            listener: Called with the new message_id. Must be quick; it runs
+                while the writer lock is held
+        """
+        self._listeners.append(listener)
+
     def create_conversation(self, title: str) -> None:
         """
         Creates a new conversation in the database
@@ -81,17 +451,27 @@ class Memory:
         """
         now = datetime.now()
         updated_now = now.strftime("%Y-%m-%d %H:%M:%S")
+        chat_id: Future[int] = Future()
 
-        self.cursor.execute(
-            "INSERT INTO chats (created, title) VALUES (?,?)", (updated_now, title)
-        )
-        generated_id = self.cursor.lastrowid
+        def insert_chat() -> None:
+            try:
+                self.cursor.execute(
+                    "INSERT INTO chats (created, updated, title) VALUES (?,?,?)",
+                    (updated_now, updated_now, title),
+                )
+            except sqlite3.Error as e:
+                chat_id.set_exception(e)
+                raise
+            chat_id.set_result(self.cursor.lastrowid)
 
-        self.db.commit()
+        # With write-behind this waits for the insert only, not for its commit
+        self._write(insert_chat)
+        generated_id = chat_id.result()
 
-        self.current_id = generated_id
+        # A new chat is empty, so the mirror is reset without a database read
+        self._current_id = generated_id
+        self._history = []
 
-    @_update_chat_date
     def _add_to_conversation(self, role: str, content: str, visible: int) -> None:
         """
         Adds a content to conversation history
@@ -105,14 +485,43 @@ class Memory:
         Example:
             add_to_conversation("20260111T11471938829023l5ohLg", "user", "What is the weather tomorrow?", 0)
         """
-        created = datetime.now()
+        # Bound now, since a queued write runs after the current chat may change
+        self._write(
+            functools.partial(
+                self._insert_message,
+                self.current_id,
+                datetime.now(),
+                role,
+                content,
+                visible,
+            )
+        )
+
+        # Read-your-writes for the turn: the mirror is updated before the commit
+        self._history.append(MappingProxyType({"role": role, "content": content}))
+
+    def _insert_message(
+        self, chat_id: int, created: datetime, role: str, content: str, visible: int
+    ) -> None:
+        """
+        Inserts a message and bumps its chat's updated time, without committing.
+        Runs with the writer lock held
+        """
+        if not visible and len(content) >= BLOB_THRESHOLD:
+            stored_content, blob_hash = None, _store_blob(self.cursor, content)
+        else:
+            stored_content, blob_hash = content, None
 
         self.cursor.execute(
-            "INSERT INTO chat_history VALUES (?,?,?,?,?)",
-            (self.current_id, created, role, content, visible),
+            "INSERT INTO chat_history (chat_id, created, role, content, visible, blob_hash) VALUES (?,?,?,?,?,?)",
+            (chat_id, created, role, stored_content, visible, blob_hash),
         )
+        self._uncommitted_ids.append(self.cursor.lastrowid)
 
-        self.db.commit()
+        self.cursor.execute(
+            "UPDATE chats SET updated = ? WHERE id=?",
+            (created.strftime("%Y-%m-%d %H:%M:%S"), chat_id),
+        )
 
     def add_user_message(self, content: str):
         """
@@ -141,9 +550,28 @@ class Memory:
         Args:
             content: Content to add to assistant message
         """
-        content = f"CONTEXT: {initial_context}\nCURRENT DATE: {date.today()}\nINSTRUCTIONS: {initial_instructions}\nUSER DATA: {user_data}"
+        content = self.format_system_message(
+            initial_context, initial_instructions, user_data
+        )
         self._add_to_conversation("system", content, 0)
 
+    @staticmethod
+    def format_system_message(
+        initial_context: str, initial_instructions: str, user_data: str
+    ) -> str:
+        """
+        Builds the system message content stored by add_system_message
+
+        Args:
+            initial_context: Context from config.toml
+            initial_instructions: Instructions from config.toml
+            user_data: User data from config.toml
+
+        Returns:
+            System message content
+        """
+        return f"CONTEXT: {initial_context}\nCURRENT DATE: {date.today()}\nINSTRUCTIONS: {initial_instructions}\nUSER DATA: {user_data}"
+
     def add_search_message(self, content: str):
         """
         Adds a search message to the message log
@@ -151,9 +579,83 @@ class Memory:
         Args:
             content: Content to add to the search message
         """
-        content = f"INTERNET SEARCH RESULTS:\n{content}"
-        self._add_to_conversation("user", content, 0)
+        self._add_to_conversation("user", self.format_search_message(content), 0)
+
+    @staticmethod
+    def format_search_message(content: str) -> str:
+        """
+        Builds the hidden search message content stored by add_search_message
+
+        Args:
+            content: Search results with citation instructions
+
+        Returns:
+            Search message content
+        """
+        return f"INTERNET SEARCH RESULTS:\n{content}"
+
+    def add_recall_message(self, content: str):
+        """
+        Adds excerpts recalled from past chats to the message log
 
+        Args:
+            content: Excerpts from long-term memory
+        """
+        self._add_to_conversation("user", self.format_recall_message(content), 0)
+
+    @staticmethod
+    def format_recall_message(content: str) -> str:
+        """
+        Builds the hidden recall message content stored by add_recall_message
+
+        Args:
+            content: Excerpts from long-term memory
+
+        Returns:
+            Recall message content
+        """
+        return f"RELEVANT EXCERPTS FROM PAST CONVERSATIONS (use only if helpful):\n{content}"
+
+    def truncate_history(self, length: int) -> None:
+        """
+        Removes the messages of the current chat after the first length, e.g. the
+        user, recall and search messages of a turn whose response failed, so the
+        next turn does not follow a user message that has no reply
+
+        Args:
+            length: Messages to keep, as counted by get_llm_formatted_chat_history
+        """
+        count = len(self._history) - length
+        if count <= 0 or self.current_id is None:
+            return
+
+        chat_id = self.current_id
+
+        def delete_messages() -> None:
+            rows = self.cursor.execute(
+                """
+                SELECT message_id, blob_hash FROM chat_history
+                WHERE chat_id = ? ORDER BY message_id DESC LIMIT ?
+                """,
+                (chat_id, count),
+            ).fetchall()
+            self.cursor.executemany(
+                "DELETE FROM chat_history WHERE message_id = ?",
+                [(message_id,) for message_id, _ in rows],
+            )
+            self.cursor.executemany(
+                """
+                DELETE FROM blobs WHERE hash = ?
+                AND NOT EXISTS (SELECT 1 FROM chat_history WHERE blob_hash = blobs.hash)
+                """,
+                {(blob_hash,) for _, blob_hash in rows if blob_hash},
+            )
+
+        # Queued behind the inserts it removes
+        self._write(delete_messages)
+        del self._history[length:]
+
+    @_synchronized
     def delete(self, id: int | str) -> list[int]:
         """
         Deletes a specific chat or all chats (excluding the current one) from history.
@@ -177,7 +679,7 @@ class Memory:
         if id != "*" and int(id) == self.current_id:
             raise ChatNotFoundError("Cannot delete current ID")
 
-        if id != "*" and int(id) not in self._get_all_chat_ids():
+        if id != "*" and not self._chat_exists(int(id)):
             raise ChatNotFoundError("ID does not exist")
 
         id_str = str(id)
@@ -187,27 +689,290 @@ class Memory:
 
         if id_str == "*":
             if self.current_id:
-                query = "DELETE FROM chats WHERE id != ?"
+                condition = "WHERE id != ?"
                 params = (self.current_id,)
             else:
-                query = "DELETE FROM chats"
+                condition = ""
                 params = ()
         else:
-            query = "DELETE FROM chats WHERE id = ?"
-            params = (id_str,)
+            condition = "WHERE id = ?"
+            params = (int(id_str),)
 
-        select_query = query.replace("DELETE", "SELECT id")
         ids_deleted = [
-            row[0] for row in self.cursor.execute(select_query, params).fetchall()
+            row[0]
+            for row in self.cursor.execute(
+                f"SELECT id FROM chats {condition}", params
+            ).fetchall()
         ]
 
-        self.cursor.execute(query, params)
-        history_query = query.replace("FROM chats", "FROM chat_history")
-        self.cursor.execute(history_query, params)
+        self._delete_chats(condition, params)
+        self._commit()
+
+        return ids_deleted
+
+    def _delete_chats(self, condition: str, params: tuple) -> None:
+        """
+        Deletes chats with their messages and any blobs no other message uses
+
+        Args:
+            condition: WHERE clause selecting rows of chats, may be empty
+            params: Parameters of the condition
+        """
+        blob_hashes = [
+            row[0]
+            for row in self.cursor.execute(
+                f"""
+                SELECT DISTINCT blob_hash FROM chat_history
+                WHERE blob_hash IS NOT NULL
+                AND chat_id IN (SELECT id FROM chats {condition})
+                """,
+                params,
+            ).fetchall()
+        ]
+
+        # Messages first so the foreign key to chats is never left dangling
+        self.cursor.execute(
+            f"DELETE FROM chat_history WHERE chat_id IN (SELECT id FROM chats {condition})",
+            params,
+        )
+        self.cursor.execute(f"DELETE FROM chats {condition}", params)
+
+        # Blobs are shared between messages, so only unreferenced ones are removed
+        self.cursor.executemany(
+            """
+            DELETE FROM blobs WHERE hash = ?
+            AND NOT EXISTS (SELECT 1 FROM chat_history WHERE blob_hash = blobs.hash)
+            """,
+            [(blob_hash,) for blob_hash in blob_hashes],
+        )
+
+    def apply_retention(
+        self,
+        max_age_days: int = 0,
+        max_chats: int = 0,
+        search_payload_turns: int = 0,
+        batch_size: int = 100,
+        active_chat_ids: Callable[[], Iterable[int]] | None = None,
+    ) -> tuple[int, int]:
+        """
+        Deletes chats outside the retention policy and drops old hidden search
+        payloads. The current chat and any chat in active_chat_ids are never
+        touched. Each batch of batch_size rows is selected and deleted in one
+        transaction, so other threads are not blocked for long and a chat that
+        becomes active between batches is spared
+
+        Args:
+            max_age_days: Delete chats not updated for this many days. 0 keeps all
+            max_chats: Keep only this many most recently updated chats. 0 keeps all
+            search_payload_turns: Drop hidden search and recall messages once this
+                many user turns follow them in their chat. 0 keeps all
+            batch_size: Rows per transaction
+            active_chat_ids: Returns chats other sessions have loaded, checked
+                at the start of every batch
+
+        Returns:
+            Tuple of (chats deleted, payloads dropped)
+        """
+        conditions: list[str] = []
+        params: list[Any] = []
+
+        if max_age_days:
+            cutoff = datetime.now() - timedelta(days=max_age_days)
+            conditions.append("updated < ?")
+            params.append(cutoff.strftime("%Y-%m-%d %H:%M:%S"))
+
+        if max_chats:
+            conditions.append(
+                "id NOT IN (SELECT id FROM chats ORDER BY updated DESC, id DESC LIMIT ?)"
+            )
+            params.append(max_chats)
+
+        def protected() -> list[int]:
+            ids = set(active_chat_ids()) if active_chat_ids else set()
+            if self.current_id is not None:
+                ids.add(self.current_id)
+            return list(ids)
+
+        chats_deleted = 0
+        while conditions:
+            with self.transaction():
+                keep = protected()
+                rows = self.cursor.execute(
+                    f"""
+                    SELECT id FROM chats
+                    WHERE id NOT IN ({','.join('?' * len(keep))})
+                    AND ({' OR '.join(conditions)})
+                    LIMIT ?
+                    """,
+                    (*keep, *params, batch_size),
+                ).fetchall()
+
+                if not rows:
+                    break
+
+                self._delete_chats(
+                    f"WHERE id IN ({','.join('?' * len(rows))})",
+                    tuple(row[0] for row in rows),
+                )
+                chats_deleted += len(rows)
+
+        payloads_dropped = 0
+        while search_payload_turns:
+            with self.transaction():
+                keep = protected()
+                payloads = self.cursor.execute(
+                    f"""
+                    SELECT h.message_id, h.blob_hash FROM chat_history h
+                    WHERE h.visible = 0 AND h.role = 'user'
+                    AND h.chat_id NOT IN ({','.join('?' * len(keep))})
+                    AND (
+                        SELECT COUNT(*) FROM chat_history t
+                        WHERE t.chat_id = h.chat_id AND t.visible > 0
+                        AND t.role = 'user' AND t.message_id > h.message_id
+                    ) >= ?
+                    LIMIT ?
+                    """,
+                    (*keep, search_payload_turns, batch_size),
+                ).fetchall()
+
+                if not payloads:
+                    break
+
+                self.cursor.executemany(
+                    "DELETE FROM chat_history WHERE message_id = ?",
+                    [(message_id,) for message_id, _ in payloads],
+                )
+                self.cursor.executemany(
+                    """
+                    DELETE FROM blobs WHERE hash = ?
+                    AND NOT EXISTS (SELECT 1 FROM chat_history WHERE blob_hash = blobs.hash)
+                    """,
+                    {(blob_hash,) for _, blob_hash in payloads if blob_hash},
+                )
+                payloads_dropped += len(payloads)
+
+        return chats_deleted, payloads_dropped
+
+    @_synchronized
+    def incremental_vacuum(self, pages: int) -> int:
+        """
+        Returns up to a number of free pages to the file system
+
+        Args:
+            pages: Most pages to release in this step
+
+        Returns:
+            Free pages remaining
+        """
+        # executescript steps the pragma to completion; execute stops after one page
+        self.cursor.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
 
+        return self.cursor.execute("PRAGMA freelist_count").fetchone()[0]
+
+    @_synchronized
+    def optimize(self) -> None:
+        """Refreshes query planner statistics and truncates the WAL"""
+        self.cursor.execute("PRAGMA analysis_limit = 1000")
+        self.cursor.execute("ANALYZE")
         self.db.commit()
+        self.cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
 
-        return ids_deleted
+    def get_db_stats(self) -> DatabaseStats:
+        """
+        Reports the size, fragmentation and row counts of the database
+
+        Returns:
+            DatabaseStats
+        """
+        cursor = self._read_cursor()
+        wal_path = self.db_path.with_name(self.db_path.name + "-wal")
+
+        def scalar(query: str) -> Any:
+            return cursor.execute(query).fetchone()[0]
+
+        return DatabaseStats(
+            file_bytes=self.db_path.stat().st_size,
+            wal_bytes=wal_path.stat().st_size if wal_path.exists() else 0,
+            page_size=scalar("PRAGMA page_size"),
+            page_count=scalar("PRAGMA page_count"),
+            free_pages=scalar("PRAGMA freelist_count"),
+            auto_vacuum=("none", "full", "incremental")[scalar("PRAGMA auto_vacuum")],
+            chats=scalar("SELECT COUNT(*) FROM chats"),
+            messages=scalar("SELECT COUNT(*) FROM chat_history"),
+            hidden_messages=scalar(
+                "SELECT COUNT(*) FROM chat_history WHERE visible = 0"
+            ),
+            blobs=scalar("SELECT COUNT(*) FROM blobs"),
+            blob_bytes=scalar("SELECT COALESCE(SUM(length(data)), 0) FROM blobs"),
+            blob_raw_bytes=scalar("SELECT COALESCE(SUM(size), 0) FROM blobs"),
+        )
+
+    @tracing.traced(category="memory")
+    def search_history(self, terms: list[str], limit: int = 10) -> list[SearchHit]:
+        """
+        Full-text search over visible messages and chat titles in every chat
+
+        Args:
+            terms: Words to match. All must occur, each also matching as a prefix
+            limit: Maximum number of chats to return
+
+        Returns:
+            Best-ranked hit per chat, best first. Message and title matches are
+            fused by reciprocal rank, and rank is the negated fused score.
+            Snippets mark matches with SNIPPET_START and SNIPPET_END
+        """
+        if not terms:
+            return []
+
+        cursor = self._read_cursor()
+
+        # Quoting makes every term a literal so FTS5 operators in user input are inert
+        query = " ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+        message_rows = cursor.execute(
+            """
+            SELECT h.chat_id, COALESCE(c.title, ''), COALESCE(h.created, c.created, ''),
+                snippet(chat_history_fts, 0, ?, ?, '…', 16)
+            FROM chat_history_fts
+            JOIN chat_history h ON h.message_id = chat_history_fts.rowid
+            JOIN chats c ON c.id = h.chat_id
+            WHERE chat_history_fts MATCH ?
+            ORDER BY bm25(chat_history_fts)
+            LIMIT ?
+            """,
+            (SNIPPET_START, SNIPPET_END, query, limit * 5),
+        ).fetchall()
+
+        title_rows = cursor.execute(
+            """
+            SELECT c.id, COALESCE(c.title, ''), COALESCE(c.updated, c.created, ''),
+                highlight(chats_fts, 0, ?, ?)
+            FROM chats_fts
+            JOIN chats c ON c.id = chats_fts.rowid
+            WHERE chats_fts MATCH ?
+            ORDER BY bm25(chats_fts)
+            LIMIT ?
+            """,
+            (SNIPPET_START, SNIPPET_END, query, limit),
+        ).fetchall()
+
+        # bm25 scores of the two tables are not comparable, so each chat is
+        # scored by its rank in each list instead
+        scores: dict[int, float] = {}
+        best: dict[int, tuple[int, tuple[Any, ...]]] = {}
+        for rows in (message_rows, title_rows):
+            ranked: dict[int, tuple[Any, ...]] = {}
+            for row in rows:
+                ranked.setdefault(row[0], row)
+
+            for rank, (chat_id, row) in enumerate(ranked.items(), 1):
+                scores[chat_id] = scores.get(chat_id, 0.0) + 1 / (SEARCH_RANK_K + rank)
+                if chat_id not in best or rank < best[chat_id][0]:
+                    best[chat_id] = (rank, row)
+
+        ordered = sorted(scores, key=lambda chat_id: -scores[chat_id])[:limit]
+
+        return [SearchHit(*best[chat_id][1], -scores[chat_id]) for chat_id in ordered]
 
     def get_chat_list(self, limit: str | int = 0) -> list[ChatHeader]:
         """
@@ -217,79 +982,165 @@ class Memory:
             limit: Limit of results. Leave empty for all records
 
         Returns:
-            List of dictionaries containing [{"date": str, "title": str}, ...]
+            List of ChatHeader, least recently updated first
         """
         if type(limit) is str:
             limit = int(limit)
 
         if limit:
-            chat_headers = reversed(
-                self.cursor.execute(
-                    f"SELECT * FROM chats ORDER BY updated DESC LIMIT {limit}"
+            return self.get_chat_page(limit)
+
+        cursor = self._read_cursor()
+        chat_headers = cursor.execute(
+            "SELECT id, created, updated, title FROM chats ORDER BY updated ASC, id ASC"
+        ).fetchall()
+
+        return [ChatHeader(*chat_header) for chat_header in chat_headers]
+
+    @tracing.traced(category="memory")
+    def get_chat_page(
+        self,
+        limit: int,
+        before: tuple[str, int] | None = None,
+        after: tuple[str, int] | None = None,
+    ) -> list[ChatHeader]:
+        """
+        Retrieves one page of chats by keyset pagination on (updated, id), so the
+        cost does not grow with the number of chats
+
+        Args:
+            limit: Page size
+            before: Only chats updated before this (updated, id) key
+            after: Only chats updated after this (updated, id) key
+
+        Returns:
+            List of ChatHeader, least recently updated first. Without 'after' this
+            is the most recent page before the key
+        """
+        cursor = self._read_cursor()
+
+        if after:
+            rows = cursor.execute(
+                """
+                SELECT id, created, updated, title FROM chats
+                WHERE (updated, id) > (?, ?)
+                ORDER BY updated ASC, id ASC LIMIT ?
+                """,
+                (*after, limit),
+            ).fetchall()
+        else:
+            condition = "WHERE (updated, id) < (?, ?)" if before else ""
+            rows = reversed(
+                cursor.execute(
+                    f"""
+                    SELECT id, created, updated, title FROM chats {condition}
+                    ORDER BY updated DESC, id DESC LIMIT ?
+                    """,
+                    (*before, limit) if before else (limit,),
                 ).fetchall()
             )
-        else:
-            chat_headers = self.cursor.execute(
-                "SELECT * FROM chats ORDER BY updated ASC"
-            ).fetchall()
 
-        chat_list = []
-        for chat_header in chat_headers:
-            chat_list.append(ChatHeader(*chat_header))
+        return [ChatHeader(*row) for row in rows]
 
-        return chat_list
+    def count_chats(self) -> int:
+        return self._read_cursor().execute("SELECT COUNT(*) FROM chats").fetchone()[0]
 
-    def _get_all_chat_ids(self) -> list[int]:
-        ids = [row[0] for row in self.cursor.execute("SELECT * FROM chats").fetchall()]
+    def _chat_exists(self, id: int) -> bool:
+        cursor = self._read_cursor()
+        row = cursor.execute("SELECT 1 FROM chats WHERE id = ?", (id,)).fetchone()
 
-        return ids
+        return row is not None
 
     def set_current_id(self, id: int) -> None:
         if id == self.current_id:
             raise ChatNotFoundError("ID currently loaded")
 
-        if id not in self._get_all_chat_ids():
+        if not self._chat_exists(id):
             raise ChatNotFoundError("ID does not exist")
 
         self.current_id = id
 
-    def _get_chat_records(self, id: int) -> list[ChatItem]:
+    @tracing.traced(category="memory")
+    def _get_chat_records(
+        self,
+        id: int,
+        visible_only: bool = False,
+        limit: int = -1,
+        before: ChatItem | None = None,
+    ) -> list[ChatItem]:
         """
         Retrieves a list of records by chat id from the database
 
         Args:
             id: id number of the chat
+            visible_only: Only return messages visible to the user
+            limit: Only the latest limit messages. -1 for all
+            before: Only messages older than this one
 
         Returns:
-            List of tuples containing individual message data
+            List of tuples containing individual message data, oldest first
         """
-        chat_records = self.cursor.execute(
-            f"SELECT * FROM chat_history WHERE id='{id}' ORDER BY created ASC"
+        conditions = "h.chat_id = ?"
+        params: list[Any] = [id]
+        if visible_only:
+            conditions += " AND h.visible > 0"
+        if before is not None:
+            conditions += " AND (h.created, h.message_id) < (?, ?)"
+            params += [before.created, before.message_id]
+
+        # Newest first so LIMIT keeps the latest messages; reversed below
+        cursor = self._read_cursor()
+        chat_records = cursor.execute(
+            f"""
+            SELECT h.chat_id, h.created, h.role, h.content, h.visible, h.message_id,
+                b.codec, b.data
+            FROM chat_history h
+            LEFT JOIN blobs b ON b.hash = h.blob_hash
+            WHERE {conditions}
+            ORDER BY h.created DESC, h.message_id DESC
+            LIMIT ?
+            """,
+            (*params, limit),
         ).fetchall()
-
-        output = [ChatItem(*row) for row in chat_records]
+        chat_records.reverse()
+
+        output = [
+            ChatItem(
+                chat_id,
+                created,
+                role,
+                _decode_blob(codec, data) if content is None else content,
+                visible,
+                message_id,
+            )
+            for chat_id, created, role, content, visible, message_id, codec, data in chat_records
+        ]
 
         return output
 
-    def get_llm_formatted_chat_history(self) -> list[dict[str, str]]:
+    def _load_history(self, id: int) -> list[Mapping[str, str]]:
         """
-        Retrieves chat logs in llm format
+        Reads a chat from the database in llm format for the history mirror
+
+        Args:
+            id: id number of the chat
 
         Returns:
-            List of dictionaries with {role, content} ollama format
+            List of read-only {role, content} mappings
         """
+        return [
+            MappingProxyType({"role": item.role, "content": item.message})
+            for item in self._get_chat_records(id)
+        ]
 
-        def format_history(item: ChatItem) -> dict[str, str]:
-            return {"role": item.role, "content": item.message}
-
-        if self.current_id is None:
-            return []
-        else:
-            formatted_chat_history = list(
-                map(format_history, self._get_chat_records(self.current_id))
-            )
+    def get_llm_formatted_chat_history(self) -> tuple[Mapping[str, str], ...]:
+        """
+        Retrieves chat logs in llm format from the in-memory mirror
 
-        return formatted_chat_history
+        Returns:
+            Tuple of read-only {role, content} mappings in ollama format
+        """
+        return tuple(self._history)
 
     def get_visible_chat_history(
         self,
@@ -300,14 +1151,428 @@ class Memory:
         Returns:
             List of dictionaries with [{roles, content}, visible]
         """
+        if self.current_id is None:
+            return []
+
+        return self._get_chat_records(self.current_id, visible_only=True)
+
+    def get_visible_page(
+        self, limit: int, before: ChatItem | None = None
+    ) -> list[ChatItem]:
+        """
+        Retrieves a window of the current chat's visible messages for display,
+        so long chats are shown a page at a time
 
-        chat_history = []
+        Args:
+            limit: Maximum number of messages
+            before: Only messages older than this one. Defaults to the latest
 
+        Returns:
+            List of ChatItem, oldest first
+        """
         if self.current_id is None:
             return []
-        else:
-            for item in self._get_chat_records(self.current_id):
-                if int(item.visible):
-                    chat_history.append(item)
 
-        return chat_history
+        return self._get_chat_records(
+            self.current_id, visible_only=True, limit=limit, before=before
+        )
+
+    @tracing.traced(category="memory")
+    def get_messages_after(self, message_id: int, limit: int) -> list[StoredMessage]:
+        """
+        Retrieves visible user and assistant messages in storage order, for indexing
+
+        Args:
+            message_id: Only messages with a greater id
+            limit: Maximum number of messages
+
+        Returns:
+            List of StoredMessage, lowest id first
+        """
+        cursor = self._read_cursor()
+        rows = cursor.execute(
+            """
+            SELECT h.message_id, h.chat_id, c.title, h.created, h.role, h.content
+            FROM chat_history h
+            JOIN chats c ON c.id = h.chat_id
+            WHERE h.message_id > ? AND h.visible > 0
+            AND h.role IN ('user', 'assistant')
+            ORDER BY h.message_id LIMIT ?
+            """,
+            (message_id, limit),
+        ).fetchall()
+
+        return [StoredMessage(*row) for row in rows]
+
+    @tracing.traced(category="memory")
+    def get_messages(self, message_ids: Sequence[int]) -> list[StoredMessage]:
+        """
+        Retrieves messages by id. Ids of deleted messages are skipped
+
+        Args:
+            message_ids: Ids to look up
+
+        Returns:
+            List of StoredMessage, in no particular order
+        """
+        if not message_ids:
+            return []
+
+        placeholders = ",".join("?" * len(message_ids))
+        cursor = self._read_cursor()
+        rows = cursor.execute(
+            f"""
+            SELECT h.message_id, h.chat_id, c.title, h.created, h.role, h.content
+            FROM chat_history h
+            JOIN chats c ON c.id = h.chat_id
+            WHERE h.message_id IN ({placeholders})
+            """,
+            tuple(message_ids),
+        ).fetchall()
+
+        return [StoredMessage(*row) for row in rows]
+
+    def iter_export(self, batch_size: int = 100) -> Iterator[dict[str, Any]]:
+        """
+        Streams every chat with its messages, oldest first. Chats are read in
+        keyset batches so memory use depends on batch_size, not on database size.
+        Reads use the calling thread's read-only connection, so writers are not blocked
+
+        Args:
+            batch_size: Chats read per query
+
+        Returns:
+            Iterator of {id, created, updated, title, messages: [{created, role, content, visible}]}
+        """
+        last_id = 0
+        cursor = self._read_cursor()
+
+        while True:
+            chats = cursor.execute(
+                "SELECT id, created, updated, title FROM chats WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size),
+            ).fetchall()
+
+            if not chats:
+                return
+
+            batch = {
+                id: {
+                    "id": id,
+                    "created": created,
+                    "updated": updated,
+                    "title": title,
+                    "messages": [],
+                }
+                for id, created, updated, title in chats
+            }
+
+            messages = cursor.execute(
+                """
+                SELECT h.chat_id, h.created, h.role, h.content, h.visible, b.codec, b.data
+                FROM chat_history h
+                LEFT JOIN blobs b ON b.hash = h.blob_hash
+                WHERE h.chat_id BETWEEN ? AND ?
+                ORDER BY h.chat_id, h.created, h.message_id
+                """,
+                (chats[0][0], chats[-1][0]),
+            )
+
+            for chat_id, created, role, content, visible, codec, data in messages:
+                batch[chat_id]["messages"].append(
+                    {
+                        "created": created,
+                        "role": role,
+                        "content": (
+                            _decode_blob(codec, data) if content is None else content
+                        ),
+                        "visible": visible,
+                    }
+                )
+
+            yield from batch.values()
+            last_id = chats[-1][0]
+
+    def import_chats(
+        self,
+        chats: Iterable[Mapping[str, Any]],
+        batch_size: int = 100,
+        progress: Callable[[int], None] | None = None,
+    ) -> int:
+        """
+        Appends chats in the iter_export format as new conversations. Each batch
+        is one transaction with its messages inserted by executemany, so an
+        interrupted import keeps every completed batch
+
+        Args:
+            chats: Chats to import, consumed lazily
+            batch_size: Chats per transaction
+            progress: Called with the running total after each batch
+
+        Returns:
+            Number of chats imported
+        """
+        imported = 0
+
+        for batch in _batched(chats, batch_size):
+            with self.transaction():
+                rows = []
+
+                for chat in batch:
+                    self.cursor.execute(
+                        "INSERT INTO chats (created, updated, title) VALUES (?,?,?)",
+                        (
+                            chat["created"],
+                            chat.get("updated") or chat["created"],
+                            chat["title"],
+                        ),
+                    )
+                    chat_id = self.cursor.lastrowid
+
+                    for message in chat["messages"]:
+                        content, visible = message["content"], int(message["visible"])
+
+                        if not visible and len(content) >= BLOB_THRESHOLD:
+                            content, blob_hash = None, _store_blob(self.cursor, content)
+                        else:
+                            blob_hash = None
+
+                        rows.append(
+                            (
+                                chat_id,
+                                message["created"],
+                                message["role"],
+                                content,
+                                visible,
+                                blob_hash,
+                            )
+                        )
+
+                self.cursor.executemany(
+                    "INSERT INTO chat_history (chat_id, created, role, content, visible, blob_hash) VALUES (?,?,?,?,?,?)",
+                    rows,
+                )
+
+            imported += len(batch)
+            if progress:
+                progress(imported)
+
+        return imported
+
+
+def _batched(items: Iterable[Any], size: int) -> Iterator[list[Any]]:
+    """Groups an iterable into lists of at most size items"""
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _store_blob(cursor: sqlite3.Cursor, content: str) -> str:
+    """
+    Stores content compressed and content-addressed. Identical payloads share a row
+
+    Returns:
+        SHA-256 hash referencing the blob
+    """
+    data = content.encode()
+    blob_hash = hashlib.sha256(data).hexdigest()
+
+    cursor.execute(
+        "INSERT OR IGNORE INTO blobs (hash, codec, size, data) VALUES (?, 'zlib', ?, ?)",
+        (blob_hash, len(data), zlib.compress(data, 6)),
+    )
+
+    return blob_hash
+
+
+def _decode_blob(codec: str, data: bytes) -> str:
+    """Restores content stored by _store_blob"""
+    match codec:
+        case "zlib":
+            return zlib.decompress(data).decode()
+        case _:
+            raise ValueError(f"Unknown blob codec '{codec}'")
+
+
+def _migration_1_baseline(cursor: sqlite3.Cursor) -> None:
+    """Original schema. A no-op for databases created before versioning"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chats(
+            id INTEGER PRIMARY KEY,
+            created TEXT,
+            updated TEXT,
+            title TEXT
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_history(
+            id INTEGER,
+            created TEXT,
+            role TEXT,
+            content TEXT,
+            visible INTEGER,
+            FOREIGN KEY (id) REFERENCES chats(id)
+        )
+    """)
+
+
+def _migration_2_message_keys(cursor: sqlite3.Cursor) -> None:
+    """
+    Gives messages a primary key, renames the chat foreign key to chat_id and
+    indexes messages by chat and time so history reads no longer scan the table
+    """
+    cursor.execute("""
+        CREATE TABLE chat_history_v2(
+            message_id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL REFERENCES chats(id),
+            created TEXT,
+            role TEXT,
+            content TEXT,
+            visible INTEGER
+        )
+    """)
+
+    # Rows left behind by deleted chats are dropped
+    cursor.execute("""
+        INSERT INTO chat_history_v2 (chat_id, created, role, content, visible)
+        SELECT id, created, role, content, visible FROM chat_history
+        WHERE id IN (SELECT id FROM chats)
+        ORDER BY id, created, rowid
+    """)
+
+    cursor.execute("DROP TABLE chat_history")
+    cursor.execute("ALTER TABLE chat_history_v2 RENAME TO chat_history")
+    cursor.execute(
+        "CREATE INDEX idx_chat_history_chat_created ON chat_history(chat_id, created)"
+    )
+
+
+def _migration_3_full_text_search(cursor: sqlite3.Cursor) -> None:
+    """
+    Adds FTS5 indexes over visible message content and chat titles, kept in sync
+    by triggers, and backfills them from existing rows
+    """
+    cursor.execute("""
+        CREATE VIRTUAL TABLE chat_history_fts USING fts5(
+            content,
+            content='chat_history',
+            content_rowid='message_id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+
+    # Hidden rows (system prompts, search results) are never indexed, so every
+    # 'delete' below only targets rows that were inserted
+    cursor.execute("""
+        CREATE TRIGGER chat_history_fts_insert AFTER INSERT ON chat_history
+        WHEN new.visible > 0 BEGIN
+            INSERT INTO chat_history_fts(rowid, content)
+            VALUES (new.message_id, new.content);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER chat_history_fts_delete AFTER DELETE ON chat_history
+        WHEN old.visible > 0 BEGIN
+            INSERT INTO chat_history_fts(chat_history_fts, rowid, content)
+            VALUES ('delete', old.message_id, old.content);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER chat_history_fts_update AFTER UPDATE OF content, visible
+        ON chat_history BEGIN
+            INSERT INTO chat_history_fts(chat_history_fts, rowid, content)
+            SELECT 'delete', old.message_id, old.content WHERE old.visible > 0;
+            INSERT INTO chat_history_fts(rowid, content)
+            SELECT new.message_id, new.content WHERE new.visible > 0;
+        END
+    """)
+
+    cursor.execute("""
+        CREATE VIRTUAL TABLE chats_fts USING fts5(
+            title,
+            content='chats',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER chats_fts_insert AFTER INSERT ON chats BEGIN
+            INSERT INTO chats_fts(rowid, title) VALUES (new.id, new.title);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER chats_fts_delete AFTER DELETE ON chats BEGIN
+            INSERT INTO chats_fts(chats_fts, rowid, title)
+            VALUES ('delete', old.id, old.title);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER chats_fts_update AFTER UPDATE OF title ON chats BEGIN
+            INSERT INTO chats_fts(chats_fts, rowid, title)
+            VALUES ('delete', old.id, old.title);
+            INSERT INTO chats_fts(rowid, title) VALUES (new.id, new.title);
+        END
+    """)
+
+    cursor.execute("""
+        INSERT INTO chat_history_fts(rowid, content)
+        SELECT message_id, content FROM chat_history WHERE visible > 0
+    """)
+    cursor.execute("INSERT INTO chats_fts(chats_fts) VALUES ('rebuild')")
+
+
+def _migration_4_chat_list_index(cursor: sqlite3.Cursor) -> None:
+    """Indexes chats by (updated, id) for keyset pagination of the chat list"""
+    cursor.execute("UPDATE chats SET updated = created WHERE updated IS NULL")
+    cursor.execute("CREATE INDEX idx_chats_updated ON chats(updated, id)")
+
+
+def _migration_5_compressed_blobs(cursor: sqlite3.Cursor) -> None:
+    """
+    Moves large hidden payloads (search results) into a compressed,
+    content-addressed blobs table referenced from chat_history
+    """
+    cursor.execute("""
+        CREATE TABLE blobs(
+            hash TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        )
+    """)
+    cursor.execute("ALTER TABLE chat_history ADD COLUMN blob_hash TEXT")
+    cursor.execute("""
+        CREATE INDEX idx_chat_history_blob ON chat_history(blob_hash)
+        WHERE blob_hash IS NOT NULL
+    """)
+
+    rows = cursor.execute(
+        "SELECT message_id, content FROM chat_history WHERE visible = 0 AND length(content) >= ?",
+        (BLOB_THRESHOLD,),
+    ).fetchall()
+
+    for message_id, content in rows:
+        cursor.execute(
+            "UPDATE chat_history SET content = NULL, blob_hash = ? WHERE message_id = ?",
+            (_store_blob(cursor, content), message_id),
+        )
+
+
+def _migration_6_incremental_vacuum(cursor: sqlite3.Cursor) -> None:
+    """
+    Switches to incremental auto-vacuum so maintenance can return free pages in
+    small steps. Takes effect with the VACUUM that follows migrations
+    """
+    cursor.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+
+
+# Append new migrations; never edit one that has shipped
+MIGRATIONS = [
+    _migration_1_baseline,
+    _migration_2_message_keys,
+    _migration_3_full_text_search,
+    _migration_4_chat_list_index,
+    _migration_5_compressed_blobs,
+    _migration_6_incremental_vacuum,
+]
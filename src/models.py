@@ -12,6 +12,7 @@ class ChatItem(NamedTuple):
     role: str
     message: str
     visible: int
+    message_id: int
 
 
 class ChatHeader(NamedTuple):
@@ -21,6 +22,65 @@ class ChatHeader(NamedTuple):
     title: str
 
 
+class SearchHit(NamedTuple):
+    chat_id: int
+    title: str
+    created: str
+    snippet: str
+    rank: float
+
+
+class StoredMessage(NamedTuple):
+    message_id: int
+    chat_id: int
+    title: str
+    created: str
+    role: str
+    content: str
+
+
+class DatabaseStats(NamedTuple):
+    file_bytes: int
+    wal_bytes: int
+    page_size: int
+    page_count: int
+    free_pages: int
+    auto_vacuum: str
+    chats: int
+    messages: int
+    hidden_messages: int
+    blobs: int
+    blob_bytes: int
+    blob_raw_bytes: int
+
+
+class MaintenanceReport(NamedTuple):
+    finished: str
+    chats_deleted: int
+    payloads_dropped: int
+    pages_freed: int
+    seconds: float
+
+
+class RenderStats(NamedTuple):
+    chunks: int
+    frames: int
+    dropped_frames: int
+    mean_render_ms: float
+    max_render_ms: float
+    frame_interval_ms: float
+    seconds: float
+
+
+class ModelCapabilities(NamedTuple):
+    model: str
+    digest: str
+    thinking: bool
+    completion: bool
+    context_length: int
+    structured_output: bool
+
+
 class ModelConfig(NamedTuple):
     main_model: str
     search_model: str
@@ -29,6 +89,20 @@ class ModelConfig(NamedTuple):
     search_thinking: bool
     initial_context: str
     system_instructions: str
+    speculative_generation: bool = False
+    max_parallel_requests: int = 1
+    embedding_model: str = ""
+    recall_top_k: int = 3
+    recall_token_budget: int = 512
+    condense_search_results: bool = False
+    prefill_cache: bool = True
+
+
+class MemoryConfig(NamedTuple):
+    max_chat_age_days: int = 0
+    max_chats: int = 0
+    search_payload_turns: int = 0
+    maintenance_interval_hours: float = 24
 
 
 class SearchConfig(NamedTuple):
@@ -36,6 +110,7 @@ class SearchConfig(NamedTuple):
     search_headers: str
     use_tor: bool
     tor_port: int
+    max_search_queries: int = 3
 
 
 class StyleConfig(NamedTuple):
@@ -46,6 +121,7 @@ class StyleConfig(NamedTuple):
     header: str
     warning: str
     text: str
+    frame_rate: int = 12
 
 
 class UserData(NamedTuple):
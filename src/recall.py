@@ -0,0 +1,309 @@
+"""
+Long-term memory across conversations. Visible user and assistant messages are
+embedded with a local Ollama embedding model into an append-only NumPy index on
+disk, and each turn recalls the most similar excerpts from other chats within a
+small token budget.
+"""
+
+import json
+import threading
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+import ollama
+
+from engine import AIEngine, Priority
+from memory import Memory
+
+# Rough token estimate used for the recall budget
+CHARS_PER_TOKEN = 4
+
+# Cosine similarity below which a past message is not considered relevant
+MIN_SCORE = 0.5
+
+# Messages embedded per background request, kept small so per-turn queries wait little
+INDEX_BATCH_SIZE = 32
+
+
+class VectorIndex:
+    """
+    Unit-normalized embeddings keyed by (message_id, chat_id). New rows are
+    appended to the files on disk, so updates cost only what was added
+
+    Files (next to memory.db):
+        <name>.json    {"model": ..., "dim": ...}
+        <name>.vec     float16 rows
+        <name>.ids     int64 (message_id, chat_id) pairs
+    """
+
+    def __init__(self, path: Path, model: str) -> None:
+        """
+        Args:
+            path: Path without suffix shared by the index files
+            model: Embedding model. An index built with another model is discarded
+        """
+        self.header_path = path.with_suffix(".json")
+        self.vectors_path = path.with_suffix(".vec")
+        self.keys_path = path.with_suffix(".ids")
+        self.model = model
+
+        self.dim = 0
+        self.size = 0
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._keys = np.empty((0, 2), dtype=np.int64)
+        self._lock = threading.Lock()
+
+        self._load()
+
+    def _load(self) -> None:
+        """Reads the index from disk, starting over if it is missing or stale"""
+        try:
+            with open(self.header_path, "r", encoding="utf-8") as file:
+                header = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            header = {}
+
+        if header.get("model") != self.model or not header.get("dim"):
+            self._reset()
+            return
+
+        self.dim = header["dim"]
+
+        try:
+            vectors = np.fromfile(self.vectors_path, dtype=np.float16)
+            keys = np.fromfile(self.keys_path, dtype=np.int64)
+        except FileNotFoundError:
+            self._reset()
+            return
+
+        vectors = vectors[: len(vectors) // self.dim * self.dim].reshape(-1, self.dim)
+        keys = keys[: len(keys) // 2 * 2].reshape(-1, 2)
+
+        # An interrupted append may leave one file a row ahead of the other
+        self.size = min(len(vectors), len(keys))
+        self._vectors = vectors[: self.size].astype(np.float32)
+        self._keys = keys[: self.size].copy()
+
+    def _reset(self) -> None:
+        """Deletes the files so the index is rebuilt from the database"""
+        for path in (self.header_path, self.vectors_path, self.keys_path):
+            path.unlink(missing_ok=True)
+
+    @property
+    def last_message_id(self) -> int:
+        """Highest indexed message_id, 0 when empty"""
+        with self._lock:
+            return int(self._keys[: self.size, 0].max()) if self.size else 0
+
+    def add(self, keys: Sequence[tuple[int, int]], vectors: np.ndarray) -> None:
+        """
+        Appends embeddings to the index and to disk
+
+        Args:
+            keys: (message_id, chat_id) per row
+            vectors: Embeddings, one row per key
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        keys_array = np.asarray(keys, dtype=np.int64).reshape(-1, 2)
+
+        with self._lock:
+            if not self.dim:
+                self.dim = vectors.shape[1]
+                with open(self.header_path, "w", encoding="utf-8") as file:
+                    json.dump({"model": self.model, "dim": self.dim}, file)
+
+            # Vectors first: on load, keys without a vector are dropped
+            with open(self.vectors_path, "ab") as file:
+                vectors.astype(np.float16).tofile(file)
+            with open(self.keys_path, "ab") as file:
+                keys_array.tofile(file)
+
+            needed = self.size + len(vectors)
+            if needed > len(self._vectors):
+                capacity = max(needed, len(self._vectors) * 2, 256)
+                grown_vectors = np.empty((capacity, self.dim), dtype=np.float32)
+                grown_keys = np.empty((capacity, 2), dtype=np.int64)
+                if self.size:
+                    grown_vectors[: self.size] = self._vectors[: self.size]
+                    grown_keys[: self.size] = self._keys[: self.size]
+                self._vectors, self._keys = grown_vectors, grown_keys
+
+            self._vectors[self.size : needed] = vectors
+            self._keys[self.size : needed] = keys_array
+            self.size = needed
+
+    def search(
+        self, query: Sequence[float], k: int, exclude_chat_id: int | None = None
+    ) -> list[tuple[int, float]]:
+        """
+        Finds the most similar messages by cosine similarity
+
+        Args:
+            query: Query embedding
+            k: Number of results
+            exclude_chat_id: Chat whose messages are skipped, usually the current one
+
+        Returns:
+            List of (message_id, score), best first
+        """
+        query_vector = np.asarray(query, dtype=np.float32)
+        query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+
+        with self._lock:
+            if not self.size or len(query_vector) != self.dim:
+                return []
+
+            scores = self._vectors[: self.size] @ query_vector
+            if exclude_chat_id is not None:
+                scores[self._keys[: self.size, 1] == exclude_chat_id] = -np.inf
+
+            k = min(k, self.size)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            return [
+                (int(self._keys[i, 0]), float(scores[i]))
+                for i in top
+                if np.isfinite(scores[i])
+            ]
+
+
+class LongTermMemory:
+    """Keeps the vector index in step with the database and recalls past excerpts"""
+
+    def __init__(
+        self,
+        memory: Memory,
+        engine: AIEngine,
+        top_k: int = 3,
+        token_budget: int = 512,
+        index_path: Path | None = None,
+    ) -> None:
+        """
+        Args:
+            memory: Memory object whose messages are indexed
+            engine: Engine with an embedding model configured
+            top_k: Excerpts recalled per turn at most
+            token_budget: Approximate tokens of excerpts recalled per turn
+            index_path: Path without suffix for the index files. Defaults to
+                memory_index next to memory.db
+        """
+        self.memory = memory
+        self.engine = engine
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.index_path = index_path or memory.db_path.with_name("memory_index")
+
+        self.index: VectorIndex | None = None
+        self.last_error: str | None = None
+
+        self._wake = threading.Event()
+        memory.add_listener(lambda _: self._wake.set())
+
+        # Loading and backfilling run in the background; recall is a no-op until ready
+        threading.Thread(target=self._run, daemon=True, name="recall-index").start()
+
+    def _run(self) -> None:
+        """Loads the index, then embeds new messages whenever some are stored"""
+        while True:
+            # Any error would otherwise end the thread and indexing with it
+            try:
+                if self.index is None:
+                    self.index = VectorIndex(
+                        self.index_path, self.engine.embedding_model
+                    )
+                self._sync()
+            except Exception as e:
+                # Retried when the next message is stored
+                self.last_error = f"{type(e).__name__}: {e}"
+
+            self._wake.wait()
+            self._wake.clear()
+
+    def _sync(self) -> None:
+        """Embeds every stored message past the last indexed one"""
+        import httpx
+
+        try:
+            while batch := self.memory.get_messages_after(
+                self.index.last_message_id, INDEX_BATCH_SIZE
+            ):
+                embeddings = self.engine.embed([message.content for message in batch])
+                self.index.add(
+                    [(message.message_id, message.chat_id) for message in batch],
+                    np.asarray(embeddings),
+                )
+        except (ollama.ResponseError, httpx.HTTPError, ConnectionError) as e:
+            # Retried when the next message is stored
+            self.last_error = str(e)
+        else:
+            self.last_error = None
+
+    def recall(self, query: str, exclude_chat_id: int | None = None) -> list[str]:
+        """
+        Retrieves excerpts of past messages relevant to a query
+
+        Args:
+            query: Latest user message
+            exclude_chat_id: Current chat, whose messages are already in context
+
+        Returns:
+            Formatted excerpts, most relevant first, within the token budget
+        """
+        import httpx
+
+        if self.index is None or not self.index.size:
+            return []
+
+        try:
+            query_embedding = self.engine.embed(
+                [query], priority=Priority.INTERACTIVE_CLASSIFY
+            )[0]
+        except (ollama.ResponseError, httpx.HTTPError, ConnectionError) as e:
+            self.last_error = str(e)
+            return []
+
+        # Extra candidates cover messages deleted since they were indexed
+        hits = [
+            (message_id, score)
+            for message_id, score in self.index.search(
+                query_embedding, self.top_k * 2, exclude_chat_id
+            )
+            if score >= MIN_SCORE
+        ]
+        messages = {
+            message.message_id: message
+            for message in self.memory.get_messages(
+                [message_id for message_id, _ in hits]
+            )
+        }
+
+        budget = self.token_budget * CHARS_PER_TOKEN
+        excerpts: list[str] = []
+
+        for message_id, _ in hits:
+            message = messages.get(message_id)
+            if message is None:
+                continue
+
+            header = (
+                f"[{message.created[:10]} | chat '{message.title}' | {message.role}] "
+            )
+            room = budget - len(header)
+            if room < 80:
+                break
+
+            text = " ".join(message.content.split())
+            if len(text) > room:
+                text = text[: room - 1] + "…"
+
+            excerpts.append(header + text)
+            budget -= len(header) + len(text)
+
+            if len(excerpts) == self.top_k:
+                break
+
+        return excerpts
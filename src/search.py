@@ -1,19 +1,138 @@
-from datetime import time
 import os
-from typing import TypedDict
-from dotenv import load_dotenv
-from tavily import TavilyClient
-import httpx
-from ddgs import DDGS
-import requests
-from bs4 import BeautifulSoup
-import trafilatura
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Sequence, TypedDict
+from urllib.parse import urlsplit, urlunsplit
+
+from exceptions import SearchUnavailableError, TorConnectionError
+import tracing
+
+# Search and extraction libraries (ddgs, tavily, requests, bs4, trafilatura) are
+# imported on first use to keep them out of startup time
+
+# Results requested from the search engine per query
+RESULTS_PER_QUERY = 5
+# Distinct pages kept after merging the rankings of all queries
+MAX_PAGES = 5
+# Reciprocal rank fusion constant. Larger values weigh top ranks less
+RRF_K = 60
+
+
+class PageText(TypedDict):
+    reference_num: str
+    title: str
+    url: str
+    text: str
 
 
 class SearchResult(TypedDict):
     notifications: list[str]
     context: str
     message: str
+    pages: list[PageText]
+
+
+def format_search_context(context: str) -> str:
+    """
+    Prefixes search results with the citation instructions for the main model
+
+    Args:
+        context: Context string from a SearchResult
+
+    Returns:
+        Content for Memory.add_search_message
+    """
+    return f"Citations: Every claim derived from the below search results must be attributed using in-line Markdown hyperlinks: [Source [NUMBER](URL)]\n\n{context}"
+
+
+def format_condensed_context(pages: list[PageText], facts: list[str | None]) -> str:
+    """
+    Builds a SearchResult-style context from condensed fact lists, keeping each
+    page's reference number, title and URL so the main model can still cite it
+
+    Args:
+        pages: Pages from a SearchResult
+        facts: Fact list per page, None for pages with nothing relevant
+
+    Returns:
+        Context string for format_search_context
+    """
+    return "".join(
+        f"REFERENCE_NUM: {page['reference_num']}\n"
+        f"TITLE: {page['title']}\n"
+        f"URL: {page['url']}\n"
+        f"FACTS:\n{page_facts}\n\n"
+        for page, page_facts in zip(pages, facts)
+        if page_facts
+    )
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]], k: int = RRF_K
+) -> list[str]:
+    """
+    Merges rankings by reciprocal rank fusion: each key scores the sum of
+    1 / (k + rank) over the rankings it appears in
+
+    Args:
+        rankings: Keys in ranked order, one sequence per ranking
+        k: Fusion constant
+
+    Returns:
+        Every key, best first. Ties keep the order keys were first seen in
+
+    Example:
+        reciprocal_rank_fusion([["a", "b"], ["b", "c"]])  # ["b", "a", "c"]
+    """
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1 / (k + rank)
+
+    return sorted(scores, key=scores.__getitem__, reverse=True)
+
+
+def _normalize_url(url: str) -> str:
+    """De-duplication key for a URL, ignoring host case, fragment and trailing slash"""
+    parts = urlsplit(url)
+    return urlunsplit(
+        (
+            parts.scheme.lower(),
+            parts.netloc.lower(),
+            parts.path.rstrip("/"),
+            parts.query,
+            "",
+        )
+    )
+
+
+def fuse_results(
+    rankings: Sequence[Sequence[dict]], url_key: str, limit: int = MAX_PAGES
+) -> list[dict]:
+    """
+    Merges the ranked results of several queries into the top distinct pages
+
+    Args:
+        rankings: Search engine results per query, best first
+        url_key: Key holding a result's URL
+        limit: Results kept
+
+    Returns:
+        Results ranked by reciprocal rank fusion, one per URL
+    """
+    by_key: dict[str, dict] = {}
+    keyed: list[list[str]] = []
+
+    for ranking in rankings:
+        keys: dict[str, None] = {}
+        for result in ranking:
+            if url := result.get(url_key):
+                key = _normalize_url(url)
+                by_key.setdefault(key, result)
+                keys[key] = None
+        keyed.append(list(keys))
+
+    return [by_key[key] for key in reciprocal_rank_fusion(keyed)[:limit]]
 
 
 class SearchEngine:
@@ -25,44 +144,139 @@ class SearchEngine:
         user_agent: str = "",
         use_tor: bool = True,
         tor_port: int = 9050,
+        max_queries: int = 3,
     ) -> None:
         self.selected_engine = selected_engine
         self.user_agent = user_agent
         self.use_tor = use_tor
         self.tor_port = tor_port
+        # Sub-queries the search decision may split a search into
+        self.max_queries = max_queries
+
+        # Clients are created on first use and reused so connections are pooled
+        self._clients_lock = threading.Lock()
+        self._http_session = None
+        self._tavily_client = None
+
+    def get_http_session(self):
+        """
+        Retrieves the pooled HTTP session used to fetch result pages
+
+        Returns:
+            requests.Session shared by all searches on this engine
+        """
+        import requests
+
+        with self._clients_lock:
+            if self._http_session is None:
+                self._http_session = requests.Session()
+                self._http_session.headers["User-Agent"] = self.user_agent
+
+            return self._http_session
+
+    def get_tavily_client(self, api_key: str):
+        """
+        Retrieves the pooled Tavily client
+
+        Args:
+            api_key: Tavily API key
+
+        Returns:
+            TavilyClient shared by all searches on this engine
+        """
+        from tavily import TavilyClient
 
-    def text_query(self, query: str) -> SearchResult:
+        with self._clients_lock:
+            if self._tavily_client is None:
+                self._tavily_client = TavilyClient(api_key=api_key)
+
+            return self._tavily_client
+
+    def text_query(self, query: str | Sequence[str]) -> SearchResult:
         """
-        Searches the internet using the selected search tool
+        Searches the internet using the selected search tool. Several queries are
+        looked up concurrently and their results merged into one ranking
 
         Args:
-            query: Search query
+            query: Search query, or the sub-queries returned by determine_search
 
         Returns:
             Dictionary with 'notifications' and 'context' keys
+
+        Raises:
+            SearchUnavailableError: No query was given or the search engine failed
+        """
+        queries = [query] if isinstance(query, str) else list(query)
+        if not queries:
+            raise SearchUnavailableError("No search query")
+
+        with tracing.span(
+            "web search", "search", engine=self.selected_engine, query=queries
+        ):
+            match self.selected_engine:
+                case "tavily":
+                    return self.search_tavily(queries)
+                case "ddgs":
+                    from ddgs.exceptions import DDGSException
+
+                    try:
+                        return self.search_duckduckgo(queries)
+                    except DDGSException as e:
+                        raise SearchUnavailableError(str(e)) from e
+                case _:
+                    raise Exception("No engine selected, search unsuccesful")
+
+    def _lookup_all(
+        self, lookup: Callable[[str], list[dict]], queries: Sequence[str]
+    ) -> list[list[dict]]:
+        """
+        Runs a search engine lookup for each query concurrently
+
+        Args:
+            lookup: Returns the ranked results of one query
+            queries: Queries to look up
+
+        Returns:
+            Ranked results per query that succeeded. Raises the first error if none did
         """
-        match self.selected_engine:
-            case "tavily":
-                return self.search_tavily(query)
-            case "ddgs":
-                return self.search_duckduckgo(query)
-            case _:
-                raise Exception("No engine selected, search unsuccesful")
+        if len(queries) == 1:
+            return [lookup(queries[0])]
+
+        with ThreadPoolExecutor(
+            max_workers=len(queries), thread_name_prefix="search"
+        ) as pool:
+            futures = [pool.submit(lookup, query) for query in queries]
+
+        rankings: list[list[dict]] = []
+        errors: list[Exception] = []
+        for future in futures:
+            try:
+                rankings.append(future.result())
+            except Exception as e:
+                errors.append(e)
+
+        if not rankings:
+            raise errors[0]
+
+        return rankings
 
-    def search_tavily(self, query: str) -> SearchResult:
+    def search_tavily(self, queries: Sequence[str]) -> SearchResult:
         """
         Searches the internet using Tavily
 
         Args:
-            query: Search query
+            queries: Search queries, merged by reciprocal rank fusion
 
         Returns:
             Dictionary with 'notifications' and 'context' keys
         """
         context: str = ""
         notifications: list[str] = []
+        pages: list[PageText] = []
         message = ""
 
+        from dotenv import load_dotenv
+
         try:
             load_dotenv()
             api_key = os.getenv("TAVILY_KEY")
@@ -70,13 +284,28 @@ class SearchEngine:
             if not api_key:
                 raise ValueError("TAVILY_KEY not found in environment variables")
 
-            tavily_client = TavilyClient(api_key=api_key)
-            response = tavily_client.search(query)
+            client = self.get_tavily_client(api_key)
+
+            def lookup(query: str) -> list[dict]:
+                with tracing.span("tavily lookup", "search", query=query):
+                    return client.search(query, max_results=RESULTS_PER_QUERY).get(
+                        "results", []
+                    )
+
+            results = fuse_results(self._lookup_all(lookup, queries), "url")
 
-            for i, result in enumerate(response.get("results", []), 1):
+            for i, result in enumerate(results, 1):
                 title = result.get("title", "No Title")
                 content = result.get("content", "")
                 url = result.get("url", "")
+                pages.append(
+                    {
+                        "reference_num": f"[{i}]",
+                        "title": title,
+                        "url": url,
+                        "text": content,
+                    }
+                )
 
                 context += (
                     f"REFERENCE_NUM: [{i}]\n"
@@ -90,35 +319,60 @@ class SearchEngine:
                 "notifications": notifications,
                 "context": context,
                 "message": message,
+                "pages": pages,
             }
 
         except ValueError as e:
             notifications.append(f"Configuration error: {str(e)}")
-            return {"notifications": notifications, "context": "", "message": message}
+            return {
+                "notifications": notifications,
+                "context": "",
+                "message": message,
+                "pages": [],
+            }
 
         except Exception as e:
             notifications.append(f"Tavily search error: {str(e)}")
-            return {"notifications": notifications, "context": "", "message": message}
+            return {
+                "notifications": notifications,
+                "context": "",
+                "message": message,
+                "pages": [],
+            }
 
     def verify_tor_connection(self) -> str:
+        """
+        Checks that requests are routed through Tor
+
+        Returns:
+            Status reported by check.torproject.org
+
+        Raises:
+            TorConnectionError: The Tor proxy is unreachable
+        """
+        import httpx
+
         TOR_PROXY = f"socks5://127.0.0.1:{self.tor_port}"
         try:
             with httpx.Client(proxy=TOR_PROXY) as check_client:
                 response = check_client.get("https://check.torproject.org/api/ip")
                 return response.text
         except httpx.ConnectError as e:
-            raise e
+            raise TorConnectionError(str(e)) from e
 
-    def search_duckduckgo(self, query: str) -> SearchResult:
+    def search_duckduckgo(self, queries: Sequence[str]) -> SearchResult:
         """
         Searches the internet using duckduckgo search with article-focused content extraction.
+        The rankings of all queries are merged and the top distinct pages fetched concurrently
 
         Args:
-            query: Search query
+            queries: Search queries, merged by reciprocal rank fusion
 
         Returns:
             Dictionary with 'notifications' and 'context' keys
         """
+        from ddgs import DDGS
+
         message: str = ""
 
         if self.use_tor:
@@ -127,119 +381,143 @@ class SearchEngine:
         else:
             TOR_PROXY = ""
 
-        with DDGS(proxy=TOR_PROXY) as ddgs:
-            results: list[dict] = []
-            notifications: list[str] = []
-            context: str = ""
+        def lookup(query: str) -> list[dict]:
+            with (
+                DDGS(proxy=TOR_PROXY) as ddgs,
+                tracing.span("ddgs lookup", "search", query=query),
+            ):
+                return ddgs.text(
+                    query, max_results=RESULTS_PER_QUERY, backend="duckduckgo"
+                )
 
-            search_results = ddgs.text(query, max_results=5, backend="duckduckgo")
+        search_results = fuse_results(self._lookup_all(lookup, queries), "href")
 
-            for i, result in enumerate(search_results):
-                url = result.get("href")
-                if url:
-                    try:
-                        timeout = 8 if self.use_tor else 3
+        timeout = 8 if self.use_tor else 3
+        results: list[PageText] = []
+        notifications: list[str] = []
+        context: str = ""
 
-                        headers = {"User-Agent": self.user_agent}
-                        response = requests.get(url, headers=headers, timeout=timeout)
-                        notifications.append(
-                            f"[{response.status_code}]: {response.url}"
-                        )
+        pool = ThreadPoolExecutor(
+            max_workers=max(len(search_results), 1), thread_name_prefix="fetch"
+        )
+        futures = [
+            pool.submit(
+                self._fetch_page, result["href"], result.get("title"), i, timeout
+            )
+            for i, result in enumerate(search_results, 1)
+        ]
+        # Connect and read timeouts apply per request, so allow both
+        wait(futures, timeout=2 * timeout)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+        for i, (result, future) in enumerate(zip(search_results, futures), 1):
+            if future.done():
+                page, notification = future.result()
+            else:
+                page = {
+                    "reference_num": f"[{i}]",
+                    "title": result.get("title"),
+                    "url": result["href"],
+                    "text": "Unable to fetch - timed out",
+                }
+                notification = f"Timed out: {result['href']}"
+
+            results.append(page)
+            notifications.append(notification)
+
+        # Build context string
+        for result in results:
+            context += (
+                f"REFERENCE_NUM: {result['reference_num']}\n"
+                f"TITLE: {result['title']}\n"
+                f"URL: {result['url']}\n"
+                f"CONTENT: {result['text']}...\n\n"
+            )
+
+        return {
+            "notifications": notifications,
+            "context": context,
+            "message": message,
+            "pages": results,
+        }
+
+    def _fetch_page(
+        self, url: str, title: str | None, number: int, timeout: float
+    ) -> tuple[PageText, str]:
+        """
+        Fetches a result page and extracts its main text
 
-                        extracted_text = trafilatura.extract(
-                            response.content,
-                            include_comments=False,
-                            include_tables=True,
-                            no_fallback=False,
-                        )
+        Args:
+            url: Page URL
+            title: Title from the search results
+            number: Reference number of the page
+            timeout: Seconds allowed to connect and between received bytes
 
-                        if not extracted_text:
-                            soup = BeautifulSoup(response.content, "html.parser")
-
-                            # Remove unwanted elements
-                            for element in soup(
-                                [
-                                    "script",
-                                    "style",
-                                    "nav",
-                                    "footer",
-                                    "header",
-                                    "aside",
-                                ]
-                            ):
-                                element.decompose()
-
-                            # Try to find main content areas
-                            main_content = (
-                                soup.find("main")
-                                or soup.find("article")
-                                or soup.find(
-                                    "div",
-                                    class_=[
-                                        "content",
-                                        "main-content",
-                                        "post-content",
-                                    ],
-                                )
-                                or soup.body
-                            )
-                            extracted_text = (
-                                main_content.get_text(separator="\n", strip=True)
-                                if main_content
-                                else ""
-                            )
-
-                        # Clean up the text
-                        cleaned_text = "\n".join(
-                            line.strip()
-                            for line in extracted_text.split("\n")
-                            if line.strip()
-                        )
+        Returns:
+            The page and a notification about the fetch
+        """
+        import requests
+        import trafilatura
+        from bs4 import BeautifulSoup
 
-                        # Truncate to reasonable length (keeping slightly more for context)
-                        truncated_text = cleaned_text[:2000]
+        page: PageText = {
+            "reference_num": f"[{number}]",
+            "title": title,
+            "url": url,
+            "text": "",
+        }
 
-                        results.append(
-                            {
-                                "reference_num": f"[{i + 1}]",
-                                "title": result.get("title"),
-                                "url": url,
-                                "text": truncated_text,
-                            }
-                        )
+        try:
+            with tracing.span("fetch page", "search", url=url):
+                response = self.get_http_session().get(url, timeout=timeout)
+            notification = f"[{response.status_code}]: {response.url}"
+
+            with tracing.span("extract", "search", bytes=len(response.content)):
+                extracted_text = trafilatura.extract(
+                    response.content,
+                    include_comments=False,
+                    include_tables=True,
+                    no_fallback=False,
+                )
 
-                    except requests.RequestException as e:
-                        notifications.append(f"Request error for {url}: {str(e)}")
-                        results.append(
-                            {
-                                "reference_num": f"[{i + 1}]",
-                                "title": result.get("title"),
-                                "url": url,
-                                "text": "Unable to fetch - request failed",
-                            }
+                if not extracted_text:
+                    soup = BeautifulSoup(response.content, "html.parser")
+
+                    # Remove unwanted elements
+                    for element in soup(
+                        ["script", "style", "nav", "footer", "header", "aside"]
+                    ):
+                        element.decompose()
+
+                    # Try to find main content areas
+                    main_content = (
+                        soup.find("main")
+                        or soup.find("article")
+                        or soup.find(
+                            "div",
+                            class_=["content", "main-content", "post-content"],
                         )
-                    except Exception as e:
-                        notifications.append(f"Error processing {url}: {str(e)}")
-                        results.append(
-                            {
-                                "reference_num": f"[{i + 1}]",
-                                "title": result.get("title"),
-                                "url": url,
-                                "text": "Unable to process content",
-                            }
-                        )
-
-            # Build context string
-            for result in results:
-                context += (
-                    f"REFERENCE_NUM: {result['reference_num']}\n"
-                    f"TITLE: {result['title']}\n"
-                    f"URL: {result['url']}\n"
-                    f"CONTENT: {result['text']}...\n\n"
+                        or soup.body
+                    )
+                    extracted_text = (
+                        main_content.get_text(separator="\n", strip=True)
+                        if main_content
+                        else ""
+                    )
+
+                # Clean up the text
+                cleaned_text = "\n".join(
+                    line.strip() for line in extracted_text.split("\n") if line.strip()
                 )
 
-            return {
-                "notifications": notifications,
-                "context": context,
-                "message": message,
-            }
+                # Truncate to reasonable length (keeping slightly more for context)
+                page["text"] = cleaned_text[:2000]
+
+        except requests.RequestException as e:
+            notification = f"Request error for {url}: {str(e)}"
+            page["text"] = "Unable to fetch - request failed"
+        except Exception as e:
+            notification = f"Error processing {url}: {str(e)}"
+            page["text"] = "Unable to process content"
+
+        return page, notification
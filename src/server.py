@@ -0,0 +1,545 @@
+"""
+Local HTTP API for the chat pipeline. Editor plugins and scripts share one warm
+AIEngine, one pooled SearchEngine and one database connection instead of each
+starting its own process.
+
+Endpoints:
+    GET    /health                   Server status and models
+    POST   /sessions                 Create a session -> {"session_id"}
+    DELETE /sessions/<id>            Close a session. Idle sessions expire on their own
+    POST   /chat                     {"message", "session_id"?, "chat_id"?, "stream"?}
+                                     Streams Server-Sent Events unless "stream" is false
+    GET    /conversations?limit=N    List chats
+    GET    /conversations/<id>       Visible messages of a chat
+    DELETE /conversations/<id>       Delete a chat
+    POST   /search                   {"query"} -> raw search results. A list of
+                                     queries is merged into one ranking
+
+Usage (from src/):
+    python server.py --host 127.0.0.1 --port 8765
+
+The server has no authentication and is meant to listen on localhost only.
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+from urllib.parse import parse_qs, urlparse
+
+import ollama
+
+from config import get_config
+from engine import AIEngine
+from exceptions import ChatNotFoundError, SearchUnavailableError
+from maintenance import MaintenanceWorker
+from memory import Memory
+from models import ModelConfig, UserData
+from search import SearchEngine, format_condensed_context, format_search_context
+
+# Seconds without a turn after which a session is closed
+SESSION_IDLE_TTL = 3600
+
+
+class Session:
+    """A client session with its own current chat on the shared database connection"""
+
+    def __init__(self, session_id: str, memory: Memory) -> None:
+        self.id = session_id
+        self.memory = memory
+        # One turn at a time per session; other sessions are unaffected
+        self.turn_lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def expired(self, ttl: float) -> bool:
+        """Whether the session has been idle for longer than ttl seconds"""
+        return not self.turn_lock.locked() and time.monotonic() - self.last_used > ttl
+
+
+class ChatService:
+    """Runs the chat pipeline for many sessions on shared engine, search and memory"""
+
+    def __init__(
+        self,
+        ai: AIEngine,
+        search: SearchEngine,
+        memory: Memory,
+        model_config: ModelConfig,
+        user_data: UserData,
+        session_ttl: float = SESSION_IDLE_TTL,
+    ) -> None:
+        """
+        Args:
+            session_ttl: Seconds a session may stay idle before it is closed
+        """
+        self.ai = ai
+        self.search = search
+        self.memory = memory
+        self.model_config = model_config
+        self.user_data = user_data
+        self.session_ttl = session_ttl
+
+        self._sessions: dict[str, Session] = {}
+        self._sessions_lock = threading.Lock()
+
+    def get_session(self, session_id: str | None = None) -> Session:
+        """
+        Retrieves a session, creating it if it does not exist
+
+        Args:
+            session_id: Existing session id, or None for a new session
+
+        Returns:
+            Session object
+        """
+        with self._sessions_lock:
+            self._expire_sessions()
+            session_id = session_id or uuid.uuid4().hex
+
+            if session_id not in self._sessions:
+                self._sessions[session_id] = Session(
+                    session_id, self.memory.new_session()
+                )
+
+            session = self._sessions[session_id]
+            session.last_used = time.monotonic()
+
+            return session
+
+    def close_session(self, session_id: str) -> bool:
+        """
+        Closes a session. A turn already running in it still completes
+
+        Args:
+            session_id: Session to close
+
+        Returns:
+            True if the session existed
+        """
+        with self._sessions_lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _expire_sessions(self) -> None:
+        """Drops idle sessions. Callers hold _sessions_lock"""
+        for session_id in [
+            session_id
+            for session_id, session in self._sessions.items()
+            if session.expired(self.session_ttl)
+        ]:
+            del self._sessions[session_id]
+
+    def active_chat_ids(self) -> set[int]:
+        """
+        Retrieves the chats loaded by open sessions. Expired sessions no longer
+        count, so retention can prune their chats
+
+        Returns:
+            Set of chat ids
+        """
+        with self._sessions_lock:
+            self._expire_sessions()
+            return {
+                session.memory.current_id
+                for session in self._sessions.values()
+                if session.memory.current_id is not None
+            }
+
+    def chat(
+        self, session: Session, message: str, chat_id: int | None = None
+    ) -> Iterator[tuple[str, dict[str, Any]]]:
+        """
+        Runs one turn: classify, search if needed, then stream the response
+
+        Args:
+            session: Session the turn belongs to
+            message: User message
+            chat_id: Chat to continue. Defaults to the session's current chat
+
+        Returns:
+            Iterator of (event, data) pairs
+        """
+        with session.turn_lock:
+            memory = session.memory
+
+            if chat_id is not None and chat_id != memory.current_id:
+                memory.set_current_id(chat_id)
+
+            with memory.transaction():
+                if not memory.current_id:
+                    memory.create_conversation(" ".join(message.split()[:10]))
+                    memory.add_system_message(
+                        self.model_config.initial_context,
+                        self.model_config.system_instructions,
+                        self.user_data.user_data,
+                    )
+
+                # Messages of this turn are removed again if the response fails
+                turn_start = len(memory.get_llm_formatted_chat_history())
+                memory.add_user_message(message)
+
+            try:
+                yield from self._run_turn(session, turn_start)
+            finally:
+                session.last_used = time.monotonic()
+
+    def _run_turn(
+        self, session: Session, turn_start: int
+    ) -> Iterator[tuple[str, dict[str, Any]]]:
+        """
+        Answers the user message just stored, see chat
+
+        Args:
+            session: Session the turn belongs to
+            turn_start: Messages in the chat before the turn
+
+        Returns:
+            Iterator of (event, data) pairs
+        """
+        memory = session.memory
+
+        try:
+            yield "session", {"session_id": session.id, "chat_id": memory.current_id}
+
+            search_decision = self.ai.determine_search(
+                memory.get_llm_formatted_chat_history(),
+                self.user_data,
+                session=session.id,
+                max_queries=self.search.max_queries,
+            )
+            yield "search", search_decision
+
+            if search_decision["needs_search"]:
+                try:
+                    search_data = self.search.text_query(
+                        search_decision["search_queries"]
+                    )
+                except SearchUnavailableError as e:
+                    yield "warning", {"message": f"Unable to get search results: {e}"}
+                    memory.add_search_message(
+                        "Search unsuccessful. Unable to get search results."
+                    )
+                else:
+                    yield "sources", {"sources": search_data["notifications"]}
+                    search_result = search_data["context"]
+
+                    if (
+                        self.model_config.condense_search_results
+                        and search_data["pages"]
+                    ):
+                        facts = self.ai.condense_pages(
+                            search_data["pages"],
+                            "; ".join(search_decision["search_queries"]),
+                            session=session.id,
+                        )
+                        search_result = format_condensed_context(
+                            search_data["pages"], facts
+                        )
+
+                    memory.add_search_message(format_search_context(search_result))
+
+            thoughts: list[str] = []
+            content: list[str] = []
+
+            for chunk in self.ai.get_response_stream(
+                memory.get_llm_formatted_chat_history(), session=session.id
+            ):
+                msg = chunk.get("message", {})
+
+                if msg.get("thinking"):
+                    thoughts.append(msg["thinking"])
+                    yield "thinking", {"text": msg["thinking"]}
+
+                if msg.get("content"):
+                    content.append(msg["content"])
+                    yield "token", {"text": msg["content"]}
+
+            memory.add_assistant_message("".join(content))
+        except (Exception, GeneratorExit):
+            # A failed model call or a client that went away leaves no reply
+            memory.truncate_history(turn_start)
+            raise
+
+        yield "done", {
+            "session_id": session.id,
+            "chat_id": memory.current_id,
+            "thoughts": "".join(thoughts),
+            "content": "".join(content),
+        }
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Routes HTTP requests to the shared ChatService"""
+
+    service: ChatService
+
+    def log_message(self, format: str, *args) -> None:
+        """Keeps request logs terse"""
+        print(f"[{datetime.now():%H:%M:%S}] {format % args}")
+
+    def _read_json(self) -> dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+
+        return json.loads(self.rfile.read(length))
+
+    def _send_json(self, data: Any, status: int = 200) -> None:
+        body = json.dumps(data).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str) -> None:
+        self._send_json({"error": message}, status=status)
+
+    def _parse_int(self, value: Any, name: str) -> int | None:
+        """Parses an integer parameter, answering 400 if it is not one"""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            self._send_error(400, f"'{name}' must be an integer")
+            return None
+
+    def _route(self) -> tuple[list[str], dict[str, list[str]]]:
+        url = urlparse(self.path)
+        return [part for part in url.path.split("/") if part], parse_qs(url.query)
+
+    def do_GET(self) -> None:
+        parts, query = self._route()
+        service = self.service
+
+        match parts:
+            case ["health"]:
+                self._send_json(
+                    {
+                        "status": "ok",
+                        "model": service.ai.model,
+                        "search_model": service.ai.search_model,
+                        "search_engine": service.search.selected_engine,
+                        "queue_depth": service.ai.scheduler.queue_depth,
+                        "queue_wait": {
+                            priority.name.lower(): str(stats)
+                            for priority, stats in service.ai.scheduler.stats.items()
+                        },
+                    }
+                )
+
+            case ["conversations"]:
+                limit = self._parse_int(query.get("limit", ["0"])[0], "limit")
+                if limit is None:
+                    return
+
+                self._send_json(
+                    [header._asdict() for header in service.memory.get_chat_list(limit)]
+                )
+
+            case ["conversations", chat_id]:
+                chat_id = self._parse_int(chat_id, "id")
+                if chat_id is None:
+                    return
+
+                session = service.memory.new_session()
+                try:
+                    session.set_current_id(chat_id)
+                except ChatNotFoundError as e:
+                    self._send_error(404, e.args[0])
+                    return
+
+                self._send_json(
+                    [item._asdict() for item in session.get_visible_chat_history()]
+                )
+
+            case _:
+                self._send_error(404, "Not found")
+
+    def do_DELETE(self) -> None:
+        parts, _ = self._route()
+
+        match parts:
+            case ["conversations", chat_id]:
+                chat_id = self._parse_int(chat_id, "id")
+                if chat_id is None:
+                    return
+
+                # The base memory only protects its own current chat
+                if chat_id in self.service.active_chat_ids():
+                    self._send_error(409, "Chat is open in a session")
+                    return
+
+                try:
+                    deleted = self.service.memory.delete(chat_id)
+                except ChatNotFoundError as e:
+                    self._send_error(404, e.args[0])
+                    return
+
+                self._send_json({"deleted": deleted})
+
+            case ["sessions", session_id]:
+                if not self.service.close_session(session_id):
+                    self._send_error(404, "Session not found")
+                    return
+
+                self._send_json({"closed": session_id})
+
+            case _:
+                self._send_error(404, "Not found")
+
+    def do_POST(self) -> None:
+        parts, _ = self._route()
+
+        try:
+            body = self._read_json()
+        except ValueError:
+            self._send_error(400, "Invalid JSON")
+            return
+
+        if not isinstance(body, dict):
+            self._send_error(400, "Body must be a JSON object")
+            return
+
+        match parts:
+            case ["sessions"]:
+                self._send_json({"session_id": self.service.get_session().id})
+
+            case ["chat"]:
+                self._handle_chat(body)
+
+            case ["search"]:
+                query = body.get("query")
+                queries = [query] if isinstance(query, str) else query
+                if (
+                    not isinstance(queries, list)
+                    or not queries
+                    or not all(isinstance(q, str) and q.strip() for q in queries)
+                ):
+                    self._send_error(
+                        400, "'query' must be a string or a list of non-empty strings"
+                    )
+                    return
+
+                # Each query is a concurrent lookup, so clients get the configured cap
+                queries = queries[: self.service.search.max_queries]
+
+                try:
+                    self._send_json(self.service.search.text_query(queries))
+                except SearchUnavailableError as e:
+                    self._send_error(502, f"Unable to get search results: {e}")
+
+            case _:
+                self._send_error(404, "Not found")
+
+    def _handle_chat(self, body: dict[str, Any]) -> None:
+        if not body.get("message"):
+            self._send_error(400, "'message' is required")
+            return
+
+        chat_id = body.get("chat_id")
+        if chat_id is not None:
+            chat_id = self._parse_int(chat_id, "chat_id")
+            if chat_id is None:
+                return
+
+        session = self.service.get_session(body.get("session_id"))
+        events = self.service.chat(session, body["message"], chat_id)
+
+        if body.get("stream", True) is False:
+            try:
+                result = [data for event, data in events if event == "done"][0]
+            except ChatNotFoundError as e:
+                self._send_error(404, e.args[0])
+            except ollama.ResponseError as e:
+                self._send_error(502, f"Model error: {e.error}")
+            except Exception as e:
+                self._send_error(500, f"{type(e).__name__}: {e}")
+            else:
+                self._send_json(result)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        try:
+            for event, data in events:
+                self._send_event(event, data)
+        except ChatNotFoundError as e:
+            self._send_event("error", {"message": e.args[0]})
+        except ollama.ResponseError as e:
+            self._send_event("error", {"message": f"Model error: {e.error}"})
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away; closing the generator stops the Ollama stream
+            events.close()
+        except Exception as e:
+            # Headers are already sent, so the error can only go out as an event
+            self._send_event("error", {"message": f"{type(e).__name__}: {e}"})
+
+    def _send_event(self, event: str, data: dict[str, Any]) -> None:
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the chat pipeline over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--session-ttl",
+        type=float,
+        default=SESSION_IDLE_TTL,
+        help="Seconds an idle session is kept",
+    )
+    args = parser.parse_args()
+
+    model_config, search_config, user_data, _, memory_config = get_config()
+
+    ai = AIEngine(
+        model_config.main_model,
+        model_config.search_model,
+        keep_alive=model_config.keep_alive,
+        main_thinking=model_config.main_thinking,
+        search_thinking=model_config.search_thinking,
+        max_parallel_requests=model_config.max_parallel_requests,
+    )
+    for notice in ai.notices:
+        print(notice)
+
+    search = SearchEngine(
+        search_config.search_engine,
+        user_agent=search_config.search_headers,
+        use_tor=search_config.use_tor,
+        tor_port=search_config.tor_port,
+        max_queries=search_config.max_search_queries,
+    )
+
+    memory = Memory()
+    RequestHandler.service = ChatService(
+        ai, search, memory, model_config, user_data, session_ttl=args.session_ttl
+    )
+    maintenance = MaintenanceWorker(
+        memory, memory_config, active_chat_ids=RequestHandler.service.active_chat_ids
+    ).start()
+
+    server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+    server.daemon_threads = True
+    print(f"Serving on http://{args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        maintenance.stop()
+        ai.remove_from_memory()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Span tracing for finding where a turn's time goes. Spans are recorded as
+Chrome trace events and dumped as JSON that Perfetto (https://ui.perfetto.dev)
+or chrome://tracing can open. While tracing is off, span() returns a shared
+no-op context manager, so instrumented code pays for one global lookup.
+
+Example:
+    tracing.start(track_memory=True)
+    with tracing.span("search", "search", query=query):
+        ...
+    tracing.dump("trace.json")
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+
+# Events kept at most; later spans are counted as dropped
+MAX_EVENTS = 200_000
+
+_enabled: bool = False
+_track_memory: bool = False
+_events: list[dict[str, Any]] = []
+_dropped: int = 0
+_thread_names: dict[int, str] = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class _NullSpan:
+    """Returned by span() while tracing is off"""
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def annotate(self, **args: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """A timed region, recorded as one complete event when it exits"""
+
+    def __init__(self, name: str, category: str, args: dict[str, Any]) -> None:
+        self.name = name
+        self.category = category
+        self.args = args
+        self._start = 0
+        self._memory_start: int | None = None
+        self._memory_peak = 0
+
+    def annotate(self, **args: Any) -> None:
+        """Adds arguments shown with the span in the trace viewer"""
+        self.args.update(args)
+
+    def __enter__(self) -> "Span":
+        if _track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            _propagate_peak(peak)
+            tracemalloc.reset_peak()
+            self._memory_start = self._memory_peak = current
+            _memory_stack().append(self)
+
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        end = time.perf_counter_ns()
+
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+
+        stack = _memory_stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+
+        if self._memory_start is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, self._memory_peak)
+            _propagate_peak(peak)
+            # Approximate while other threads allocate: tracemalloc's peak is global
+            self.args["peak_kb"] = round((peak - self._memory_start) / 1024, 1)
+            self.args["net_kb"] = round((current - self._memory_start) / 1024, 1)
+
+        _record(
+            {
+                "name": self.name,
+                "cat": self.category,
+                "ph": "X",
+                "ts": self._start / 1000,
+                "dur": (end - self._start) / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": self.args,
+            }
+        )
+
+
+def _memory_stack() -> list[Span]:
+    """Open spans of the calling thread that track memory, innermost last"""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _propagate_peak(peak: int) -> None:
+    """Credits a peak seen before a reset_peak to the enclosing span"""
+    stack = _memory_stack()
+    if stack:
+        stack[-1]._memory_peak = max(stack[-1]._memory_peak, peak)
+
+
+def _record(event: dict[str, Any]) -> None:
+    global _dropped
+
+    with _lock:
+        if len(_events) >= MAX_EVENTS:
+            _dropped += 1
+            return
+
+        _events.append(event)
+        thread = threading.current_thread()
+        _thread_names.setdefault(thread.ident, thread.name)
+
+
+def span(name: str, category: str = "app", **args: Any) -> Span | _NullSpan:
+    """
+    Times a block of code while tracing is on
+
+    Args:
+        name: Span name shown in the trace
+        category: Subsystem, e.g. engine, search, memory or view
+        **args: Values shown with the span. Keep them small
+
+    Returns:
+        Context manager; its annotate() adds arguments before the span ends
+    """
+    if not _enabled:
+        return _NULL_SPAN
+
+    return Span(name, category, args)
+
+
+def traced(name: str | None = None, category: str = "app") -> Callable:
+    """
+    Decorator that wraps every call of a function in a span
+
+    Args:
+        name: Span name. Defaults to the function's qualified name
+        category: Subsystem, see span
+    """
+
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+
+            with Span(span_name, category, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def add_span(
+    name: str,
+    category: str,
+    start_ns: int,
+    duration_ns: int,
+    **args: Any,
+) -> None:
+    """
+    Records a span measured elsewhere, e.g. Ollama's prompt evaluation
+
+    Args:
+        name: Span name
+        category: Subsystem, see span
+        start_ns: Start on the time.perf_counter_ns clock
+        duration_ns: Length in nanoseconds
+        **args: Values shown with the span
+    """
+    if not _enabled:
+        return
+
+    _record(
+        {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start_ns / 1000,
+            "dur": duration_ns / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+    )
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def start(track_memory: bool = False) -> None:
+    """
+    Starts recording spans, discarding earlier ones
+
+    Args:
+        track_memory: Annotate spans with peak and net Python memory from
+            tracemalloc. Slows allocation-heavy code noticeably
+    """
+    global _enabled, _track_memory, _dropped
+
+    with _lock:
+        _events.clear()
+        _thread_names.clear()
+        _dropped = 0
+
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _track_memory = track_memory
+    _enabled = True
+
+
+def stop() -> None:
+    """Stops recording. Recorded spans are kept for dump"""
+    global _enabled, _track_memory
+
+    _enabled = False
+    if _track_memory:
+        _track_memory = False
+        tracemalloc.stop()
+
+
+def dump(path: str | Path) -> int:
+    """
+    Writes the recorded spans as Chrome trace JSON
+
+    Args:
+        path: Destination file
+
+    Returns:
+        Number of spans written
+    """
+    with _lock:
+        events = list(_events)
+        thread_names = dict(_thread_names)
+        dropped = _dropped
+
+    metadata = [
+        {
+            "name": "thread_name",
+            "ph": "M",
+            "pid": os.getpid(),
+            "tid": tid,
+            "args": {"name": thread_name},
+        }
+        for tid, thread_name in thread_names.items()
+    ]
+
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "traceEvents": metadata + events,
+                "displayTimeUnit": "ms",
+                "otherData": {"dropped_spans": dropped},
+            },
+            file,
+        )
+
+    return len(events)
@@ -1,4 +1,8 @@
+from collections import OrderedDict
+import sys
 from sys import thread_info
+import threading
+from time import perf_counter
 from typing import Iterator, Iterable, NamedTuple
 from ollama import ResponseError
 from rich import box
@@ -6,7 +10,10 @@ from rich.console import Console
 from rich.live import Live
 from rich.markdown import Markdown
 from rich.panel import Panel
+from rich.segment import Segment, SegmentLines
+from rich.status import Status
 from rich.table import Table
+from rich.text import Text
 from rich.console import Group
 from prompt_toolkit import prompt
 from prompt_toolkit.history import InMemoryHistory
@@ -14,15 +21,87 @@ from prompt_toolkit.formatted_text import HTML
 from prompt_toolkit.key_binding import KeyBindings
 from prompt_toolkit.styles import Style
 
-from models import ChatItem, ModelResponse
+from markdown_stream import StreamingMarkdown
+from models import ChatItem, ModelResponse, RenderStats
+import tracing
+
+# Rendered past messages kept for repeated /load and /more
+RENDER_CACHE_SIZE = 512
+
+# Share of wall time a slow terminal may spend drawing before frames are spaced out
+RENDER_BUDGET = 0.5
+
+
+class StreamBuffer:
+    """
+    Drains a response stream on a background thread at full speed, so a slow
+    terminal never holds up reading from Ollama. The renderer takes whatever
+    has arrived since its last frame
+    """
+
+    def __init__(self, stream: Iterable) -> None:
+        """
+        Args:
+            stream: Response stream to drain
+        """
+        self.error: BaseException | None = None
+        self._pending: list = []
+        self._done: bool = False
+        self._condition = threading.Condition()
+
+        self._thread = threading.Thread(
+            target=self._consume, args=(stream,), daemon=True, name="response-stream"
+        )
+        self._thread.start()
+
+    def _consume(self, stream: Iterable) -> None:
+        """Collects chunks as they arrive until the stream ends"""
+        try:
+            for chunk in stream:
+                with self._condition:
+                    self._pending.append(chunk)
+                    self._condition.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            with self._condition:
+                self._done = True
+                self._condition.notify_all()
+
+    def take(self) -> tuple[list, bool]:
+        """
+        Waits for at least one chunk or the end of the stream
+
+        Returns:
+            Chunks received since the last call, and whether the stream has ended
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending or self._done)
+            chunks, self._pending = self._pending, []
+
+            return chunks, self._done
+
+    def wait_done(self, timeout: float) -> None:
+        """Sleeps for timeout seconds, waking early if the stream ends"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._done, timeout)
 
 
 class View:
     """Controls input and output as well as format for each to the console"""
 
-    def __init__(self) -> None:
+    def __init__(self, frame_rate: int = 12) -> None:
+        """
+        Args:
+            frame_rate: Redraws per second of a streaming response at most.
+                Values below 1 are raised to 1
+        """
         self.CONSOLE = Console(highlight=False)
         self.history = InMemoryHistory()
+        self.frame_rate = max(1, frame_rate)
+        # Rendered panels of stored messages, least recently shown first
+        self._render_cache: OrderedDict[tuple, list[list[Segment]]] = OrderedDict()
+        self.last_render_stats: RenderStats | None = None
 
     def print(self, message: str | list[str], line_break: bool = False) -> None:
         if line_break:
@@ -115,21 +194,53 @@ class View:
             ),
         )
 
+    def status(self, message: str, style: str) -> Status:
+        """
+        Shows a spinner with a message until the returned context exits
+
+        Example:
+            with view.status("Working...", style) as status:
+                status.update("Still working...")
+        """
+        return self.CONSOLE.status(f"[{style}]{message}[/{style}]")
+
     def print_user_message(self, message: str, style: str):
         self.CONSOLE.print(
             f"\n[bold {style}] > You:[/bold {style}] [{style}]{message}[/{style}]\n"
         )
 
-    def print_assistant_message(self, message: str, name: str, style: str):
-        self.CONSOLE.print(
-            Panel(
-                Markdown(message),
-                title=f"[bold {style}]{name}[/bold {style}]",
-                style=style,
-                title_align="left",
-                border_style=style,
-                expand=True,
-            ),
+    def print_assistant_message(
+        self, message: str, name: str, style: str, message_id: int | None = None
+    ):
+        if message_id is None:
+            self.CONSOLE.print(self._assistant_panel(message, name, style))
+            return
+
+        # Stored messages never change, so their layout is reused until the width
+        # does. Markdown parses on construction, so it is only built on a miss
+        key = (message_id, name, style, self.CONSOLE.width)
+        lines = self._render_cache.get(key)
+        if lines is None:
+            lines = self.CONSOLE.render_lines(
+                self._assistant_panel(message, name, style), self.CONSOLE.options
+            )
+            self._render_cache[key] = lines
+            if len(self._render_cache) > RENDER_CACHE_SIZE:
+                self._render_cache.popitem(last=False)
+        else:
+            self._render_cache.move_to_end(key)
+
+        self.CONSOLE.print(SegmentLines(lines, new_lines=True))
+
+    @staticmethod
+    def _assistant_panel(message: str, name: str, style: str) -> Panel:
+        return Panel(
+            Markdown(message),
+            title=f"[bold {style}]{name}[/bold {style}]",
+            style=style,
+            title_align="left",
+            border_style=style,
+            expand=True,
         )
 
     def get_user_input(self, style: str) -> str:
@@ -144,6 +255,13 @@ class View:
             """Pressing Enter submits the message."""
             event.current_buffer.validate_and_handle()
 
+        @kb.add("pageup")  # Handles Page Up on an empty prompt.
+        def _(event):
+            """Pressing Page Up shows earlier messages of the loaded chat."""
+            if not event.current_buffer.text:
+                event.current_buffer.text = "/more"
+                event.current_buffer.validate_and_handle()
+
         @kb.add(
             "escape", "enter"
         )  # Handles Alt + Enter keys or Esc then Enter keys. Is Escape followed by Enter.
@@ -165,6 +283,7 @@ class View:
 
         return user_input
 
+    @tracing.traced(category="view")
     def live_response(
         self,
         model_name: str,
@@ -173,60 +292,104 @@ class View:
         style: str,
         text_style,
     ):
-        thinking_str: str = ""
-        content_str: str = ""
-
-        with Live(
-            console=self.CONSOLE,
-            refresh_per_second=12,
-        ) as live:
-            for chunk in response_stream:
-                msg = chunk.get("message", {})
-                thinking = msg.get("thinking")
-                content = msg.get("content")
-
-                if thinking:
-                    thinking_str += thinking
-                if content:
-                    content_str += content
-
-                # Create a display group to stack elements
-                display_elements = []
-
-                if thinking_str:
-                    display_elements.append(
-                        Panel(
-                            Markdown(thinking_str),
-                            title=f"{model_name}'s Thoughts...",
-                            style=f"dim {text_style}",
-                            border_style=f"dim {style}",
-                            title_align="left",
-                            expand=True,
-                        )
-                    )
+        # Completed Markdown blocks are laid out once; updates re-render the open one
+        thinking_markdown = StreamingMarkdown()
+        content_markdown = StreamingMarkdown()
+
+        thinking_panel = Panel(
+            thinking_markdown,
+            title=f"{model_name}'s Thoughts...",
+            style=f"dim {text_style}",
+            border_style=f"dim {style}",
+            title_align="left",
+            expand=True,
+        )
+        content_panel = Panel(
+            content_markdown,
+            title=f"[bold {style}]{model_name}[/bold {style}] - {time}",
+            style=text_style,
+            border_style=style,
+            title_align="left",
+            expand=True,
+        )
 
-                if content_str:
-                    display_elements.append(
-                        Panel(
-                            Markdown(content_str),
-                            title=f"[bold {style}]{model_name}[/bold {style}] - {time}",
-                            style=text_style,
-                            border_style=style,
-                            title_align="left",
-                            expand=True,
-                        )
+        def visible_panels() -> Group:
+            """Stacks the panels that have text so far"""
+            return Group(
+                *(
+                    panel
+                    for panel, markdown in (
+                        (thinking_panel, thinking_markdown),
+                        (content_panel, content_markdown),
                     )
+                    if markdown
+                )
+            )
 
-                # Update the Live display with the grouped panels
-                if display_elements:
-                    live.update(Group(*display_elements))
+        frame_interval = 1 / self.frame_rate
+        interval = frame_interval
+        render_times: list[float] = []
+        dropped_frames = 0
+        chunk_count = 0
+        started = perf_counter()
+
+        # Reading runs ahead on its own thread; each frame renders everything that
+        # arrived since the previous one
+        buffer = StreamBuffer(response_stream)
+
+        with Live(console=self.CONSOLE, auto_refresh=False) as live:
+            done = False
+            while not done:
+                chunks, done = buffer.take()
+
+                for chunk in chunks:
+                    msg = chunk.get("message", {})
+                    thinking_markdown.append(msg.get("thinking") or "")
+                    content_markdown.append(msg.get("content") or "")
+                chunk_count += len(chunks)
+
+                render_time = 0.0
+                if chunks:
+                    render_start = perf_counter()
+                    with tracing.span("render frame", "view", chunks=len(chunks)):
+                        live.update(visible_panels(), refresh=True)
+                    render_time = perf_counter() - render_start
+
+                    render_times.append(render_time)
+                    dropped_frames += int(render_time // frame_interval)
+                    # Slow terminals get fewer, larger frames instead of falling behind
+                    interval = max(frame_interval, render_time / RENDER_BUDGET)
+
+                if not done:
+                    buffer.wait_done(interval - render_time)
+
+        self.last_render_stats = RenderStats(
+            chunks=chunk_count,
+            frames=len(render_times),
+            dropped_frames=dropped_frames,
+            mean_render_ms=(
+                sum(render_times) / len(render_times) * 1000 if render_times else 0.0
+            ),
+            max_render_ms=max(render_times, default=0.0) * 1000,
+            frame_interval_ms=interval * 1000,
+            seconds=perf_counter() - started,
+        )
 
-        return ModelResponse(thoughts=thinking_str, content=content_str)
+        if buffer.error:
+            raise buffer.error
 
-    def reconstruct_history(self, chat_items: list[ChatItem], style: str):
-        self.print_system_message(
-            "Reconstructing History...", style=style, line_break=True
+        return ModelResponse(
+            thoughts=thinking_markdown.text, content=content_markdown.text
         )
+
+    @tracing.traced(category="view")
+    def reconstruct_history(
+        self,
+        chat_items: list[ChatItem],
+        style: str,
+        heading: str = "Reconstructing History...",
+    ):
+        self.print_system_message(heading, style=style, line_break=True)
         if chat_items:
             for item in chat_items:
                 if item.role == "user":
@@ -237,4 +400,158 @@ class View:
                         item.message,
                         f"Past AI[{style}] - {time_of_message}[/{style}]",
                         style=style,
+                        message_id=item.message_id,
                     )
+
+
+class _PlainStatus:
+    """Stands in for rich's Status in plain mode: no spinner, updates are dropped"""
+
+    def __enter__(self) -> "_PlainStatus":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def update(self, *args, **kwargs) -> None:
+        pass
+
+
+class PlainView(View):
+    """
+    Writes unformatted text for pipes, logs and slow terminals. Rich markup is
+    stripped, tables become tab-separated rows and responses are written token
+    by token as they arrive, with no Live, Panel or Markdown layout. Thinking
+    goes to stderr so stdout carries only the conversation
+    """
+
+    def print(self, message: str | list[str], line_break: bool = False) -> None:
+        if line_break:
+            print(flush=True)
+
+        if isinstance(message, list):
+            message = "\n".join(message)
+
+        print(_strip_markup(message), flush=True)
+
+    def print_system_message(self, message: str, style: str, line_break: bool = False):
+        self.print(f"[*] {message}", line_break)
+
+    def print_ordered_list(
+        self,
+        message_list: list[str],
+        style: str,
+        line_break: bool = False,
+    ):
+        for i, message in enumerate(message_list):
+            self.print(f"\\[{i + 1}] {message}", line_break)
+
+    def print_unordered_list(
+        self,
+        message_list: list[str],
+        style: str,
+        line_break: bool = False,
+    ):
+        for message in message_list:
+            self.print(f" > {message}", line_break)
+
+    def print_table(
+        self,
+        title: str,
+        columns: list,
+        rows: Iterable[Iterable[str]],
+        style: str,
+        line_break=False,
+        col_alignment: list[str] | None = None,
+        expand: bool = False,
+    ) -> None:
+        self.print(title, line_break)
+        for data in (columns, *rows):
+            # Cells carry the same markup the Rich table would render
+            print(
+                "\t".join(
+                    _strip_markup(item) if isinstance(item, str) else str(item)
+                    for item in data
+                ),
+                flush=True,
+            )
+
+    def print_panel(self, message: str, style: str) -> None:
+        self.print(message)
+
+    def status(self, message: str, style: str) -> _PlainStatus:
+        self.print(message)
+        return _PlainStatus()
+
+    def print_user_message(self, message: str, style: str):
+        print(f"\n > You: {message}\n", flush=True)
+
+    def print_assistant_message(
+        self, message: str, name: str, style: str, message_id: int | None = None
+    ):
+        self.print(f"{name}:")
+        print(message, flush=True)
+
+    def get_user_input(self, style: str) -> str:
+        """Reads one line from stdin; end of input exits the session"""
+        try:
+            return input(" > You: " if sys.stdin.isatty() else "").strip()
+        except EOFError:
+            return "/exit"
+
+    @tracing.traced(category="view")
+    def live_response(
+        self,
+        model_name: str,
+        time: str,
+        response_stream: Iterator,
+        style: str,
+        text_style,
+    ):
+        thinking_chunks: list[str] = []
+        content_chunks: list[str] = []
+
+        print(f"{model_name} - {time}:", flush=True)
+
+        for chunk in response_stream:
+            msg = chunk.get("message", {})
+
+            if thinking := msg.get("thinking"):
+                thinking_chunks.append(thinking)
+                sys.stderr.write(thinking)
+                sys.stderr.flush()
+
+            if content := msg.get("content"):
+                if thinking_chunks and not content_chunks:
+                    sys.stderr.write("\n")
+                content_chunks.append(content)
+                sys.stdout.write(content)
+                sys.stdout.flush()
+
+        print(flush=True)
+
+        return ModelResponse(
+            thoughts="".join(thinking_chunks), content="".join(content_chunks)
+        )
+
+
+def _strip_markup(message: str) -> str:
+    """Plain text of a string with Rich markup"""
+    return Text.from_markup(message).plain
+
+
+def create_view(plain: bool = False, frame_rate: int = 12) -> View:
+    """
+    Picks the output mode
+
+    Args:
+        plain: Force plain output. It is also used whenever stdout is not a terminal
+        frame_rate: Redraws per second of a streaming response in the Rich view
+
+    Returns:
+        PlainView or View
+    """
+    if plain or not sys.stdout.isatty():
+        return PlainView(frame_rate=frame_rate)
+
+    return View(frame_rate=frame_rate)